@@ -12,7 +12,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from app.config import settings
 from app.models.database import Base
-from app.models.dieta import User, Dieta, Receta, RefreshToken
+from app.models.dieta import User, Dieta, DietaDia, DietaComida, Receta, RefreshToken, Alimento, GeneracionCache, Trabajo
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
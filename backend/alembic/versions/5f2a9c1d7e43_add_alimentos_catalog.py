@@ -0,0 +1,87 @@
+"""add_alimentos_catalog
+
+Revision ID: 5f2a9c1d7e43
+Revises: cdd4350a9503
+Create Date: 2026-10-17 10:12:41.218734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f2a9c1d7e43'
+down_revision: Union[str, Sequence[str], None] = 'cdd4350a9503'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema - Create the local FatSecret food catalog with a name search index."""
+    op.create_table('alimentos',
+    sa.Column('id', sa.String(length=50), nullable=False),
+    sa.Column('nombre', sa.String(length=255), nullable=False),
+    sa.Column('nombre_normalizado', sa.String(length=255), nullable=False),
+    sa.Column('descripcion', sa.Text(), nullable=True),
+    sa.Column('tipo', sa.String(length=50), nullable=True),
+    sa.Column('url', sa.String(length=500), nullable=True),
+    sa.Column('calorias', sa.Float(), nullable=True),
+    sa.Column('proteina', sa.Float(), nullable=True),
+    sa.Column('carbohidratos', sa.Float(), nullable=True),
+    sa.Column('grasas', sa.Float(), nullable=True),
+    sa.Column('servings', sa.JSON(), nullable=True),
+    sa.Column('actualizado_en', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_alimentos_nombre_normalizado'), 'alimentos', ['nombre_normalizado'], unique=False)
+    
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        # FTS5 index kept in sync with triggers (external content table)
+        op.execute(
+            "CREATE VIRTUAL TABLE alimentos_fts USING fts5("
+            "nombre_normalizado, content='alimentos', content_rowid='rowid', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        op.execute(
+            "CREATE TRIGGER alimentos_fts_ai AFTER INSERT ON alimentos BEGIN "
+            "INSERT INTO alimentos_fts(rowid, nombre_normalizado) VALUES (new.rowid, new.nombre_normalizado); "
+            "END"
+        )
+        op.execute(
+            "CREATE TRIGGER alimentos_fts_ad AFTER DELETE ON alimentos BEGIN "
+            "INSERT INTO alimentos_fts(alimentos_fts, rowid, nombre_normalizado) "
+            "VALUES ('delete', old.rowid, old.nombre_normalizado); "
+            "END"
+        )
+        op.execute(
+            "CREATE TRIGGER alimentos_fts_au AFTER UPDATE ON alimentos BEGIN "
+            "INSERT INTO alimentos_fts(alimentos_fts, rowid, nombre_normalizado) "
+            "VALUES ('delete', old.rowid, old.nombre_normalizado); "
+            "INSERT INTO alimentos_fts(rowid, nombre_normalizado) VALUES (new.rowid, new.nombre_normalizado); "
+            "END"
+        )
+    elif bind.dialect.name == 'postgresql':
+        # Trigram index for fuzzy/substring name search
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(
+            "CREATE INDEX ix_alimentos_nombre_trgm ON alimentos "
+            "USING gin (nombre_normalizado gin_trgm_ops)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema - Drop the food catalog and its search index."""
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS alimentos_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS alimentos_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS alimentos_fts_ai")
+        op.execute("DROP TABLE IF EXISTS alimentos_fts")
+    elif bind.dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_alimentos_nombre_trgm")
+    
+    op.drop_index(op.f('ix_alimentos_nombre_normalizado'), table_name='alimentos')
+    op.drop_table('alimentos')
@@ -0,0 +1,43 @@
+"""add_generaciones_cache
+
+Revision ID: 8b3e6d2f1a90
+Revises: 5f2a9c1d7e43
+Create Date: 2026-10-17 22:05:13.402187
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b3e6d2f1a90'
+down_revision: Union[str, Sequence[str], None] = '5f2a9c1d7e43'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema - Create the persistent cache of OpenAI generations."""
+    op.create_table('generaciones_cache',
+    sa.Column('clave', sa.String(length=64), nullable=False),
+    sa.Column('tipo', sa.String(length=20), nullable=False),
+    sa.Column('modelo', sa.String(length=50), nullable=False),
+    sa.Column('version_prompt', sa.String(length=20), nullable=False),
+    sa.Column('respuesta', sa.JSON(), nullable=False),
+    sa.Column('hits', sa.Integer(), nullable=False),
+    sa.Column('creado_en', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.Column('expira_en', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('ultimo_acceso', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('clave')
+    )
+    op.create_index(op.f('ix_generaciones_cache_expira_en'), 'generaciones_cache', ['expira_en'], unique=False)
+    op.create_index(op.f('ix_generaciones_cache_ultimo_acceso'), 'generaciones_cache', ['ultimo_acceso'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema - Drop the OpenAI generation cache."""
+    op.drop_index(op.f('ix_generaciones_cache_ultimo_acceso'), table_name='generaciones_cache')
+    op.drop_index(op.f('ix_generaciones_cache_expira_en'), table_name='generaciones_cache')
+    op.drop_table('generaciones_cache')
@@ -0,0 +1,31 @@
+"""add_receta_clave_externa
+
+Revision ID: a9d4e7c2b8f1
+Revises: f5b2c8d4e1a7
+Create Date: 2026-10-18 12:06:53.917240
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9d4e7c2b8f1'
+down_revision: Union[str, Sequence[str], None] = 'f5b2c8d4e1a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema - Add the client key used by bulk recipe imports (unique per user)."""
+    op.add_column('recetas', sa.Column('clave_externa', sa.String(length=100), nullable=True))
+    # NULL keys do not conflict, so recipes created without a key are unaffected
+    op.create_index('ux_recetas_user_id_clave_externa', 'recetas', ['user_id', 'clave_externa'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema - Remove the bulk import client key."""
+    op.drop_index('ux_recetas_user_id_clave_externa', table_name='recetas')
+    op.drop_column('recetas', 'clave_externa')
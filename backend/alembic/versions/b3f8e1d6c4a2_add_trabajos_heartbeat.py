@@ -0,0 +1,30 @@
+"""add_trabajos_heartbeat
+
+Revision ID: b3f8e1d6c4a2
+Revises: a9d4e7c2b8f1
+Create Date: 2026-10-18 15:42:10.381925
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3f8e1d6c4a2'
+down_revision: Union[str, Sequence[str], None] = 'a9d4e7c2b8f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema - Add the claim token and worker heartbeat of running jobs."""
+    op.add_column('trabajos', sa.Column('reclamado_por', sa.String(length=32), nullable=True))
+    op.add_column('trabajos', sa.Column('latido_en', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema - Remove the job claim token and heartbeat."""
+    op.drop_column('trabajos', 'latido_en')
+    op.drop_column('trabajos', 'reclamado_por')
@@ -0,0 +1,49 @@
+"""add_trabajos_queue
+
+Revision ID: c41d7a9e2b65
+Revises: 8b3e6d2f1a90
+Create Date: 2026-10-17 23:18:42.715301
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41d7a9e2b65'
+down_revision: Union[str, Sequence[str], None] = '8b3e6d2f1a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema - Create the asynchronous generation job table."""
+    op.create_table('trabajos',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('tipo', sa.String(length=20), nullable=False),
+    sa.Column('estado', sa.String(length=20), nullable=False),
+    sa.Column('parametros', sa.JSON(), nullable=False),
+    sa.Column('resultado', sa.JSON(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('intentos', sa.Integer(), nullable=False),
+    sa.Column('creado_en', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('iniciado_en', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('terminado_en', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('expira_en', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_trabajos_user_id'), 'trabajos', ['user_id'], unique=False)
+    op.create_index(op.f('ix_trabajos_expira_en'), 'trabajos', ['expira_en'], unique=False)
+    op.create_index('ix_trabajos_estado_creado_en', 'trabajos', ['estado', 'creado_en'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema - Drop the job table."""
+    op.drop_index('ix_trabajos_estado_creado_en', table_name='trabajos')
+    op.drop_index(op.f('ix_trabajos_expira_en'), table_name='trabajos')
+    op.drop_index(op.f('ix_trabajos_user_id'), table_name='trabajos')
+    op.drop_table('trabajos')
@@ -0,0 +1,32 @@
+"""add_plan_comprimido_and_receta_metadata
+
+Revision ID: d7f1b4e9a2c3
+Revises: c41d7a9e2b65
+Create Date: 2026-10-18 00:41:09.530218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7f1b4e9a2c3'
+down_revision: Union[str, Sequence[str], None] = 'c41d7a9e2b65'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema - Keep the generated diet plan and recipe metadata."""
+    op.add_column('dietas', sa.Column('plan_comprimido', sa.LargeBinary(), nullable=True))
+    op.add_column('recetas', sa.Column('tiempo_preparacion', sa.String(length=100), nullable=True))
+    op.add_column('recetas', sa.Column('porciones', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema - Drop the stored plan and recipe metadata."""
+    op.drop_column('recetas', 'porciones')
+    op.drop_column('recetas', 'tiempo_preparacion')
+    op.drop_column('dietas', 'plan_comprimido')
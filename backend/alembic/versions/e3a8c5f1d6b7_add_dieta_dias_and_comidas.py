@@ -0,0 +1,61 @@
+"""add_dieta_dias_and_comidas
+
+Revision ID: e3a8c5f1d6b7
+Revises: d7f1b4e9a2c3
+Create Date: 2026-10-17 23:52:06.184529
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3a8c5f1d6b7'
+down_revision: Union[str, Sequence[str], None] = 'd7f1b4e9a2c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema - Create the normalized day and meal tables of generated plans."""
+    op.create_table('dieta_dias',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('dieta_id', sa.Integer(), nullable=False),
+    sa.Column('dia', sa.Integer(), nullable=False),
+    sa.Column('calorias', sa.Integer(), nullable=True),
+    sa.Column('proteina', sa.Float(), nullable=True),
+    sa.Column('carbohidratos', sa.Float(), nullable=True),
+    sa.Column('grasas', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['dieta_id'], ['dietas.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('dieta_id', 'dia', name='uq_dieta_dias_dieta_id_dia')
+    )
+    op.create_table('dieta_comidas',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('dieta_id', sa.Integer(), nullable=False),
+    sa.Column('dia', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('tipo', sa.String(length=20), nullable=False),
+    sa.Column('orden', sa.Integer(), nullable=False),
+    sa.Column('nombre', sa.String(length=255), nullable=True),
+    sa.Column('calorias', sa.Integer(), nullable=True),
+    sa.Column('proteina', sa.Float(), nullable=True),
+    sa.Column('carbohidratos', sa.Float(), nullable=True),
+    sa.Column('grasas', sa.Float(), nullable=True),
+    sa.Column('ingredientes', sa.JSON(), nullable=True),
+    sa.ForeignKeyConstraint(['dieta_id', 'dia'], ['dieta_dias.dieta_id', 'dieta_dias.dia'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_dieta_comidas_dieta_id_dia', 'dieta_comidas', ['dieta_id', 'dia'], unique=False)
+    op.create_index('ix_dieta_comidas_user_id_tipo_calorias', 'dieta_comidas', ['user_id', 'tipo', 'calorias'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema - Drop the day and meal tables."""
+    op.drop_index('ix_dieta_comidas_user_id_tipo_calorias', table_name='dieta_comidas')
+    op.drop_index('ix_dieta_comidas_dieta_id_dia', table_name='dieta_comidas')
+    op.drop_table('dieta_comidas')
+    op.drop_table('dieta_dias')
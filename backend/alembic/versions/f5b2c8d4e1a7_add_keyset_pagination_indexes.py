@@ -0,0 +1,37 @@
+"""add_keyset_pagination_indexes
+
+Revision ID: f5b2c8d4e1a7
+Revises: e3a8c5f1d6b7
+Create Date: 2026-10-18 10:41:27.502318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f5b2c8d4e1a7'
+down_revision: Union[str, Sequence[str], None] = 'e3a8c5f1d6b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema - Add (user_id, creado_en, id) indexes for cursor pagination of diets and recipes."""
+    op.create_index('ix_dietas_user_id_creado_en_id', 'dietas', ['user_id', 'creado_en', 'id'], unique=False)
+    op.create_index('ix_recetas_user_id_creado_en_id', 'recetas', ['user_id', 'creado_en', 'id'], unique=False)
+    
+    # The composite indexes start with user_id, so the single-column ones are redundant
+    op.drop_index(op.f('ix_dietas_user_id'), table_name='dietas')
+    op.drop_index(op.f('ix_recetas_user_id'), table_name='recetas')
+
+
+def downgrade() -> None:
+    """Downgrade schema - Restore the user_id indexes and remove the pagination indexes."""
+    op.create_index(op.f('ix_recetas_user_id'), 'recetas', ['user_id'], unique=False)
+    op.create_index(op.f('ix_dietas_user_id'), 'dietas', ['user_id'], unique=False)
+    
+    op.drop_index('ix_recetas_user_id_creado_en_id', table_name='recetas')
+    op.drop_index('ix_dietas_user_id_creado_en_id', table_name='dietas')
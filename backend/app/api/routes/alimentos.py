@@ -3,10 +3,17 @@ Rutas para gestión de alimentos y búsqueda con FatSecret API
 """
 
 import logging
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Depends
 from typing import List, Dict, Any
 from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import get_db
+from app.config import settings
 from app.services.fat_secret_service import FatSecretService
+from app.services.alimento_service import AlimentoService
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.rate_limiter import QuotaExceededError
+from app.services.dependencies import get_fatsecret_service, get_alimento_service
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -25,12 +32,41 @@ class AlimentoResponse(BaseModel):
     grasas: float | None = Field(None, description="Grasas en gramos por porción")
 
 
+class AlimentoDetalleResponse(AlimentoResponse):
+    """Modelo de respuesta para alimento con porciones"""
+    servings: List[Dict[str, Any]] = Field(default_factory=list, description="Porciones disponibles")
+
+
+class SugerenciaResponse(BaseModel):
+    """Modelo de respuesta para sugerencia de autocompletado"""
+    nombre: str
+    id: str | None = Field(None, description="ID de FatSecret si el alimento está en el catálogo local")
+
+
+class DetallesRequest(BaseModel):
+    """Modelo para solicitud de detalles de varios alimentos"""
+    ids: List[str] = Field(..., min_length=1, description="IDs de alimentos de FatSecret")
+
+
+class DetallesResponse(BaseModel):
+    """Modelo de respuesta para detalles de varios alimentos"""
+    alimentos: List[AlimentoDetalleResponse]
+    errores: Dict[str, str] = Field(default_factory=dict, description="Errores por ID de alimento")
+
+
 @router.get("/buscar", response_model=List[AlimentoResponse])
 async def buscar_alimentos(
-    nombre: str = Query(..., description="Nombre del alimento a buscar", min_length=1)
+    nombre: str = Query(..., description="Nombre del alimento a buscar", min_length=1),
+    db: AsyncSession = Depends(get_db),
+    fat_secret_service: FatSecretService = Depends(get_fatsecret_service),
+    alimento_service: AlimentoService = Depends(get_alimento_service)
 ):
     """
-    Buscar alimentos utilizando la API de FatSecret
+    Buscar alimentos en el catálogo local, con FatSecret como respaldo
+    
+    Las búsquedas se responden desde la tabla `alimentos` cuando hay suficientes
+    coincidencias recientes; en caso contrario se consulta FatSecret y los
+    resultados se guardan en el catálogo.
     
     Args:
         nombre: Nombre del alimento a buscar (ej: "pollo", "arroz", "manzana")
@@ -41,13 +77,9 @@ async def buscar_alimentos(
     Raises:
         HTTPException: Si hay error en la comunicación con FatSecret API
     """
-    fat_secret_service = None
     try:
-        # Crear instancia del servicio FatSecret
-        fat_secret_service = FatSecretService()
-        
-        # Buscar alimentos
-        alimentos = await fat_secret_service.search_foods(nombre)
+        # Buscar alimentos (catálogo local primero, luego FatSecret)
+        alimentos = await alimento_service.buscar_alimentos(db, fat_secret_service, nombre)
         
         # Si no se encuentran resultados
         if not alimentos:
@@ -55,6 +87,10 @@ async def buscar_alimentos(
         
         return alimentos
     
+    except (CircuitOpenError, QuotaExceededError) as e:
+        # FatSecret está caído (o sin cuota) y no hay resultados locales: fallar rápido
+        logger.warning(f"Búsqueda rechazada por el circuit breaker: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         # Log the error for debugging
         logger.error(f"Error buscando alimentos: {str(e)}", exc_info=True)
@@ -62,7 +98,113 @@ async def buscar_alimentos(
             status_code=500,
             detail=f"Error al buscar alimentos en FatSecret API: {str(e)}"
         )
-    finally:
-        # Clean up the HTTP client
-        if fat_secret_service:
-            await fat_secret_service.close()
+
+
+@router.get("/autocompletar", response_model=List[SugerenciaResponse])
+async def autocompletar_alimentos(
+    q: str = Query(..., description="Texto parcial escrito por el usuario", min_length=1),
+    limite: int = Query(10, ge=1, le=25, description="Número máximo de sugerencias"),
+    fat_secret_service: FatSecretService = Depends(get_fatsecret_service),
+    alimento_service: AlimentoService = Depends(get_alimento_service)
+):
+    """
+    Autocompletar nombres de alimentos
+    
+    Responde desde un índice de prefijos en memoria construido con el catálogo local,
+    ordenado por popularidad. Solo consulta `foods.autocomplete` de FatSecret cuando
+    hay pocas coincidencias locales.
+    
+    Args:
+        q: Texto parcial (ej: "pol")
+        limite: Número máximo de sugerencias
+    
+    Returns:
+        Lista de sugerencias con nombre (e ID si el alimento está en el catálogo)
+    """
+    return await alimento_service.autocompletar(
+        fat_secret_service,
+        q,
+        limite,
+        min_locales=settings.FATSECRET_AUTOCOMPLETE_MIN_LOCAL
+    )
+
+
+@router.get("/detalles", response_model=DetallesResponse)
+async def detalles_alimentos(
+    ids: str = Query(..., description="IDs de alimentos separados por comas (ej: 33691,35718)", min_length=1),
+    db: AsyncSession = Depends(get_db),
+    fat_secret_service: FatSecretService = Depends(get_fatsecret_service),
+    alimento_service: AlimentoService = Depends(get_alimento_service)
+):
+    """
+    Obtener los detalles nutricionales de varios alimentos en una sola petición
+    
+    Args:
+        ids: IDs de FatSecret separados por comas
+    
+    Returns:
+        Alimentos encontrados (con porciones) y errores por ID
+    """
+    return await _obtener_detalles(ids.split(","), db, fat_secret_service, alimento_service)
+
+
+@router.post("/detalles", response_model=DetallesResponse)
+async def detalles_alimentos_post(
+    request: DetallesRequest,
+    db: AsyncSession = Depends(get_db),
+    fat_secret_service: FatSecretService = Depends(get_fatsecret_service),
+    alimento_service: AlimentoService = Depends(get_alimento_service)
+):
+    """
+    Variante POST de /detalles para listas largas de IDs
+    """
+    return await _obtener_detalles(request.ids, db, fat_secret_service, alimento_service)
+
+
+async def _obtener_detalles(
+    ids: List[str],
+    db: AsyncSession,
+    fat_secret_service: FatSecretService,
+    alimento_service: AlimentoService
+) -> DetallesResponse:
+    """Validar la lista de IDs y obtener los detalles en paralelo"""
+    ids = [food_id.strip() for food_id in ids if food_id.strip()]
+    if not ids:
+        raise HTTPException(status_code=400, detail="Debe indicar al menos un ID de alimento")
+    if len(set(ids)) > settings.FATSECRET_DETAILS_MAX_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo {settings.FATSECRET_DETAILS_MAX_IDS} alimentos por petición"
+        )
+    
+    try:
+        alimentos, errores = await alimento_service.obtener_detalles(
+            db,
+            fat_secret_service,
+            ids,
+            max_concurrency=settings.FATSECRET_DETAILS_CONCURRENCY
+        )
+    except Exception as e:
+        logger.error(f"Error obteniendo detalles de alimentos: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error al obtener detalles de alimentos en FatSecret API: {str(e)}"
+        )
+    return DetallesResponse(alimentos=alimentos, errores=errores)
+
+
+@router.get("/estadisticas")
+async def estadisticas_fatsecret(
+    fat_secret_service: FatSecretService = Depends(get_fatsecret_service),
+    alimento_service: AlimentoService = Depends(get_alimento_service)
+) -> Dict[str, Any]:
+    """
+    Estadísticas de uso del cliente FatSecret compartido
+    
+    Returns:
+        Contadores de peticiones, conexiones reutilizadas, reutilización del token OAuth
+        y aciertos del catálogo local
+    """
+    stats = fat_secret_service.get_stats()
+    stats["catalogo"] = alimento_service.get_stats()
+    return stats
@@ -2,9 +2,11 @@
 Authentication routes - Register, Login, Refresh, Logout
 """
 
+import asyncio
 from datetime import datetime, timezone
 from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError
 import logging
 
@@ -33,22 +35,24 @@ logger = logging.getLogger(__name__)
 
 
 @router.post("/register", response_model=TokenResponse, status_code=status.HTTP_201_CREATED)
-async def register(user_data: UserRegister, db: Session = Depends(get_db)):
+async def register(user_data: UserRegister, db: AsyncSession = Depends(get_db)):
     """
     Register a new user
     
     Creates a new user account with hashed password and returns JWT tokens
     """
     # Check if email already exists
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    existing_user = (await db.execute(
+        select(User).where(User.email == user_data.email)
+    )).scalars().first()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
     
-    # Create new user with hashed password
-    hashed_pwd = hash_password(user_data.password)
+    # Create new user with hashed password (bcrypt is CPU-bound: keep it off the event loop)
+    hashed_pwd = await asyncio.to_thread(hash_password, user_data.password)
     new_user = User(
         nombre=user_data.nombre,
         email=user_data.email,
@@ -57,8 +61,8 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     logger.info(f"New user registered: {new_user.email} (ID: {new_user.id})")
     
@@ -73,7 +77,7 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
         expires_at=get_refresh_token_expiration()
     )
     db.add(refresh_token_db)
-    db.commit()
+    await db.commit()
     
     return TokenResponse(
         access_token=access_token,
@@ -84,16 +88,18 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=TokenResponse)
-async def login(credentials: UserLogin, db: Session = Depends(get_db)):
+async def login(credentials: UserLogin, db: AsyncSession = Depends(get_db)):
     """
     Login user and return JWT tokens
     
     Validates credentials and returns access and refresh tokens
     """
     # Find user by email
-    user = db.query(User).filter(User.email == credentials.email).first()
+    user = (await db.execute(
+        select(User).where(User.email == credentials.email)
+    )).scalars().first()
     
-    if not user or not verify_password(credentials.password, user.hashed_password):
+    if not user or not await asyncio.to_thread(verify_password, credentials.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -113,7 +119,7 @@ async def login(credentials: UserLogin, db: Session = Depends(get_db)):
         expires_at=get_refresh_token_expiration()
     )
     db.add(refresh_token_db)
-    db.commit()
+    await db.commit()
     
     return TokenResponse(
         access_token=access_token,
@@ -124,7 +130,7 @@ async def login(credentials: UserLogin, db: Session = Depends(get_db)):
 
 
 @router.post("/refresh", response_model=TokenResponse)
-async def refresh(token_request: RefreshTokenRequest, db: Session = Depends(get_db)):
+async def refresh(token_request: RefreshTokenRequest, db: AsyncSession = Depends(get_db)):
     """
     Refresh access token using refresh token
     
@@ -146,10 +152,12 @@ async def refresh(token_request: RefreshTokenRequest, db: Session = Depends(get_
             raise credentials_exception
         
         # Verify token exists in database and is not expired
-        refresh_token_db = db.query(RefreshToken).filter(
-            RefreshToken.token == token_request.refresh_token,
-            RefreshToken.user_id == int(user_id)
-        ).first()
+        refresh_token_db = (await db.execute(
+            select(RefreshToken).where(
+                RefreshToken.token == token_request.refresh_token,
+                RefreshToken.user_id == int(user_id)
+            )
+        )).scalars().first()
         
         if not refresh_token_db:
             raise credentials_exception
@@ -157,12 +165,12 @@ async def refresh(token_request: RefreshTokenRequest, db: Session = Depends(get_
         # Check if token is expired
         if refresh_token_db.expires_at < datetime.now(timezone.utc):
             # Delete expired token
-            db.delete(refresh_token_db)
-            db.commit()
+            await db.delete(refresh_token_db)
+            await db.commit()
             raise credentials_exception
         
         # Get user
-        user = db.query(User).filter(User.id == int(user_id)).first()
+        user = await db.get(User, int(user_id))
         if not user:
             raise credentials_exception
         
@@ -193,7 +201,7 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
 
 
 @router.post("/logout", status_code=status.HTTP_200_OK)
-async def logout(token_request: RefreshTokenRequest, db: Session = Depends(get_db)):
+async def logout(token_request: RefreshTokenRequest, db: AsyncSession = Depends(get_db)):
     """
     Logout user by invalidating refresh token
     
@@ -206,14 +214,16 @@ async def logout(token_request: RefreshTokenRequest, db: Session = Depends(get_d
         
         if user_id:
             # Delete refresh token from database
-            refresh_token_db = db.query(RefreshToken).filter(
-                RefreshToken.token == token_request.refresh_token,
-                RefreshToken.user_id == int(user_id)
-            ).first()
+            refresh_token_db = (await db.execute(
+                select(RefreshToken).where(
+                    RefreshToken.token == token_request.refresh_token,
+                    RefreshToken.user_id == int(user_id)
+                )
+            )).scalars().first()
             
             if refresh_token_db:
-                db.delete(refresh_token_db)
-                db.commit()
+                await db.delete(refresh_token_db)
+                await db.commit()
                 logger.info(f"User logged out: ID {user_id}")
         
         return {"message": "Successfully logged out"}
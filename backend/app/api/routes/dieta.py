@@ -2,16 +2,27 @@
 Rutas para gestión de dietas
 """
 
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from typing import List, Optional, Dict, Any, Tuple, Union
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
-from app.db.session import get_db
-from app.models.dieta import Dieta, User
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only, selectinload, undefer
+from app.db.session import get_db, AsyncSessionLocal
+from app.models.dieta import Dieta, DietaComida, DietaDia, Receta, User
 from app.services.openai_service import OpenAIService
-from app.services.dependencies import get_openai_service
+from app.services.openai_scheduler import SchedulerRejectedError
+from app.services.dependencies import get_openai_service, get_job_queue, get_dieta_service
+from app.services.dieta_service import DietaService
+from app.services.job_queue import JobQueue, QueueFullError
 from app.api.dependencies import get_current_user
+from app.schemas.trabajos import TrabajoResponse
+from app.utils.sse import format_sse, SSE_HEADERS
+from app.utils.compression import compress_json, decompress_json, iter_decompressed
+from app.utils.pagination import NEXT_CURSOR_HEADER, InvalidCursorError, fetch_page
 import logging
+import math
 
 logger = logging.getLogger(__name__)
 
@@ -46,6 +57,47 @@ class DietaResponse(DietaBase):
         from_attributes = True
 
 
+class DietaDetalleResponse(DietaResponse):
+    """Modelo de dieta con el plan generado (si se solicita)"""
+    plan_completo: Optional[Dict[str, Any]] = Field(None, description="Plan generado con IA (con incluir_plan=true)")
+
+
+class DietaComidaResponse(BaseModel):
+    """Comida de un día de un plan generado"""
+    id: int
+    dieta_id: int
+    dia: int
+    tipo: str = Field(..., description="desayuno, almuerzo, cena o snack")
+    orden: int
+    nombre: Optional[str] = None
+    calorias: Optional[int] = None
+    proteina: Optional[float] = None
+    carbohidratos: Optional[float] = None
+    grasas: Optional[float] = None
+    ingredientes: Optional[List[Any]] = None
+    
+    class Config:
+        from_attributes = True
+
+
+class DietaDiaResponse(BaseModel):
+    """Día de un plan generado con sus totales"""
+    dieta_id: int
+    dia: int
+    calorias: Optional[int] = None
+    proteina: Optional[float] = None
+    carbohidratos: Optional[float] = None
+    grasas: Optional[float] = None
+    
+    class Config:
+        from_attributes = True
+
+
+class DietaDiaDetalleResponse(DietaDiaResponse):
+    """Día de un plan generado con sus comidas"""
+    comidas: List[DietaComidaResponse] = []
+
+
 class GenerarDietaRequest(BaseModel):
     """Modelo para solicitud de generación de dieta con IA"""
     objetivo_calorias: int = Field(..., gt=0, description="Objetivo de calorías diarias")
@@ -54,6 +106,17 @@ class GenerarDietaRequest(BaseModel):
     dias: int = Field(7, gt=0, le=30, description="Número de días del plan (1-30)")
 
 
+class OptimizarDietaRequest(BaseModel):
+    """Modelo para construir una dieta a partir de las recetas guardadas (sin IA)"""
+    dias: int = Field(7, gt=0, le=30, description="Número de días del plan (1-30)")
+    objetivo_calorias: Optional[int] = Field(None, gt=0, description="Calorías diarias (por defecto, las del perfil)")
+    proteina: Optional[float] = Field(None, gt=0, description="Gramos de proteína al día (por defecto 25% de las calorías)")
+    carbohidratos: Optional[float] = Field(None, gt=0, description="Gramos de carbohidratos al día (por defecto 50%)")
+    grasas: Optional[float] = Field(None, gt=0, description="Gramos de grasas al día (por defecto 25%)")
+    max_repeticiones: Optional[int] = Field(None, gt=0, description="Veces que puede repetirse una receta en el plan")
+    semilla: Optional[int] = Field(None, description="Semilla para obtener siempre el mismo plan")
+
+
 class GenerarDietaResponse(BaseModel):
     """Modelo de respuesta para dieta generada con IA"""
     id: int
@@ -69,13 +132,27 @@ class GenerarDietaResponse(BaseModel):
 
 @router.get("/", response_model=List[DietaResponse])
 async def listar_dietas(
+    response: Response,
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Listar las dietas del usuario autenticado"""
-    dietas = db.query(Dieta).filter(Dieta.user_id == current_user.id).offset(skip).limit(limit).all()
+    """
+    Listar las dietas del usuario autenticado, de la más reciente a la más antigua
+    
+    Si hay más resultados, la cabecera `X-Next-Cursor` trae el valor de `cursor`
+    para pedir la página siguiente (`skip` se ignora cuando se indica `cursor`).
+    """
+    try:
+        dietas, siguiente = await fetch_page(
+            db, select(Dieta).where(Dieta.user_id == current_user.id), Dieta, cursor, limit, skip
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if siguiente:
+        response.headers[NEXT_CURSOR_HEADER] = siguiente
     return dietas
 
 
@@ -83,7 +160,7 @@ async def listar_dietas(
 async def crear_dieta(
     dieta: DietaCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Crear una nueva dieta para el usuario autenticado"""
     db_dieta = Dieta(
@@ -93,22 +170,166 @@ async def crear_dieta(
         pdf_url=dieta.pdf_url
     )
     db.add(db_dieta)
-    db.commit()
-    db.refresh(db_dieta)
+    await db.commit()
+    await db.refresh(db_dieta)
     return db_dieta
 
 
-@router.get("/{dieta_id}", response_model=DietaResponse)
+@router.get("/estadisticas")
+async def estadisticas_generacion(
+    openai_service: OpenAIService = Depends(get_openai_service)
+) -> Dict[str, Any]:
+    """
+    Estadísticas de las generaciones con IA (dietas y recetas)
+    
+    Returns:
+        Aciertos de la caché de generaciones, peticiones agrupadas y estado del
+        planificador de OpenAI (cola, tiempos de espera, rechazos y respuestas 429)
+    """
+    return openai_service.get_stats()
+
+
+@router.get("/comidas", response_model=List[DietaComidaResponse])
+async def buscar_comidas(
+    tipo: Optional[str] = Query(None, description="desayuno, almuerzo, cena o snack"),
+    calorias_min: Optional[int] = Query(None, ge=0),
+    calorias_max: Optional[int] = Query(None, ge=0),
+    dieta_id: Optional[int] = None,
+    skip: int = 0,
+    limit: int = Query(50, gt=0, le=200),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Buscar comidas en todos los planes generados del usuario autenticado
+    
+    Por ejemplo `?tipo=desayuno&calorias_max=400` devuelve los desayunos de
+    menos de 400 kcal de todas sus dietas.
+    """
+    query = select(DietaComida).where(DietaComida.user_id == current_user.id)
+    if tipo:
+        query = query.where(DietaComida.tipo == tipo)
+    if calorias_min is not None:
+        query = query.where(DietaComida.calorias >= calorias_min)
+    if calorias_max is not None:
+        query = query.where(DietaComida.calorias <= calorias_max)
+    if dieta_id is not None:
+        query = query.where(DietaComida.dieta_id == dieta_id)
+    query = query.order_by(
+        DietaComida.dieta_id, DietaComida.dia, DietaComida.orden
+    ).offset(skip).limit(limit)
+    return (await db.execute(query)).scalars().all()
+
+
+@router.get("/{dieta_id}", response_model=DietaDetalleResponse)
 async def obtener_dieta(
     dieta_id: int,
+    incluir_plan: bool = False,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Obtener una dieta específica del usuario autenticado"""
-    dieta = db.query(Dieta).filter(
+    """
+    Obtener una dieta específica del usuario autenticado
+    
+    Con `incluir_plan=true` se incluye en `plan_completo` el plan generado con IA
+    (días, comidas y totales) tal como lo devolvió `POST /generar`.
+    """
+    query = select(Dieta).where(
         Dieta.id == dieta_id,
         Dieta.user_id == current_user.id
-    ).first()
+    )
+    if incluir_plan:
+        # Deferred columns cannot be lazy-loaded on an AsyncSession
+        query = query.options(undefer(Dieta.plan_comprimido))
+    dieta = (await db.execute(query)).scalars().first()
+    if not dieta:
+        raise HTTPException(status_code=404, detail="Dieta no encontrada")
+    
+    respuesta = DietaDetalleResponse.model_validate(dieta)
+    if incluir_plan and dieta.plan_comprimido is not None:
+        respuesta.plan_completo = decompress_json(dieta.plan_comprimido)
+    return respuesta
+
+
+@router.get("/{dieta_id}/plan")
+async def obtener_plan_dieta(
+    dieta_id: int,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Obtener el plan generado con IA de una dieta como JSON
+    
+    Si el cliente acepta `gzip` se envía el plan comprimido tal como está
+    guardado (`Content-Encoding: gzip`); si no, se descomprime por partes
+    mientras se envía, sin cargar el documento completo en memoria.
+    """
+    plan_comprimido = (await db.execute(
+        select(Dieta.plan_comprimido).where(
+            Dieta.id == dieta_id,
+            Dieta.user_id == current_user.id
+        )
+    )).first()
+    if plan_comprimido is None:
+        raise HTTPException(status_code=404, detail="Dieta no encontrada")
+    blob = plan_comprimido[0]
+    if blob is None:
+        raise HTTPException(status_code=404, detail="La dieta no tiene un plan generado")
+    
+    if "gzip" in request.headers.get("accept-encoding", "").lower():
+        return Response(
+            content=blob,
+            media_type="application/json",
+            headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
+        )
+    return StreamingResponse(
+        iter_decompressed(blob),
+        media_type="application/json",
+        headers={"Vary": "Accept-Encoding"}
+    )
+
+
+@router.get("/{dieta_id}/dias", response_model=List[DietaDiaResponse])
+async def listar_dias_dieta(
+    dieta_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Listar los días del plan generado de una dieta con sus totales"""
+    await _obtener_dieta_usuario(db, dieta_id, current_user.id)
+    return (await db.execute(
+        select(DietaDia).where(DietaDia.dieta_id == dieta_id).order_by(DietaDia.dia)
+    )).scalars().all()
+
+
+@router.get("/{dieta_id}/dias/{dia}", response_model=DietaDiaDetalleResponse)
+async def obtener_dia_dieta(
+    dieta_id: int,
+    dia: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Obtener un día del plan generado de una dieta con sus comidas"""
+    await _obtener_dieta_usuario(db, dieta_id, current_user.id)
+    db_dia = (await db.execute(
+        select(DietaDia).options(selectinload(DietaDia.comidas)).where(
+            DietaDia.dieta_id == dieta_id,
+            DietaDia.dia == dia
+        )
+    )).scalars().first()
+    if not db_dia:
+        raise HTTPException(status_code=404, detail="Día no encontrado")
+    return db_dia
+
+
+async def _obtener_dieta_usuario(db: AsyncSession, dieta_id: int, user_id: int) -> Dieta:
+    dieta = (await db.execute(
+        select(Dieta).where(
+            Dieta.id == dieta_id,
+            Dieta.user_id == user_id
+        )
+    )).scalars().first()
     if not dieta:
         raise HTTPException(status_code=404, detail="Dieta no encontrada")
     return dieta
@@ -119,13 +340,15 @@ async def actualizar_dieta(
     dieta_id: int,
     dieta_update: DietaUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Actualizar una dieta existente del usuario autenticado"""
-    dieta = db.query(Dieta).filter(
-        Dieta.id == dieta_id,
-        Dieta.user_id == current_user.id
-    ).first()
+    dieta = (await db.execute(
+        select(Dieta).where(
+            Dieta.id == dieta_id,
+            Dieta.user_id == current_user.id
+        )
+    )).scalars().first()
     if not dieta:
         raise HTTPException(status_code=404, detail="Dieta no encontrada")
     
@@ -133,8 +356,8 @@ async def actualizar_dieta(
     for field, value in update_data.items():
         setattr(dieta, field, value)
     
-    db.commit()
-    db.refresh(dieta)
+    await db.commit()
+    await db.refresh(dieta)
     return dieta
 
 
@@ -142,25 +365,30 @@ async def actualizar_dieta(
 async def eliminar_dieta(
     dieta_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Eliminar una dieta del usuario autenticado"""
-    dieta = db.query(Dieta).filter(
-        Dieta.id == dieta_id,
-        Dieta.user_id == current_user.id
-    ).first()
+    dieta = (await db.execute(
+        select(Dieta).where(
+            Dieta.id == dieta_id,
+            Dieta.user_id == current_user.id
+        )
+    )).scalars().first()
     if not dieta:
         raise HTTPException(status_code=404, detail="Dieta no encontrada")
     
-    db.delete(dieta)
-    db.commit()
+    # Explicit deletes: SQLite does not enforce ON DELETE CASCADE unless foreign keys are enabled
+    await db.execute(delete(DietaComida).where(DietaComida.dieta_id == dieta_id))
+    await db.execute(delete(DietaDia).where(DietaDia.dieta_id == dieta_id))
+    await db.delete(dieta)
+    await db.commit()
 
 
 @router.post("/generar", response_model=GenerarDietaResponse, status_code=201)
 async def generar_dieta_ia(
     request: GenerarDietaRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     openai_service: OpenAIService = Depends(get_openai_service)
 ):
     """
@@ -181,36 +409,21 @@ async def generar_dieta_ia(
             objetivo_calorias=request.objetivo_calorias,
             preferencias=request.preferencias,
             restricciones=request.restricciones,
-            dias=request.dias
-        )
-        
-        # Crear registro en la base de datos
-        db_dieta = Dieta(
-            user_id=current_user.id,
-            nombre=diet_plan.get("nombre", f"Plan de {request.dias} días"),
-            descripcion=diet_plan.get("descripcion", f"Plan personalizado de {request.objetivo_calorias} kcal/día")
+            dias=request.dias,
+            user_id=current_user.id
         )
-        db.add(db_dieta)
-        db.commit()
-        db.refresh(db_dieta)
         
-        logger.info(f"Dieta generada exitosamente con ID: {db_dieta.id}")
-        
-        # Preparar respuesta
-        return GenerarDietaResponse(
-            id=db_dieta.id,
-            user_id=db_dieta.user_id,
-            nombre=db_dieta.nombre,
-            descripcion=db_dieta.descripcion,
-            plan_completo=diet_plan,
-            calorias_totales=diet_plan.get("calorias_totales"),
-            proteina_total=diet_plan.get("proteina_total"),
-            carbohidratos_total=diet_plan.get("carbohidratos_total"),
-            grasas_total=diet_plan.get("grasas_total")
-        )
+        return await _guardar_dieta_generada(db, current_user.id, request, diet_plan)
     
     except HTTPException:
         raise
+    except SchedulerRejectedError as e:
+        logger.warning(f"Generación rechazada por el planificador: {e}")
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after))}
+        )
     except ValueError as e:
         logger.error(f"Error de validación: {e}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -220,3 +433,246 @@ async def generar_dieta_ia(
             status_code=500,
             detail=f"Error al generar dieta con IA: {str(e)}"
         )
+
+
+@router.post("/generar/stream")
+async def generar_dieta_ia_stream(
+    request: GenerarDietaRequest,
+    current_user: User = Depends(get_current_user),
+    openai_service: OpenAIService = Depends(get_openai_service)
+):
+    """
+    Generar una dieta con IA enviando el progreso como server-sent events
+    
+    Eventos emitidos (`text/event-stream`):
+    - `inicio`: inmediatamente, con los parámetros aceptados
+    - `campo`: cada campo de primer nivel terminado (`nombre`, `descripcion`, totales)
+    - `dia`: cada elemento de `dias` en cuanto el modelo termina de escribirlo
+    - `completo`: la dieta guardada, con el mismo formato que `POST /generar`
+    - `error`: si la generación falla (`detail` con el motivo)
+    """
+    user_id = current_user.id
+    
+    async def eventos():
+        yield format_sse("inicio", {"dias": request.dias, "objetivo_calorias": request.objetivo_calorias})
+        try:
+            logger.info(f"Generando dieta con IA (stream) para usuario {user_id}")
+            async for evento in openai_service.generar_dieta_stream(
+                objetivo_calorias=request.objetivo_calorias,
+                preferencias=request.preferencias,
+                restricciones=request.restricciones,
+                dias=request.dias,
+                user_id=user_id
+            ):
+                if evento.kind == "item":
+                    yield format_sse("dia", {"indice": evento.index, "dia": evento.value})
+                elif evento.kind == "field":
+                    yield format_sse("campo", {"clave": evento.key, "valor": evento.value})
+                elif evento.kind == "done":
+                    # The request's session is already closed once streaming starts
+                    async with AsyncSessionLocal() as db:
+                        respuesta = await _guardar_dieta_generada(db, user_id, request, evento.value)
+                    yield format_sse("completo", respuesta.model_dump())
+        except SchedulerRejectedError as e:
+            logger.warning(f"Generación rechazada por el planificador: {e}")
+            yield format_sse("error", {"detail": str(e), "retry_after": e.retry_after})
+        except ValueError as e:
+            logger.error(f"Error de validación: {e}")
+            yield format_sse("error", {"detail": str(e)})
+        except Exception as e:
+            logger.error(f"Error generando dieta con IA (stream): {e}", exc_info=True)
+            yield format_sse("error", {"detail": f"Error al generar dieta con IA: {str(e)}"})
+    
+    return StreamingResponse(eventos(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.post("/generar/async", response_model=TrabajoResponse, status_code=202)
+async def generar_dieta_ia_async(
+    request: GenerarDietaRequest,
+    current_user: User = Depends(get_current_user),
+    job_queue: JobQueue = Depends(get_job_queue)
+):
+    """
+    Encolar la generación de una dieta con IA y responder inmediatamente
+    
+    Retorna el trabajo creado (`202 Accepted`); el resultado, con el mismo formato
+    que `POST /generar`, se consulta en `GET /api/v1/jobs/{id}`.
+    Si la cola está llena responde `503` y el cliente debe reintentar más tarde.
+    """
+    try:
+        trabajo = await job_queue.submit(current_user.id, "dieta", request.model_dump())
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    respuesta = TrabajoResponse.model_validate(trabajo)
+    respuesta.posicion = job_queue.position(trabajo.id)
+    return respuesta
+
+
+@router.post("/optimizar", response_model=GenerarDietaResponse, status_code=201)
+async def optimizar_dieta(
+    request: OptimizarDietaRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    dieta_service: DietaService = Depends(get_dieta_service)
+):
+    """
+    Construir una dieta con las recetas guardadas del usuario, sin llamar a OpenAI
+    
+    Elige para cada día un desayuno, un almuerzo y una cena entre las recetas
+    del usuario (con sus porciones) de forma que el día se acerque al objetivo
+    de calorías y macronutrientes, sin repetir receta en el mismo día y
+    variando entre días. Responde en milisegundos y se guarda igual que una
+    dieta generada con `POST /generar`.
+    """
+    objetivo_calorias = request.objetivo_calorias or current_user.objetivo_calorias
+    if not objetivo_calorias:
+        raise HTTPException(
+            status_code=400,
+            detail="Indica objetivo_calorias o configura tu objetivo de calorías en el perfil"
+        )
+    
+    recetas = (await db.execute(
+        select(Receta).options(
+            load_only(
+                Receta.id, Receta.nombre, Receta.calorias, Receta.proteina,
+                Receta.carbohidratos, Receta.grasas, Receta.ingredientes
+            )
+        ).where(
+            Receta.user_id == current_user.id,
+            Receta.calorias > 0
+        )
+    )).scalars().all()
+    
+    try:
+        diet_plan = dieta_service.optimizar_dieta(
+            recetas,
+            objetivo_calorias=objetivo_calorias,
+            dias=request.dias,
+            proteina=request.proteina,
+            carbohidratos=request.carbohidratos,
+            grasas=request.grasas,
+            max_repeticiones=request.max_repeticiones,
+            semilla=request.semilla
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return await _guardar_dieta_generada(db, current_user.id, request, diet_plan)
+
+
+async def procesar_trabajo_dieta(user_id: int, parametros: Dict[str, Any]) -> Dict[str, Any]:
+    """Job handler: generate and store a diet queued by POST /generar/async"""
+    request = GenerarDietaRequest(**parametros)
+    logger.info(f"Generando dieta con IA (trabajo) para usuario {user_id}")
+    diet_plan = await get_openai_service().generar_dieta(
+        objetivo_calorias=request.objetivo_calorias,
+        preferencias=request.preferencias,
+        restricciones=request.restricciones,
+        dias=request.dias,
+        user_id=user_id
+    )
+    async with AsyncSessionLocal() as db:
+        return (await _guardar_dieta_generada(db, user_id, request, diet_plan)).model_dump()
+
+
+async def _guardar_dieta_generada(
+    db: AsyncSession,
+    user_id: int,
+    request: Union[GenerarDietaRequest, OptimizarDietaRequest],
+    diet_plan: Dict[str, Any]
+) -> GenerarDietaResponse:
+    """Persist a generated diet and build the API response"""
+    # Crear registro en la base de datos
+    db_dieta = Dieta(
+        user_id=user_id,
+        nombre=diet_plan.get("nombre", f"Plan de {request.dias} días"),
+        descripcion=diet_plan.get("descripcion", f"Plan personalizado de {request.objetivo_calorias} kcal/día"),
+        plan_comprimido=compress_json(diet_plan)
+    )
+    db.add(db_dieta)
+    await db.flush()
+    
+    # Days and meals go in as two multi-row INSERTs in the same transaction
+    dias, comidas = _filas_plan(db_dieta.id, user_id, diet_plan)
+    if dias:
+        await db.execute(insert(DietaDia), dias)
+    if comidas:
+        await db.execute(insert(DietaComida), comidas)
+    await db.commit()
+    await db.refresh(db_dieta)
+    
+    logger.info(f"Dieta generada exitosamente con ID: {db_dieta.id}")
+    
+    # Preparar respuesta
+    return GenerarDietaResponse(
+        id=db_dieta.id,
+        user_id=db_dieta.user_id,
+        nombre=db_dieta.nombre,
+        descripcion=db_dieta.descripcion,
+        plan_completo=diet_plan,
+        calorias_totales=diet_plan.get("calorias_totales"),
+        proteina_total=diet_plan.get("proteina_total"),
+        carbohidratos_total=diet_plan.get("carbohidratos_total"),
+        grasas_total=diet_plan.get("grasas_total")
+    )
+
+
+def _filas_plan(dieta_id: int, user_id: int, diet_plan: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Flatten a generated plan into dieta_dias / dieta_comidas rows"""
+    dias: List[Dict[str, Any]] = []
+    comidas: List[Dict[str, Any]] = []
+    vistos = set()
+    for posicion, dia in enumerate(diet_plan.get("dias") or [], start=1):
+        if not isinstance(dia, dict):
+            continue
+        numero = _entero(dia.get("dia")) or posicion
+        if numero in vistos:
+            # The model repeated a day number; keep every day addressable
+            numero = max(vistos) + 1
+        vistos.add(numero)
+        totales = dia.get("totales") or {}
+        dias.append({
+            "dieta_id": dieta_id,
+            "dia": numero,
+            "calorias": _entero(totales.get("calorias")),
+            "proteina": _decimal(totales.get("proteina")),
+            "carbohidratos": _decimal(totales.get("carbohidratos")),
+            "grasas": _decimal(totales.get("grasas")),
+        })
+        
+        snacks = dia.get("snacks") or []
+        platos = [(tipo, dia.get(tipo)) for tipo in OpenAIService.DIET_MEALS]
+        platos.extend(("snack", snack) for snack in (snacks if isinstance(snacks, list) else [snacks]))
+        for orden, (tipo, comida) in enumerate(platos):
+            if not isinstance(comida, dict):
+                continue
+            ingredientes = comida.get("ingredientes")
+            comidas.append({
+                "dieta_id": dieta_id,
+                "dia": numero,
+                "user_id": user_id,
+                "tipo": tipo,
+                "orden": orden,
+                "nombre": str(comida["nombre"])[:255] if comida.get("nombre") else None,
+                "calorias": _entero(comida.get("calorias")),
+                "proteina": _decimal(comida.get("proteina")),
+                "carbohidratos": _decimal(comida.get("carbohidratos")),
+                "grasas": _decimal(comida.get("grasas")),
+                "ingredientes": ingredientes if isinstance(ingredientes, list) else None,
+            })
+    return dias, comidas
+
+
+def _decimal(value: Any) -> Optional[float]:
+    try:
+        numero = float(value)
+    except (TypeError, ValueError):
+        return None
+    # float() and json.loads accept NaN/Infinity, which round() and the columns cannot take
+    return numero if math.isfinite(numero) else None
+
+
+def _entero(value: Any) -> Optional[int]:
+    numero = _decimal(value)
+    return round(numero) if numero is not None else None
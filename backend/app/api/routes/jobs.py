@@ -0,0 +1,60 @@
+"""
+Rutas para consultar trabajos de generación asíncrona
+"""
+
+import logging
+from fastapi import APIRouter, HTTPException, Depends
+from typing import Dict, Any
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import get_db
+from app.models.dieta import Trabajo, User
+from app.services.job_queue import JobQueue
+from app.services.dependencies import get_job_queue
+from app.api.dependencies import get_current_user
+from app.schemas.trabajos import TrabajoResponse
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+@router.get("/estadisticas")
+async def estadisticas_trabajos(
+    job_queue: JobQueue = Depends(get_job_queue)
+) -> Dict[str, Any]:
+    """
+    Estadísticas de la cola de generación de este proceso
+    
+    Returns:
+        Profundidad de la cola, trabajos en curso, completados/fallidos y tiempos
+        medios de espera y de ejecución
+    """
+    return job_queue.get_stats()
+
+
+@router.get("/{job_id}", response_model=TrabajoResponse)
+async def obtener_trabajo(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    job_queue: JobQueue = Depends(get_job_queue)
+):
+    """
+    Consultar el estado de un trabajo del usuario autenticado
+    
+    Mientras está `pendiente` incluye su posición en la cola; al `completado`
+    incluye en `resultado` la dieta o receta guardada, y en `error` el motivo
+    si la generación falló.
+    """
+    trabajo = (await db.execute(
+        select(Trabajo).where(
+            Trabajo.id == job_id,
+            Trabajo.user_id == current_user.id
+        )
+    )).scalars().first()
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    
+    respuesta = TrabajoResponse.model_validate(trabajo)
+    respuesta.posicion = job_queue.position(trabajo.id)
+    return respuesta
@@ -2,15 +2,27 @@
 Rutas para gestión de recetas
 """
 
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Optional, Dict, Any
-from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
-from app.db.session import get_db
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Literal, Optional, Dict, Any, AsyncIterator, Tuple
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.db.session import get_db, AsyncSessionLocal
 from app.models.dieta import Receta, User
 from app.services.openai_service import OpenAIService
-from app.services.dependencies import get_openai_service
+from app.services.openai_scheduler import SchedulerRejectedError
+from app.services.dependencies import get_openai_service, get_job_queue
+from app.services.job_queue import JobQueue, QueueFullError
 from app.api.dependencies import get_current_user
+from app.schemas.trabajos import TrabajoResponse
+from app.utils.sse import format_sse, SSE_HEADERS
+from app.utils.pagination import NEXT_CURSOR_HEADER, InvalidCursorError, fetch_page
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -30,6 +42,8 @@ class RecetaBase(BaseModel):
     proteina: Optional[float] = None
     carbohidratos: Optional[float] = None
     grasas: Optional[float] = None
+    tiempo_preparacion: Optional[str] = None
+    porciones: Optional[int] = None
 
 
 class RecetaCreate(RecetaBase):
@@ -47,17 +61,73 @@ class RecetaUpdate(BaseModel):
     proteina: Optional[float] = None
     carbohidratos: Optional[float] = None
     grasas: Optional[float] = None
+    tiempo_preparacion: Optional[str] = None
+    porciones: Optional[int] = None
 
 
 class RecetaResponse(RecetaBase):
     """Modelo de receta completo"""
     id: int
     user_id: int
+    clave_externa: Optional[str] = None
     
     class Config:
         from_attributes = True
 
 
+class RecetaBulkItem(RecetaCreate):
+    """Receta de una importación masiva"""
+    # Same limits as the columns, so a long value is a row error rather than a failed chunk
+    nombre: str = Field(..., max_length=255)
+    tiempo_preparacion: Optional[str] = Field(None, max_length=100)
+    clave: Optional[str] = Field(
+        None,
+        min_length=1,
+        max_length=100,
+        description="Clave del cliente; si ya hay una receta con esta clave se reemplaza en lugar de duplicarla"
+    )
+
+
+class RecetaBulkResultado(BaseModel):
+    """Receta guardada en una importación masiva"""
+    indice: int = Field(..., description="Posición de la receta en la petición (desde 0)")
+    id: int
+    clave: Optional[str] = None
+    estado: str = Field(..., description="creada o actualizada")
+
+
+class RecetaBulkError(BaseModel):
+    """Receta rechazada en una importación masiva"""
+    indice: int = Field(..., description="Posición de la receta en la petición (desde 0)")
+    clave: Optional[str] = None
+    detalle: str
+
+
+class RecetasBulkResponse(BaseModel):
+    """Resultado de una importación masiva de recetas"""
+    recibidas: int = 0
+    creadas: int = 0
+    actualizadas: int = 0
+    resultados: List[RecetaBulkResultado] = Field(default_factory=list)
+    errores: List[RecetaBulkError] = Field(default_factory=list)
+
+
+class RecetaResumenResponse(BaseModel):
+    """Modelo de receta para listados (view=summary): nombre y macros, sin textos ni ingredientes"""
+    id: int
+    nombre: str
+    calorias: Optional[int] = None
+    proteina: Optional[float] = None
+    carbohidratos: Optional[float] = None
+    grasas: Optional[float] = None
+    tiempo_preparacion: Optional[str] = None
+    porciones: Optional[int] = None
+
+
+# Columns read for view=summary; creado_en is only needed for the page cursor
+_COLUMNAS_RESUMEN = tuple(getattr(Receta, campo) for campo in RecetaResumenResponse.model_fields)
+
+
 class GenerarRecetaRequest(BaseModel):
     """Modelo para solicitud de generación de receta con IA"""
     objetivo_calorias: Optional[int] = Field(None, gt=0, description="Objetivo de calorías (opcional)")
@@ -82,15 +152,51 @@ class GenerarRecetaResponse(BaseModel):
     grasas: Optional[float] = None
 
 
-@router.get("/", response_model=List[RecetaResponse])
+@router.get(
+    "/",
+    response_model=List[RecetaResponse],
+    responses={200: {"description": "Con `view=summary`, lista de `RecetaResumenResponse`"}}
+)
 async def listar_recetas(
+    response: Response,
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
+    view: Literal["full", "summary"] = "full",
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Listar las recetas del usuario autenticado"""
-    recetas = db.query(Receta).filter(Receta.user_id == current_user.id).offset(skip).limit(limit).all()
+    """
+    Listar las recetas del usuario autenticado, de la más reciente a la más antigua
+    
+    Si hay más resultados, la cabecera `X-Next-Cursor` trae el valor de `cursor`
+    para pedir la página siguiente (`skip` se ignora cuando se indica `cursor`).
+    
+    Con `view=summary` solo se leen y devuelven id, nombre, macros, tiempo de
+    preparación y porciones (sin descripción, ingredientes ni instrucciones),
+    para listados largos.
+    """
+    if view == "summary":
+        query = select(*_COLUMNAS_RESUMEN, Receta.creado_en)
+    else:
+        query = select(Receta)
+    try:
+        recetas, siguiente = await fetch_page(
+            db, query.where(Receta.user_id == current_user.id), Receta, cursor, limit, skip
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if view == "summary":
+        # Plain rows straight to JSON: no ORM instances and no per-row model validation
+        campos = RecetaResumenResponse.model_fields
+        resumen = JSONResponse([{campo: fila._mapping[campo] for campo in campos} for fila in recetas])
+        if siguiente:
+            resumen.headers[NEXT_CURSOR_HEADER] = siguiente
+        return resumen
+    
+    if siguiente:
+        response.headers[NEXT_CURSOR_HEADER] = siguiente
     return recetas
 
 
@@ -98,7 +204,7 @@ async def listar_recetas(
 async def crear_receta(
     receta: RecetaCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Crear una nueva receta para el usuario autenticado"""
     db_receta = Receta(
@@ -110,25 +216,101 @@ async def crear_receta(
         calorias=receta.calorias,
         proteina=receta.proteina,
         carbohidratos=receta.carbohidratos,
-        grasas=receta.grasas
+        grasas=receta.grasas,
+        tiempo_preparacion=receta.tiempo_preparacion,
+        porciones=receta.porciones
     )
     db.add(db_receta)
-    db.commit()
-    db.refresh(db_receta)
+    await db.commit()
+    await db.refresh(db_receta)
     return db_receta
 
 
+@router.post("/bulk", response_model=RecetasBulkResponse)
+async def importar_recetas(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Importar muchas recetas en una sola petición
+    
+    El cuerpo es un array JSON de recetas (mismo formato que `POST /`) o, con
+    `Content-Type: application/x-ndjson`, una receta JSON por línea que se procesa
+    a medida que llega. Cada receta puede llevar una `clave` propia del cliente:
+    si el usuario ya tiene una receta con esa clave se reemplaza, de modo que
+    repetir la importación no crea duplicados.
+    
+    Las recetas se validan y guardan por bloques (`RECETAS_BULK_CHUNK_SIZE`), cada
+    uno en su propia transacción. Las recetas inválidas no detienen la importación:
+    se devuelven en `errores` con su posición, igual que las de un bloque que la
+    base de datos rechace. Pasado `RECETAS_BULK_MAX_ROWS` se deja de leer y se
+    devuelve un único error con la posición de la primera receta descartada.
+    """
+    # Read once: a rolled-back chunk expires current_user along with the session
+    user_id = current_user.id
+    resultado = RecetasBulkResponse()
+    lote: List[Tuple[int, RecetaBulkItem]] = []
+    claves_vistas = set()
+    
+    async for indice, dato in _leer_recetas_bulk(request):
+        resultado.recibidas += 1
+        if indice >= settings.RECETAS_BULK_MAX_ROWS:
+            # Stop reading: one error stands for this row and everything after it
+            resultado.errores.append(RecetaBulkError(
+                indice=indice,
+                detalle=(
+                    f"Se superó el máximo de {settings.RECETAS_BULK_MAX_ROWS} recetas por petición; "
+                    "no se procesaron esta receta ni las siguientes"
+                )
+            ))
+            break
+        clave = dato.get("clave") if isinstance(dato, dict) else None
+        try:
+            if isinstance(dato, Exception):
+                raise dato
+            item = RecetaBulkItem.model_validate(dato)
+        except (ValueError, ValidationError) as e:
+            resultado.errores.append(RecetaBulkError(
+                indice=indice, clave=clave if isinstance(clave, str) else None, detalle=_detalle_error(e)
+            ))
+            continue
+        if item.clave is not None:
+            if item.clave in claves_vistas:
+                resultado.errores.append(RecetaBulkError(
+                    indice=indice, clave=item.clave, detalle="Clave repetida en la petición"
+                ))
+                continue
+            claves_vistas.add(item.clave)
+        
+        lote.append((indice, item))
+        if len(lote) >= settings.RECETAS_BULK_CHUNK_SIZE:
+            await _guardar_lote_recetas(db, user_id, lote, resultado)
+            lote = []
+    if lote:
+        await _guardar_lote_recetas(db, user_id, lote, resultado)
+    resultado.errores.sort(key=lambda error: error.indice)
+    
+    logger.info(
+        f"Importación de recetas del usuario {user_id}: {resultado.creadas} creadas, "
+        f"{resultado.actualizadas} actualizadas, {len(resultado.errores)} errores"
+    )
+    return resultado
+
+
 @router.get("/{receta_id}", response_model=RecetaResponse)
 async def obtener_receta(
     receta_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Obtener una receta específica del usuario autenticado"""
-    receta = db.query(Receta).filter(
-        Receta.id == receta_id,
-        Receta.user_id == current_user.id
-    ).first()
+    receta = (await db.execute(
+        select(Receta).where(
+            Receta.id == receta_id,
+            Receta.user_id == current_user.id
+        )
+    )).scalars().first()
     if not receta:
         raise HTTPException(status_code=404, detail="Receta no encontrada")
     return receta
@@ -139,13 +321,15 @@ async def actualizar_receta(
     receta_id: int,
     receta_update: RecetaUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Actualizar una receta existente del usuario autenticado"""
-    receta = db.query(Receta).filter(
-        Receta.id == receta_id,
-        Receta.user_id == current_user.id
-    ).first()
+    receta = (await db.execute(
+        select(Receta).where(
+            Receta.id == receta_id,
+            Receta.user_id == current_user.id
+        )
+    )).scalars().first()
     if not receta:
         raise HTTPException(status_code=404, detail="Receta no encontrada")
     
@@ -153,8 +337,8 @@ async def actualizar_receta(
     for field, value in update_data.items():
         setattr(receta, field, value)
     
-    db.commit()
-    db.refresh(receta)
+    await db.commit()
+    await db.refresh(receta)
     return receta
 
 
@@ -162,18 +346,20 @@ async def actualizar_receta(
 async def eliminar_receta(
     receta_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Eliminar una receta del usuario autenticado"""
-    receta = db.query(Receta).filter(
-        Receta.id == receta_id,
-        Receta.user_id == current_user.id
-    ).first()
+    receta = (await db.execute(
+        select(Receta).where(
+            Receta.id == receta_id,
+            Receta.user_id == current_user.id
+        )
+    )).scalars().first()
     if not receta:
         raise HTTPException(status_code=404, detail="Receta no encontrada")
     
-    db.delete(receta)
-    db.commit()
+    await db.delete(receta)
+    await db.commit()
 
 
 @router.post("/buscar")
@@ -187,7 +373,7 @@ async def buscar_recetas(terminos: dict):
 async def generar_receta_ia(
     request: GenerarRecetaRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     openai_service: OpenAIService = Depends(get_openai_service)
 ):
     """
@@ -208,50 +394,21 @@ async def generar_receta_ia(
             objetivo_calorias=request.objetivo_calorias,
             ingredientes_deseados=request.ingredientes_deseados,
             tipo_comida=request.tipo_comida,
-            restricciones=request.restricciones
-        )
-        
-        # Preparar ingredientes en formato dict/JSON
-        ingredientes_json = {
-            "items": recipe_data.get("ingredientes", [])
-        }
-        
-        # Crear registro en la base de datos
-        db_receta = Receta(
-            user_id=current_user.id,
-            nombre=recipe_data.get("nombre", "Receta Generada"),
-            descripcion=recipe_data.get("descripcion", ""),
-            ingredientes=ingredientes_json,
-            instrucciones=recipe_data.get("instrucciones", ""),
-            calorias=recipe_data.get("calorias"),
-            proteina=recipe_data.get("proteina"),
-            carbohidratos=recipe_data.get("carbohidratos"),
-            grasas=recipe_data.get("grasas")
+            restricciones=request.restricciones,
+            user_id=current_user.id
         )
-        db.add(db_receta)
-        db.commit()
-        db.refresh(db_receta)
         
-        logger.info(f"Receta generada exitosamente con ID: {db_receta.id}")
-        
-        # Preparar respuesta
-        return GenerarRecetaResponse(
-            id=db_receta.id,
-            user_id=db_receta.user_id,
-            nombre=db_receta.nombre,
-            descripcion=db_receta.descripcion,
-            ingredientes=ingredientes_json,
-            instrucciones=db_receta.instrucciones,
-            tiempo_preparacion=recipe_data.get("tiempo_preparacion"),
-            porciones=recipe_data.get("porciones"),
-            calorias=db_receta.calorias,
-            proteina=db_receta.proteina,
-            carbohidratos=db_receta.carbohidratos,
-            grasas=db_receta.grasas
-        )
+        return await _guardar_receta_generada(db, current_user.id, recipe_data)
     
     except HTTPException:
         raise
+    except SchedulerRejectedError as e:
+        logger.warning(f"Generación rechazada por el planificador: {e}")
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after))}
+        )
     except ValueError as e:
         logger.error(f"Error de validación: {e}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -261,3 +418,285 @@ async def generar_receta_ia(
             status_code=500,
             detail=f"Error al generar receta con IA: {str(e)}"
         )
+
+
+@router.post("/generar/stream")
+async def generar_receta_ia_stream(
+    request: GenerarRecetaRequest,
+    current_user: User = Depends(get_current_user),
+    openai_service: OpenAIService = Depends(get_openai_service)
+):
+    """
+    Generar una receta con IA enviando el progreso como server-sent events
+    
+    Eventos emitidos (`text/event-stream`):
+    - `inicio`: inmediatamente
+    - `campo`: cada campo de primer nivel terminado (`nombre`, `instrucciones`, macros...)
+    - `ingrediente`: cada elemento de `ingredientes` en cuanto está completo
+    - `completo`: la receta guardada, con el mismo formato que `POST /generar`
+    - `error`: si la generación falla (`detail` con el motivo)
+    """
+    user_id = current_user.id
+    
+    async def eventos():
+        yield format_sse("inicio", {"tipo_comida": request.tipo_comida})
+        try:
+            logger.info(f"Generando receta con IA (stream) para usuario {user_id}")
+            async for evento in openai_service.generar_receta_stream(
+                objetivo_calorias=request.objetivo_calorias,
+                ingredientes_deseados=request.ingredientes_deseados,
+                tipo_comida=request.tipo_comida,
+                restricciones=request.restricciones,
+                user_id=user_id
+            ):
+                if evento.kind == "item":
+                    yield format_sse("ingrediente", {"indice": evento.index, "ingrediente": evento.value})
+                elif evento.kind == "field":
+                    yield format_sse("campo", {"clave": evento.key, "valor": evento.value})
+                elif evento.kind == "done":
+                    # The request's session is already closed once streaming starts
+                    async with AsyncSessionLocal() as db:
+                        respuesta = await _guardar_receta_generada(db, user_id, evento.value)
+                    yield format_sse("completo", respuesta.model_dump())
+        except SchedulerRejectedError as e:
+            logger.warning(f"Generación rechazada por el planificador: {e}")
+            yield format_sse("error", {"detail": str(e), "retry_after": e.retry_after})
+        except ValueError as e:
+            logger.error(f"Error de validación: {e}")
+            yield format_sse("error", {"detail": str(e)})
+        except Exception as e:
+            logger.error(f"Error generando receta con IA (stream): {e}", exc_info=True)
+            yield format_sse("error", {"detail": f"Error al generar receta con IA: {str(e)}"})
+    
+    return StreamingResponse(eventos(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.post("/generar/async", response_model=TrabajoResponse, status_code=202)
+async def generar_receta_ia_async(
+    request: GenerarRecetaRequest,
+    current_user: User = Depends(get_current_user),
+    job_queue: JobQueue = Depends(get_job_queue)
+):
+    """
+    Encolar la generación de una receta con IA y responder inmediatamente
+    
+    Retorna el trabajo creado (`202 Accepted`); el resultado, con el mismo formato
+    que `POST /generar`, se consulta en `GET /api/v1/jobs/{id}`.
+    Si la cola está llena responde `503` y el cliente debe reintentar más tarde.
+    """
+    try:
+        trabajo = await job_queue.submit(current_user.id, "receta", request.model_dump())
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    respuesta = TrabajoResponse.model_validate(trabajo)
+    respuesta.posicion = job_queue.position(trabajo.id)
+    return respuesta
+
+
+async def procesar_trabajo_receta(user_id: int, parametros: Dict[str, Any]) -> Dict[str, Any]:
+    """Job handler: generate and store a recipe queued by POST /generar/async"""
+    request = GenerarRecetaRequest(**parametros)
+    logger.info(f"Generando receta con IA (trabajo) para usuario {user_id}")
+    recipe_data = await get_openai_service().generar_receta(
+        objetivo_calorias=request.objetivo_calorias,
+        ingredientes_deseados=request.ingredientes_deseados,
+        tipo_comida=request.tipo_comida,
+        restricciones=request.restricciones,
+        user_id=user_id
+    )
+    async with AsyncSessionLocal() as db:
+        return (await _guardar_receta_generada(db, user_id, recipe_data)).model_dump()
+
+
+async def _leer_recetas_bulk(request: Request) -> AsyncIterator[Tuple[int, Any]]:
+    """Yield (index, parsed item) from a JSON array or NDJSON body; unparseable lines yield the error"""
+    if "ndjson" in request.headers.get("content-type", "").lower():
+        indice = 0
+        pendiente = b""
+        async for trozo in request.stream():
+            pendiente += trozo
+            *lineas, pendiente = pendiente.split(b"\n")
+            for linea in lineas:
+                if linea.strip():
+                    yield indice, _parsear_linea(linea)
+                    indice += 1
+        if pendiente.strip():
+            yield indice, _parsear_linea(pendiente)
+        return
+    
+    try:
+        datos = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="El cuerpo debe ser un array JSON de recetas o NDJSON")
+    if not isinstance(datos, list):
+        raise HTTPException(status_code=400, detail="El cuerpo debe ser un array JSON de recetas o NDJSON")
+    for indice, dato in enumerate(datos):
+        yield indice, dato
+
+
+def _parsear_linea(linea: bytes) -> Any:
+    try:
+        return json.loads(linea)
+    except ValueError as e:
+        return ValueError(f"JSON inválido: {e}")
+
+
+def _detalle_error(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(parte) for parte in detalle['loc']) or 'receta'}: {detalle['msg']}"
+            for detalle in error.errors()
+        )
+    return str(error)
+
+
+async def _guardar_lote_recetas(
+    db: AsyncSession,
+    user_id: int,
+    lote: List[Tuple[int, RecetaBulkItem]],
+    resultado: RecetasBulkResponse
+):
+    """
+    Write one chunk of a bulk import in a single transaction
+
+    If the database rejects the chunk it is rolled back and each of its rows
+    is reported in resultado.errores; earlier chunks stay committed.
+    """
+    try:
+        guardadas = await _escribir_lote_recetas(db, user_id, lote)
+        await db.commit()
+    except SQLAlchemyError as e:
+        await db.rollback()
+        logger.warning(f"Bloque de importación de recetas rechazado ({len(lote)} recetas): {e}")
+        detalle = f"No se pudo guardar el bloque de recetas: {getattr(e, 'orig', None) or e}"
+        resultado.errores += [
+            RecetaBulkError(indice=indice, clave=item.clave, detalle=detalle) for indice, item in lote
+        ]
+        return
+    
+    resultado.resultados += guardadas
+    resultado.creadas += sum(1 for guardada in guardadas if guardada.estado == "creada")
+    resultado.actualizadas += sum(1 for guardada in guardadas if guardada.estado == "actualizada")
+
+
+async def _escribir_lote_recetas(
+    db: AsyncSession,
+    user_id: int,
+    lote: List[Tuple[int, RecetaBulkItem]]
+) -> List[RecetaBulkResultado]:
+    """
+    Insert one chunk of a bulk import (without committing), in request order
+
+    Rows without a client key go in as one executemany INSERT ... RETURNING;
+    keyed rows as one INSERT ... ON CONFLICT (user_id, clave_externa) DO UPDATE.
+    """
+    campos = list(RecetaCreate.model_fields)
+    sin_clave = [(indice, item) for indice, item in lote if item.clave is None]
+    con_clave = [(indice, item) for indice, item in lote if item.clave is not None]
+    
+    guardadas: List[RecetaBulkResultado] = []
+    if sin_clave:
+        filas = [{"user_id": user_id, **item.model_dump(include=set(campos))} for _, item in sin_clave]
+        ids = (await db.execute(
+            insert(Receta).returning(Receta.id, sort_by_parameter_order=True), filas
+        )).scalars().all()
+        guardadas += [
+            RecetaBulkResultado(indice=indice, id=receta_id, estado="creada")
+            for (indice, _), receta_id in zip(sin_clave, ids)
+        ]
+    
+    if con_clave:
+        claves = [item.clave for _, item in con_clave]
+        existentes = set((await db.execute(
+            select(Receta.clave_externa).where(Receta.user_id == user_id, Receta.clave_externa.in_(claves))
+        )).scalars())
+        filas = [
+            {"user_id": user_id, "clave_externa": item.clave, **item.model_dump(include=set(campos))}
+            for _, item in con_clave
+        ]
+        ids_por_clave = await _upsert_recetas(db, filas, campos)
+        guardadas += [
+            RecetaBulkResultado(
+                indice=indice,
+                id=ids_por_clave[item.clave],
+                clave=item.clave,
+                estado="actualizada" if item.clave in existentes else "creada"
+            )
+            for indice, item in con_clave
+        ]
+    
+    guardadas.sort(key=lambda guardada: guardada.indice)
+    return guardadas
+
+
+async def _upsert_recetas(db: AsyncSession, filas: List[Dict[str, Any]], campos: List[str]) -> Dict[str, int]:
+    """Insert or replace keyed recipes; returns the recipe id for each clave_externa"""
+    dialect = db.bind.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        dialect_insert = sqlite_insert if dialect == "sqlite" else pg_insert
+        stmt = dialect_insert(Receta)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Receta.user_id, Receta.clave_externa],
+            set_={campo: stmt.excluded[campo] for campo in campos}
+        ).returning(Receta.id, Receta.clave_externa)
+        return {clave: receta_id for receta_id, clave in (await db.execute(stmt, filas)).all()}
+    
+    ids_por_clave = {}
+    for fila in filas:
+        receta = (await db.execute(
+            select(Receta).where(Receta.user_id == fila["user_id"], Receta.clave_externa == fila["clave_externa"])
+        )).scalars().first()
+        if receta is None:
+            receta = Receta(**fila)
+            db.add(receta)
+        else:
+            for campo in campos:
+                setattr(receta, campo, fila[campo])
+        await db.flush()
+        ids_por_clave[fila["clave_externa"]] = receta.id
+    return ids_por_clave
+
+
+async def _guardar_receta_generada(db: AsyncSession, user_id: int, recipe_data: Dict[str, Any]) -> GenerarRecetaResponse:
+    """Persist a generated recipe and build the API response"""
+    # Preparar ingredientes en formato dict/JSON
+    ingredientes_json = {
+        "items": recipe_data.get("ingredientes", [])
+    }
+    
+    # Crear registro en la base de datos
+    db_receta = Receta(
+        user_id=user_id,
+        nombre=recipe_data.get("nombre", "Receta Generada"),
+        descripcion=recipe_data.get("descripcion", ""),
+        ingredientes=ingredientes_json,
+        instrucciones=recipe_data.get("instrucciones", ""),
+        calorias=recipe_data.get("calorias"),
+        proteina=recipe_data.get("proteina"),
+        carbohidratos=recipe_data.get("carbohidratos"),
+        grasas=recipe_data.get("grasas"),
+        tiempo_preparacion=recipe_data.get("tiempo_preparacion"),
+        porciones=recipe_data.get("porciones")
+    )
+    db.add(db_receta)
+    await db.commit()
+    await db.refresh(db_receta)
+    
+    logger.info(f"Receta generada exitosamente con ID: {db_receta.id}")
+    
+    # Preparar respuesta
+    return GenerarRecetaResponse(
+        id=db_receta.id,
+        user_id=db_receta.user_id,
+        nombre=db_receta.nombre,
+        descripcion=db_receta.descripcion,
+        ingredientes=ingredientes_json,
+        instrucciones=db_receta.instrucciones,
+        tiempo_preparacion=db_receta.tiempo_preparacion,
+        porciones=db_receta.porciones,
+        calorias=db_receta.calorias,
+        proteina=db_receta.proteina,
+        carbohidratos=db_receta.carbohidratos,
+        grasas=db_receta.grasas
+    )
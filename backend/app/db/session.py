@@ -3,24 +3,43 @@ Database session configuration
 """
 
 from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import QueuePool, StaticPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
 from app.config import settings
+from typing import List
 import logging
 
 logger = logging.getLogger(__name__)
 
 # Determine if we're using SQLite or another database
 is_sqlite = settings.DATABASE_URL.lower().startswith("sqlite")
+# In-memory databases only exist on a single connection
+is_memory_sqlite = is_sqlite and make_url(settings.DATABASE_URL).database in (None, "", ":memory:")
 
 # Configure engine based on database type
-if is_sqlite:
-    # SQLite-specific configuration
+if is_memory_sqlite:
     engine = create_engine(
         settings.DATABASE_URL,
         connect_args={"check_same_thread": False},  # Allow SQLite to be used with FastAPI
-        poolclass=StaticPool,  # Use StaticPool for SQLite
+        poolclass=StaticPool,
+        echo=False,
+    )
+elif is_sqlite:
+    # SQLite-specific configuration: one connection per concurrent session, so readers
+    # run in parallel (WAL) and only writers queue on SQLite's write lock
+    engine = create_engine(
+        settings.DATABASE_URL,
+        connect_args={
+            "check_same_thread": False,  # Connections move between threads through the pool
+            "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000
+        },
+        poolclass=QueuePool,
+        pool_size=settings.SQLITE_POOL_SIZE,
+        max_overflow=settings.SQLITE_MAX_OVERFLOW,
+        pool_timeout=30,
         echo=False,
     )
 else:
@@ -43,10 +62,33 @@ else:
     )
 
 
+def sqlite_pragmas() -> List[str]:
+    """PRAGMA statements applied to every new SQLite connection"""
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT_MS)}",
+        f"PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA mmap_size = {int(settings.SQLITE_MMAP_SIZE)}",
+        # Negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size = -{int(settings.SQLITE_CACHE_SIZE_KB)}",
+        "PRAGMA temp_store = MEMORY",
+    ]
+    if settings.SQLITE_WAL and not is_memory_sqlite:
+        # Persistent (stored in the file), but cheap to repeat
+        pragmas.insert(0, "PRAGMA journal_mode = WAL")
+    return pragmas
+
+
 # Add event listener to handle connection issues
 @event.listens_for(engine, "connect")
 def receive_connect(dbapi_conn, connection_record):
     """Event listener for new database connections"""
+    if is_sqlite:
+        cursor = dbapi_conn.cursor()
+        try:
+            for pragma in sqlite_pragmas():
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
     logger.debug("Database connection established")
 
 
@@ -57,33 +99,86 @@ def receive_checkout(dbapi_conn, connection_record, connection_proxy):
 
 
 # Create session factory
+# Synchronous sessions are for code that is not on the event loop: Alembic,
+# application startup and work already running in a thread (asyncio.to_thread)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def async_database_url(url: str) -> str:
+    """Same database through an asyncio driver (aiosqlite for SQLite, asyncpg for PostgreSQL)"""
+    parsed = make_url(url)
+    drivers = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg"}
+    if parsed.drivername in drivers:
+        parsed = parsed.set(drivername=drivers[parsed.drivername])
+    elif parsed.drivername in ("postgresql+psycopg2", "postgresql+psycopg"):
+        parsed = parsed.set(drivername="postgresql+asyncpg")
+    return parsed.render_as_string(hide_password=False)
+
+
+# Async engine used by the API routes, so queries never block the event loop
+if is_memory_sqlite:
+    async_engine = create_async_engine(
+        async_database_url(settings.DATABASE_URL),
+        poolclass=StaticPool,
+        echo=False,
+    )
+elif is_sqlite:
+    async_engine = create_async_engine(
+        async_database_url(settings.DATABASE_URL),
+        connect_args={"timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000},
+        # aiosqlite defaults to NullPool (a new connection and thread per session)
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.SQLITE_POOL_SIZE,
+        max_overflow=settings.SQLITE_MAX_OVERFLOW,
+        pool_timeout=30,
+        echo=False,
+    )
+else:
+    async_engine = create_async_engine(
+        async_database_url(settings.DATABASE_URL),
+        pool_size=5,
+        max_overflow=10,
+        pool_timeout=30,
+        pool_recycle=3600,
+        pool_pre_ping=True,
+        echo=False,
+        # asyncpg takes server settings instead of libpq "options"
+        connect_args={
+            "timeout": 10,
+            "server_settings": {"timezone": "utc"}
+        }
+    )
+
+# Same pragmas for the async driver's connections
+event.listen(async_engine.sync_engine, "connect", receive_connect)
+
+# expire_on_commit=False: objects stay readable after commit without an implicit
+# (and, on an async session, impossible) lazy reload
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
 # Create base class for models
 Base = declarative_base()
 
 
-def get_db():
+async def get_db():
     """
-    Dependency for getting database session with proper error handling
+    Dependency for getting an async database session with proper error handling
     
     This function is used as a FastAPI dependency to provide database sessions
     to route handlers. It ensures proper cleanup of database connections.
     
     Yields:
-        Session: SQLAlchemy database session
+        AsyncSession: SQLAlchemy async database session
         
     Example:
         @app.get("/users")
-        def get_users(db: Session = Depends(get_db)):
-            return db.query(User).all()
+        async def get_users(db: AsyncSession = Depends(get_db)):
+            return (await db.scalars(select(User))).all()
     """
-    db = SessionLocal()
-    try:
-        yield db
-    except Exception as e:
-        logger.error(f"Database session error: {e}")
-        db.rollback()
-        raise
-    finally:
-        db.close()
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception as e:
+            logger.error(f"Database session error: {e}")
+            await db.rollback()
+            raise
@@ -3,15 +3,53 @@ FastAPI Backend Application - Nutricion IA
 Main entry point for the API
 """
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.routes import dieta, recetas, alimentos, auth
+from app.api.routes import dieta, recetas, alimentos, auth, jobs
 from app.config import settings
+from app.db.session import SessionLocal, async_engine
+from app.utils.pagination import NEXT_CURSOR_HEADER
+from app.services.dependencies import (
+    get_fatsecret_service,
+    close_fatsecret_service,
+    get_alimento_service,
+    get_job_queue,
+    close_job_queue,
+    close_openai_service
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared services at startup and release them at shutdown"""
+    get_fatsecret_service()
+    
+    # Build the autocomplete index from the local food catalog
+    db = SessionLocal()
+    try:
+        get_alimento_service().cargar_indice(db)
+    finally:
+        db.close()
+    
+    # Start the generation workers; pending jobs left by a previous run are resumed
+    job_queue = get_job_queue()
+    job_queue.register("dieta", dieta.procesar_trabajo_dieta)
+    job_queue.register("receta", recetas.procesar_trabajo_receta)
+    await job_queue.start()
+    
+    yield
+    await close_job_queue()
+    await close_openai_service()
+    await close_fatsecret_service()
+    await async_engine.dispose()
+
 
 app = FastAPI(
     title="Nutricion IA API",
     description="API para gestión de dietas y recetas con IA",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -21,6 +59,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cursor of the next page in paginated listings
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 # Include routers
@@ -28,6 +68,7 @@ app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
 app.include_router(dieta.router, prefix="/api/v1/dieta", tags=["dieta"])
 app.include_router(recetas.router, prefix="/api/v1/recetas", tags=["recetas"])
 app.include_router(alimentos.router, prefix="/api/v1/alimentos", tags=["alimentos"])
+app.include_router(jobs.router, prefix="/api/v1/jobs", tags=["jobs"])
 
 
 @app.get("/")
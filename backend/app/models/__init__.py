@@ -1,6 +1,6 @@
 """Models package"""
 
-from app.models.dieta import User, Dieta, Receta, RefreshToken
+from app.models.dieta import User, Dieta, DietaDia, DietaComida, Receta, RefreshToken, Alimento, GeneracionCache, Trabajo
 from app.models.database import Base, init_db
 
-__all__ = ["User", "Dieta", "Receta", "RefreshToken", "Base", "init_db"]
+__all__ = ["User", "Dieta", "DietaDia", "DietaComida", "Receta", "RefreshToken", "Alimento", "GeneracionCache", "Trabajo", "Base", "init_db"]
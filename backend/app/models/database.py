@@ -3,10 +3,10 @@ Database configuration and model exports
 """
 
 from app.db.session import Base, engine, get_db
-from app.models.dieta import User, Dieta, Receta, RefreshToken
+from app.models.dieta import User, Dieta, DietaDia, DietaComida, Receta, RefreshToken, Alimento, GeneracionCache, Trabajo
 
 # Export all models for easy imports
-__all__ = ["Base", "engine", "get_db", "User", "Dieta", "Receta", "RefreshToken"]
+__all__ = ["Base", "engine", "get_db", "User", "Dieta", "DietaDia", "DietaComida", "Receta", "RefreshToken", "Alimento", "GeneracionCache", "Trabajo"]
 
 
 def init_db():
@@ -2,8 +2,8 @@
 Database models for the application
 """
 
-from sqlalchemy import Column, Integer, String, Text, DateTime, Float, ForeignKey, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DateTime, Float, ForeignKey, ForeignKeyConstraint, JSON, Index, LargeBinary, UniqueConstraint
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
 from app.db.session import Base
 
@@ -33,9 +33,71 @@ class Dieta(Base):
     nombre = Column(String(255), nullable=False)
     descripcion = Column(Text)
     pdf_url = Column(String(500))
+    # Full generated plan (days, meals, totals) as gzip-compressed JSON (app.utils.compression)
+    # Deferred so listing diets does not load the blobs
+    plan_comprimido = deferred(Column(LargeBinary))
     creado_en = Column(DateTime(timezone=True), server_default=func.now())
     
     user = relationship("User", back_populates="dietas")
+    dias = relationship("DietaDia", back_populates="dieta", order_by="DietaDia.dia", passive_deletes=True)
+    
+    __table_args__ = (
+        # Keyset pagination of a user's diets (newest first)
+        Index("ix_dietas_user_id_creado_en_id", "user_id", "creado_en", "id"),
+    )
+
+
+class DietaDia(Base):
+    """One day of a generated diet plan, with the server-computed totals"""
+    __tablename__ = "dieta_dias"
+    
+    id = Column(Integer, primary_key=True)
+    dieta_id = Column(Integer, ForeignKey("dietas.id", ondelete="CASCADE"), nullable=False)
+    # Day number as generated (1-based)
+    dia = Column(Integer, nullable=False)
+    calorias = Column(Integer)
+    proteina = Column(Float)
+    carbohidratos = Column(Float)
+    grasas = Column(Float)
+    
+    dieta = relationship("Dieta", back_populates="dias")
+    comidas = relationship("DietaComida", back_populates="dia_plan", order_by="DietaComida.orden", passive_deletes=True)
+    
+    __table_args__ = (
+        UniqueConstraint("dieta_id", "dia", name="uq_dieta_dias_dieta_id_dia"),
+    )
+
+
+class DietaComida(Base):
+    """One meal (desayuno, almuerzo, cena or snack) of a generated plan day"""
+    __tablename__ = "dieta_comidas"
+    
+    id = Column(Integer, primary_key=True)
+    # (dieta_id, dia) points at the day; user_id is copied from the diet so
+    # queries across all of a user's plans need no join
+    dieta_id = Column(Integer, nullable=False)
+    dia = Column(Integer, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # desayuno | almuerzo | cena | snack
+    tipo = Column(String(20), nullable=False)
+    # Position within the day (snacks keep their order)
+    orden = Column(Integer, nullable=False, default=0)
+    nombre = Column(String(255))
+    calorias = Column(Integer)
+    proteina = Column(Float)
+    carbohidratos = Column(Float)
+    grasas = Column(Float)
+    ingredientes = Column(JSON)
+    
+    dia_plan = relationship("DietaDia", back_populates="comidas")
+    
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["dieta_id", "dia"], ["dieta_dias.dieta_id", "dieta_dias.dia"], ondelete="CASCADE"
+        ),
+        Index("ix_dieta_comidas_dieta_id_dia", "dieta_id", "dia"),
+        Index("ix_dieta_comidas_user_id_tipo_calorias", "user_id", "tipo", "calorias"),
+    )
 
 
 class Receta(Base):
@@ -54,9 +116,19 @@ class Receta(Base):
     proteina = Column(Float)
     carbohidratos = Column(Float)
     grasas = Column(Float)
+    tiempo_preparacion = Column(String(100))
+    porciones = Column(Integer)
+    # Client-supplied key for idempotent bulk imports (POST /recetas/bulk), unique per user
+    clave_externa = Column(String(100))
     creado_en = Column(DateTime(timezone=True), server_default=func.now())
     
     user = relationship("User", back_populates="recetas")
+    
+    __table_args__ = (
+        # Keyset pagination of a user's recipes (newest first)
+        Index("ix_recetas_user_id_creado_en_id", "user_id", "creado_en", "id"),
+        Index("ux_recetas_user_id_clave_externa", "user_id", "clave_externa", unique=True),
+    )
 
 
 class RefreshToken(Base):
@@ -70,3 +142,71 @@ class RefreshToken(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     user = relationship("User", back_populates="refresh_tokens")
+
+
+class Alimento(Base):
+    """Local mirror of FatSecret foods (catalog used to answer searches locally)"""
+    __tablename__ = "alimentos"
+    
+    # FatSecret food_id
+    id = Column(String(50), primary_key=True)
+    nombre = Column(String(255), nullable=False)
+    # Case-folded, accent-stripped name used by the search index
+    nombre_normalizado = Column(String(255), nullable=False, index=True)
+    descripcion = Column(Text)
+    tipo = Column(String(50))
+    url = Column(String(500))
+    calorias = Column(Float)
+    proteina = Column(Float)
+    carbohidratos = Column(Float)
+    grasas = Column(Float)
+    # Servings from food.get; NULL until the detailed record has been fetched
+    servings = Column(JSON)
+    actualizado_en = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class GeneracionCache(Base):
+    """Cached OpenAI output for a normalized generation request (content-addressed)"""
+    __tablename__ = "generaciones_cache"
+    
+    # sha256 of the normalized request + model + prompt version
+    clave = Column(String(64), primary_key=True)
+    tipo = Column(String(20), nullable=False)
+    modelo = Column(String(50), nullable=False)
+    version_prompt = Column(String(20), nullable=False)
+    respuesta = Column(JSON, nullable=False)
+    hits = Column(Integer, nullable=False, default=0)
+    creado_en = Column(DateTime(timezone=True), server_default=func.now())
+    expira_en = Column(DateTime(timezone=True), nullable=False, index=True)
+    # Used to evict the least recently used entries when the cache is full
+    ultimo_acceso = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class Trabajo(Base):
+    """Asynchronous generation job (diet/recipe) processed by the background worker pool"""
+    __tablename__ = "trabajos"
+    
+    # uuid4 hex, returned to the client for polling
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    tipo = Column(String(20), nullable=False)
+    # pendiente -> en_proceso -> completado | error
+    estado = Column(String(20), nullable=False, default="pendiente")
+    parametros = Column(JSON, nullable=False)
+    resultado = Column(JSON)
+    error = Column(Text)
+    intentos = Column(Integer, nullable=False, default=0)
+    creado_en = Column(DateTime(timezone=True), nullable=False)
+    iniciado_en = Column(DateTime(timezone=True))
+    # Token of the current claim; finishing a job requires it, so a worker
+    # whose job was reclaimed cannot overwrite the new run
+    reclamado_por = Column(String(32))
+    # Refreshed while a worker runs the job; stale heartbeats mark orphaned jobs
+    latido_en = Column(DateTime(timezone=True))
+    terminado_en = Column(DateTime(timezone=True))
+    # Finished jobs are deleted after this moment
+    expira_en = Column(DateTime(timezone=True), index=True)
+    
+    __table_args__ = (
+        Index("ix_trabajos_estado_creado_en", "estado", "creado_en"),
+    )
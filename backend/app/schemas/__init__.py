@@ -7,11 +7,13 @@ from app.schemas.auth import (
     RefreshTokenRequest,
     UserResponse
 )
+from app.schemas.trabajos import TrabajoResponse
 
 __all__ = [
     "UserRegister",
     "UserLogin",
     "TokenResponse",
     "RefreshTokenRequest",
-    "UserResponse"
+    "UserResponse",
+    "TrabajoResponse"
 ]
@@ -0,0 +1,24 @@
+"""
+Pydantic schemas for asynchronous generation jobs
+"""
+
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Any, Dict, Optional
+
+
+class TrabajoResponse(BaseModel):
+    """Schema for a generation job and, once finished, its result"""
+    id: str = Field(..., description="Job identifier used to poll GET /api/v1/jobs/{id}")
+    tipo: str = Field(..., description="Kind of generation: dieta or receta")
+    estado: str = Field(..., description="pendiente, en_proceso, completado or error")
+    posicion: Optional[int] = Field(None, description="Position in the queue while pending")
+    resultado: Optional[Dict[str, Any]] = Field(None, description="Same body as the synchronous /generar endpoint")
+    error: Optional[str] = None
+    intentos: int = 0
+    creado_en: datetime
+    iniciado_en: Optional[datetime] = None
+    terminado_en: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
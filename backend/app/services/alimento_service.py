@@ -0,0 +1,430 @@
+"""
+Alimento service - Local catalog of FatSecret foods
+Answers searches from the database and only falls back to FatSecret on a miss
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, column, func, literal_column, table, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.db.session import AsyncSessionLocal
+from app.models.dieta import Alimento
+from app.services.autocomplete import PrefixIndex
+from app.services.fat_secret_service import FatSecretService
+from app.services.rate_limiter import PRIORITY_BACKGROUND, PRIORITY_ENRICHMENT
+from app.utils.text import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# FTS5 index created by the alimentos catalog migration (SQLite only)
+_alimentos_fts = table("alimentos_fts", column("rowid"), column("rank"))
+
+# Columns refreshed from search results (servings only come from food.get)
+_SUMMARY_FIELDS = ("nombre", "nombre_normalizado", "descripcion", "tipo", "url",
+                   "calorias", "proteina", "carbohidratos", "grasas", "actualizado_en")
+
+
+class AlimentoService:
+    """Service for the local food catalog (alimentos table)"""
+
+    def __init__(
+        self,
+        min_results: int = 5,
+        max_age: timedelta = timedelta(days=30),
+        prefix_index: Optional[PrefixIndex] = None
+    ):
+        """
+        Args:
+            min_results: Minimum fresh local matches needed to skip FatSecret
+            max_age: Age after which a catalog entry is considered stale
+            prefix_index: Autocomplete index kept in sync with the catalog
+        """
+        self.min_results = min_results
+        self.max_age = max_age
+        self.prefix_index = prefix_index if prefix_index is not None else PrefixIndex()
+        self._has_fts: Optional[bool] = None
+        self._stats: Dict[str, int] = {
+            "catalog_hits": 0,
+            "catalog_misses": 0,
+            "detail_catalog_hits": 0,
+            "detail_fetches": 0,
+            "detail_errors": 0,
+            "autocomplete_local": 0,
+            "autocomplete_upstream": 0,
+            "catalog_stale_served": 0,
+            "catalog_fallbacks": 0,
+            "catalog_revalidations": 0,
+        }
+        # Background catalog refreshes, keyed by normalized query
+        self._revalidations: Dict[str, asyncio.Task] = {}
+
+    async def buscar_alimentos(
+        self,
+        db: AsyncSession,
+        fat_secret_service: FatSecretService,
+        consulta: str,
+        max_results: int = 20
+    ) -> List[Dict[str, Any]]:
+        """
+        Search foods in the local catalog, falling back to FatSecret
+
+        The catalog SQL is dialect-specific and written for a sync Session,
+        so it runs through AsyncSession.run_sync.
+
+        Args:
+            db: Database session
+            fat_secret_service: Shared FatSecret client
+            consulta: Food name to search for
+            max_results: Maximum number of results to return
+
+        Returns:
+            List of foods in the same format as FatSecretService.search_foods
+        """
+        filas = await db.run_sync(self._buscar_filas, consulta, max_results)
+        frescas = [fila for fila in filas if self._es_fresca(fila)]
+        necesarias = min(self.min_results, max_results)
+
+        if len(frescas) >= necesarias:
+            self._stats["catalog_hits"] += 1
+            alimentos = [self._to_dict(fila) for fila in frescas]
+        elif len(filas) >= necesarias:
+            # Stale-while-revalidate: answer from the catalog and refresh it in the background
+            self._stats["catalog_stale_served"] += 1
+            alimentos = [self._to_dict(fila) for fila in filas]
+            self._revalidar(fat_secret_service, consulta, max_results)
+        else:
+            self._stats["catalog_misses"] += 1
+            try:
+                alimentos = await fat_secret_service.search_foods(consulta, max_results)
+            except Exception:
+                if not filas:
+                    raise
+                # FatSecret is down or the breaker is open: any local match beats an error
+                self._stats["catalog_fallbacks"] += 1
+                logger.warning(f"FatSecret search failed, serving {len(filas)} catalog results for '{consulta}'")
+                alimentos = [self._to_dict(fila) for fila in filas]
+            else:
+                await db.run_sync(self.guardar, alimentos)
+
+        # Foods that keep showing up in results rank higher in autocomplete
+        self.prefix_index.bump(str(alimento["id"]) for alimento in alimentos if alimento.get("id"))
+        return alimentos
+
+    async def autocompletar(
+        self,
+        fat_secret_service: FatSecretService,
+        prefijo: str,
+        limite: int = 10,
+        min_locales: int = 3
+    ) -> List[Dict[str, Any]]:
+        """
+        Suggest food names for a prefix from the in-memory index
+
+        FatSecret's foods.autocomplete is only called when the local index has
+        fewer than min_locales matches.
+
+        Args:
+            fat_secret_service: Shared FatSecret client
+            prefijo: Text typed by the user
+            limite: Maximum number of suggestions
+            min_locales: Local matches required to skip the upstream call
+
+        Returns:
+            Suggestions with "nombre" and, for catalog foods, "id"
+        """
+        sugerencias = self.prefix_index.search(prefijo, limite)
+        if len(sugerencias) >= min(min_locales, limite):
+            self._stats["autocomplete_local"] += 1
+            return sugerencias
+
+        self._stats["autocomplete_upstream"] += 1
+        try:
+            remotas = await fat_secret_service.autocomplete(prefijo, limite)
+        except Exception as e:
+            logger.warning(f"FatSecret autocomplete failed, using local suggestions only: {e}")
+            return sugerencias
+
+        vistos = {normalize_query(s["nombre"]) for s in sugerencias}
+        for nombre in remotas:
+            if len(sugerencias) >= limite:
+                break
+            if normalize_query(nombre) not in vistos:
+                vistos.add(normalize_query(nombre))
+                sugerencias.append({"id": None, "nombre": nombre})
+        return sugerencias
+
+    def cargar_indice(self, db: Session):
+        """Load every catalog food name into the autocomplete index (called at startup)"""
+        try:
+            filas = db.query(Alimento.id, Alimento.nombre).all()
+        except Exception as e:
+            logger.warning(f"Could not load food catalog into autocomplete index: {e}")
+            db.rollback()
+            return
+        self.prefix_index.add_many(filas)
+        logger.info(f"Autocomplete index loaded with {len(self.prefix_index)} foods")
+
+    async def obtener_detalles(
+        self,
+        db: AsyncSession,
+        fat_secret_service: FatSecretService,
+        ids: List[str],
+        max_concurrency: int = 8
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+        """
+        Get detailed information for many foods at once
+
+        Repeated ids are collapsed, foods already detailed in the catalog are served
+        without a network call and the rest are fetched concurrently from FatSecret.
+
+        Args:
+            db: Database session
+            fat_secret_service: Shared FatSecret client
+            ids: FatSecret food ids (may contain duplicates)
+            max_concurrency: Maximum simultaneous food.get calls
+
+        Returns:
+            Tuple of (food details in request order, errors keyed by food id)
+        """
+        unicos = list(dict.fromkeys(str(food_id).strip() for food_id in ids if str(food_id).strip()))
+
+        detalles = await db.run_sync(self.obtener, unicos)
+        self._stats["detail_catalog_hits"] += len(detalles)
+        pendientes = [food_id for food_id in unicos if food_id not in detalles]
+
+        errores: Dict[str, str] = {}
+        if pendientes:
+            semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+
+            async def fetch(food_id: str) -> Dict[str, Any]:
+                async with semaphore:
+                    return await fat_secret_service.get_food_details(food_id, priority=PRIORITY_ENRICHMENT)
+
+            resultados = await asyncio.gather(
+                *(fetch(food_id) for food_id in pendientes),
+                return_exceptions=True
+            )
+
+            nuevos = []
+            for food_id, resultado in zip(pendientes, resultados):
+                if isinstance(resultado, Exception):
+                    logger.warning(f"Error fetching FatSecret food {food_id}: {resultado}")
+                    errores[food_id] = str(resultado) or resultado.__class__.__name__
+                elif not resultado:
+                    errores[food_id] = "Alimento no encontrado"
+                else:
+                    detalles[food_id] = resultado
+                    nuevos.append(resultado)
+
+            self._stats["detail_fetches"] += len(pendientes)
+            self._stats["detail_errors"] += len(errores)
+            await db.run_sync(self.guardar_detalles, nuevos)
+
+            if errores:
+                # Serve stale details rather than an error when FatSecret is failing
+                obsoletos = await db.run_sync(self.obtener, list(errores), incluir_obsoletos=True)
+                for food_id, alimento in obsoletos.items():
+                    detalles[food_id] = alimento
+                    del errores[food_id]
+                self._stats["catalog_fallbacks"] += len(obsoletos)
+
+        return [detalles[food_id] for food_id in unicos if food_id in detalles], errores
+
+    def _buscar_filas(self, db: Session, consulta: str, limite: int) -> List[Alimento]:
+        """Return catalog rows matching a name using the dialect's text index, fresh or stale (empty list on error)"""
+        normalizada = normalize_query(consulta)
+        if not normalizada:
+            return []
+        try:
+            return self._search_query(db, normalizada).limit(limite).all()
+        except Exception as e:
+            logger.warning(f"Local food catalog search failed: {e}")
+            db.rollback()
+            return []
+
+    def _es_fresca(self, alimento: Alimento) -> bool:
+        """Check whether a catalog row is younger than max_age"""
+        actualizado = alimento.actualizado_en
+        if actualizado is None:
+            return False
+        if actualizado.tzinfo is None:
+            # SQLite returns naive datetimes (stored in UTC)
+            actualizado = actualizado.replace(tzinfo=timezone.utc)
+        return datetime.now(timezone.utc) - actualizado < self.max_age
+
+    def _revalidar(self, fat_secret_service: FatSecretService, consulta: str, max_results: int):
+        """Refresh stale catalog entries for a query in the background (one task per query)"""
+        clave = f"{normalize_query(consulta)}:{max_results}"
+        if clave in self._revalidations or fat_secret_service.breaker.is_open():
+            return
+
+        async def run():
+            try:
+                alimentos = await fat_secret_service.search_foods(
+                    consulta, max_results, refresh=True, priority=PRIORITY_BACKGROUND
+                )
+                # The request's session is closed by now; use a dedicated one
+                async with AsyncSessionLocal() as db:
+                    await db.run_sync(self.guardar, alimentos)
+                self._stats["catalog_revalidations"] += 1
+            except Exception as e:
+                logger.info(f"Background catalog refresh for '{consulta}' failed: {e}")
+            finally:
+                self._revalidations.pop(clave, None)
+
+        self._revalidations[clave] = asyncio.create_task(run())
+
+    def obtener(self, db: Session, ids: List[str], incluir_obsoletos: bool = False) -> Dict[str, Dict[str, Any]]:
+        """
+        Load fully detailed catalog entries by FatSecret id
+
+        Args:
+            db: Database session
+            ids: FatSecret food ids
+            incluir_obsoletos: Also return entries older than max_age
+
+        Returns:
+            Mapping of food id to food data (including servings)
+        """
+        if not ids:
+            return {}
+        try:
+            query = db.query(Alimento).filter(
+                Alimento.id.in_(ids),
+                Alimento.servings.isnot(None)
+            )
+            if not incluir_obsoletos:
+                query = query.filter(Alimento.actualizado_en >= datetime.now(timezone.utc) - self.max_age)
+            rows = query.all()
+        except Exception as e:
+            logger.warning(f"Local food catalog lookup failed: {e}")
+            db.rollback()
+            return {}
+        return {row.id: self._to_dict(row, con_servings=True) for row in rows}
+
+    def guardar(self, db: Session, alimentos: List[Dict[str, Any]]):
+        """
+        Upsert foods returned by FatSecretService.search_foods
+
+        Existing servings are preserved because search results do not include them.
+        """
+        self._upsert(db, alimentos, con_servings=False)
+
+    def guardar_detalles(self, db: Session, alimentos: List[Dict[str, Any]]):
+        """Upsert foods returned by FatSecretService.get_food_details (with servings)"""
+        self._upsert(db, alimentos, con_servings=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return catalog hit/miss counters"""
+        stats = dict(self._stats)
+        stats["indice_autocompletado"] = self.prefix_index.get_stats()
+        return stats
+
+    def _search_query(self, db: Session, normalizada: str):
+        """Build the name search query for the current database dialect"""
+        dialect = db.get_bind().dialect.name
+        query = db.query(Alimento)
+
+        if dialect == "sqlite" and self._fts_available(db):
+            match = " ".join(f'"{token.replace(chr(34), "")}"*' for token in normalizada.split())
+            return (
+                query.join(_alimentos_fts, _alimentos_fts.c.rowid == literal_column("alimentos.rowid"))
+                .filter(literal_column("alimentos_fts").op("MATCH")(match))
+                .order_by(_alimentos_fts.c.rank)
+            )
+
+        if dialect == "postgresql":
+            return (
+                query.filter(Alimento.nombre_normalizado.op("%")(normalizada) |
+                             Alimento.nombre_normalizado.contains(normalizada, autoescape=True))
+                .order_by(func.similarity(Alimento.nombre_normalizado, normalizada).desc())
+            )
+
+        # Portable fallback (e.g. tables created with init_db instead of migrations)
+        return query.filter(and_(*[
+            Alimento.nombre_normalizado.contains(token, autoescape=True)
+            for token in normalizada.split()
+        ])).order_by(func.length(Alimento.nombre_normalizado))
+
+    def _fts_available(self, db: Session) -> bool:
+        """Check once whether the FTS5 table created by the migration exists"""
+        if self._has_fts is None:
+            self._has_fts = db.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'alimentos_fts'"
+            )).first() is not None
+        return self._has_fts
+
+    def _upsert(self, db: Session, alimentos: List[Dict[str, Any]], con_servings: bool):
+        """Insert or update catalog rows in a single statement"""
+        now = datetime.now(timezone.utc)
+        rows: Dict[str, Dict[str, Any]] = {}
+        for alimento in alimentos:
+            if not alimento or not alimento.get("id") or not alimento.get("nombre"):
+                continue
+            row = {
+                "id": str(alimento["id"]),
+                "nombre": alimento["nombre"],
+                "nombre_normalizado": normalize_query(alimento["nombre"]),
+                "descripcion": alimento.get("descripcion"),
+                "tipo": alimento.get("tipo"),
+                "url": alimento.get("url"),
+                "calorias": alimento.get("calorias"),
+                "proteina": alimento.get("proteina"),
+                "carbohidratos": alimento.get("carbohidratos"),
+                "grasas": alimento.get("grasas"),
+                "actualizado_en": now,
+            }
+            if con_servings:
+                row["servings"] = alimento.get("servings") or []
+            rows[row["id"]] = row
+        if not rows:
+            return
+
+        update_fields = _SUMMARY_FIELDS + (("servings",) if con_servings else ())
+        dialect = db.get_bind().dialect.name
+        try:
+            if dialect in ("sqlite", "postgresql"):
+                insert = sqlite_insert if dialect == "sqlite" else pg_insert
+                stmt = insert(Alimento).values(list(rows.values()))
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[Alimento.id],
+                    set_={field: stmt.excluded[field] for field in update_fields}
+                )
+                db.execute(stmt)
+            else:
+                for row in rows.values():
+                    db.merge(Alimento(**row))
+            db.commit()
+        except Exception as e:
+            # The catalog is an optimization; never fail the request because of it
+            logger.warning(f"Failed to store foods in local catalog: {e}")
+            db.rollback()
+            return
+
+        for row in rows.values():
+            self.prefix_index.add(row["id"], row["nombre"])
+
+    @staticmethod
+    def _to_dict(alimento: Alimento, con_servings: bool = False) -> Dict[str, Any]:
+        """Convert a catalog row to the FatSecretService result format"""
+        data = {
+            "id": alimento.id,
+            "nombre": alimento.nombre,
+            "descripcion": alimento.descripcion or "",
+            "tipo": alimento.tipo or "",
+            "url": alimento.url or "",
+            "calorias": alimento.calorias,
+            "proteina": alimento.proteina,
+            "carbohidratos": alimento.carbohidratos,
+            "grasas": alimento.grasas,
+        }
+        if con_servings:
+            data["servings"] = alimento.servings or []
+        return data
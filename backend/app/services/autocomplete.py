@@ -0,0 +1,140 @@
+"""
+In-memory prefix index for food name autocompletion
+Sorted array + binary search over normalized names, ranked by popularity
+"""
+
+import bisect
+import heapq
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Iterable, List, Tuple
+
+from app.utils.text import normalize_query
+
+
+class PrefixIndex:
+    """
+    Prefix index over food names
+
+    Every word suffix of a name is indexed ("pechuga de pollo" is found by
+    "pec", "de p" and "pol"), so lookups are a bisect plus a short scan.
+    Recent results are memoized for result_ttl seconds because the same short
+    prefixes are typed over and over; popularity changes show up after the TTL.
+    """
+
+    def __init__(self, max_scan: int = 5000, result_cache_size: int = 1024, result_ttl: float = 30):
+        """
+        Args:
+            max_scan: Upper bound of keys inspected per lookup (keeps very short prefixes fast)
+            result_cache_size: Number of memoized (prefix, limit) results
+            result_ttl: Seconds a memoized result stays valid
+        """
+        self.max_scan = max_scan
+        self.result_cache_size = result_cache_size
+        self.result_ttl = result_ttl
+        self._keys: List[Tuple[str, str]] = []
+        self._names: Dict[str, Tuple[str, str]] = {}
+        self._popularity: Dict[str, int] = defaultdict(int)
+        self._results: "OrderedDict[Tuple[str, int], Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._stats: Dict[str, int] = {"lookups": 0, "memoized": 0}
+
+    @staticmethod
+    def _keys_for(food_id: str, normalized: str) -> List[Tuple[str, str]]:
+        """Build the (text, food_id) keys for every word suffix of a normalized name"""
+        words = normalized.split()
+        return [(" ".join(words[i:]), food_id) for i in range(len(words))]
+
+    def add(self, food_id: str, nombre: str):
+        """Add or rename a food incrementally"""
+        normalized = normalize_query(nombre)
+        if not normalized:
+            return
+        current = self._names.get(food_id)
+        if current is not None:
+            if current[1] == normalized:
+                return
+            self.remove(food_id)
+        self._names[food_id] = (nombre, normalized)
+        for key in self._keys_for(food_id, normalized):
+            bisect.insort(self._keys, key)
+        self._results.clear()
+
+    def add_many(self, foods: Iterable[Tuple[str, str]]):
+        """Bulk load (food_id, nombre) pairs with a single sort"""
+        for food_id, nombre in foods:
+            normalized = normalize_query(nombre or "")
+            if not normalized or food_id in self._names:
+                continue
+            self._names[food_id] = (nombre, normalized)
+            self._keys.extend(self._keys_for(food_id, normalized))
+        self._keys.sort()
+        self._results.clear()
+
+    def remove(self, food_id: str):
+        """Remove a food from the index"""
+        current = self._names.pop(food_id, None)
+        if current is None:
+            return
+        for key in self._keys_for(food_id, current[1]):
+            i = bisect.bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                del self._keys[i]
+        self._results.clear()
+
+    def bump(self, food_ids: Iterable[str], amount: int = 1):
+        """Increase the popularity of foods (e.g. each time they appear in search results)"""
+        for food_id in food_ids:
+            if food_id in self._names:
+                self._popularity[food_id] += amount
+
+    def search(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Return foods whose name (or any word in it) starts with prefix
+
+        Args:
+            prefix: Text typed by the user
+            limit: Maximum number of suggestions
+
+        Returns:
+            Suggestions ordered by popularity, then by shorter name
+        """
+        self._stats["lookups"] += 1
+        normalized = normalize_query(prefix)
+        if not normalized:
+            return []
+
+        now = time.monotonic()
+        memo = self._results.get((normalized, limit))
+        if memo is not None and memo[0] > now:
+            self._stats["memoized"] += 1
+            return list(memo[1])
+
+        matches = set()
+        start = bisect.bisect_left(self._keys, (normalized,))
+        for text, food_id in self._keys[start:start + self.max_scan]:
+            if not text.startswith(normalized):
+                break
+            matches.add(food_id)
+
+        ranked = heapq.nsmallest(
+            limit,
+            matches,
+            key=lambda food_id: (-self._popularity[food_id], len(self._names[food_id][1]), food_id)
+        )
+        result = [{"id": food_id, "nombre": self._names[food_id][0]} for food_id in ranked]
+
+        self._results[(normalized, limit)] = (now + self.result_ttl, result)
+        self._results.move_to_end((normalized, limit))
+        if len(self._results) > self.result_cache_size:
+            self._results.popitem(last=False)
+        return list(result)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return index size and lookup counters"""
+        stats = dict(self._stats)
+        stats["foods"] = len(self._names)
+        stats["keys"] = len(self._keys)
+        return stats
@@ -0,0 +1,260 @@
+"""
+In-memory TTL + LRU cache with an optional persistent SQLite tier
+Used to avoid repeated upstream calls for identical FatSecret searches
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Bounded in-memory cache with per-entry TTL and LRU eviction
+
+    Expired entries are kept for stale_ttl more seconds so they can be served
+    while a fresh value is fetched (stale-while-revalidate). Values are
+    returned as stored; callers must not mutate them.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 3600, stale_ttl: float = 0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._data: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._stats: Dict[str, int] = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value or None if missing or expired"""
+        value, fresh = self.get_entry(key, allow_stale=False)
+        return value if fresh else None
+
+    def get_entry(self, key: str, allow_stale: bool = True) -> Tuple[Optional[Any], bool]:
+        """
+        Look up a key, optionally accepting values inside the stale window
+
+        Returns:
+            Tuple of (value or None, whether the value is fresh)
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            self._stats["misses"] += 1
+            return None, False
+        value, expires_at = entry
+        now = time.time()
+        if now >= expires_at:
+            if now >= expires_at + self.stale_ttl:
+                del self._data[key]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None, False
+            if not allow_stale:
+                self._stats["misses"] += 1
+                return None, False
+            self._data.move_to_end(key)
+            self._stats["stale_hits"] += 1
+            return value, False
+        self._data.move_to_end(key)
+        self._stats["hits"] += 1
+        return value, True
+
+    def set(self, key: str, value: Any, expires_at: Optional[float] = None):
+        """Store a value, evicting the least recently used entries when full"""
+        if expires_at is None:
+            expires_at = time.time() + self.ttl
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def clear(self):
+        """Remove all entries"""
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction counters"""
+        stats = dict(self._stats)
+        stats["size"] = len(self._data)
+        stats["max_size"] = self.max_size
+        return stats
+
+
+class SQLiteCacheStore:
+    """
+    Persistent cache tier stored in a standalone SQLite file
+
+    Survives restarts and is shared by all workers on the host. Values must be
+    JSON serializable. Rows are only removed by prune(), which drops entries
+    past their stale window and then the least recently used ones beyond
+    max_entries.
+    """
+
+    def __init__(self, path: str, max_entries: int = 0):
+        """
+        Args:
+            path: SQLite file to use (created if missing)
+            max_entries: Rows kept by prune() (0 = unbounded)
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, "
+            "accessed_at REAL NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(cache_entries)")}
+        if "accessed_at" not in columns:
+            # Files created before the LRU bound: existing rows count as least recently used
+            self._conn.execute("ALTER TABLE cache_entries ADD COLUMN accessed_at REAL NOT NULL DEFAULT 0")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed_at ON cache_entries (accessed_at)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str, stale_ttl: float = 0) -> Optional[Tuple[Any, float]]:
+        """Return (value, expires_at) for an entry that expired less than stale_ttl seconds ago"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache_entries WHERE key = ? AND expires_at > ?",
+                (key, now - stale_ttl)
+            ).fetchone()
+            if row is not None:
+                # Only memory misses reach this tier, so recency updates stay rare
+                self._conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Any, expires_at: float):
+        """Insert or replace an entry"""
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, payload, expires_at, time.time())
+            )
+            self._conn.commit()
+
+    def prune(self, stale_ttl: float = 0) -> Tuple[int, int]:
+        """
+        Delete expired rows, then the least recently used rows beyond max_entries
+
+        Returns:
+            Tuple of (expired rows removed, rows evicted by the size bound)
+        """
+        expired = self.purge_expired(stale_ttl)
+        if not self.max_entries:
+            return expired, 0
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM cache_entries WHERE key IN ("
+                "SELECT key FROM cache_entries ORDER BY accessed_at ASC "
+                "LIMIT max((SELECT count(*) FROM cache_entries) - ?, 0))",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+        return expired, cursor.rowcount
+
+    def purge_expired(self, stale_ttl: float = 0) -> int:
+        """Delete rows past their stale window and return how many were removed"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM cache_entries WHERE expires_at <= ?", (time.time() - stale_ttl,)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        """Close the underlying connection"""
+        with self._lock:
+            self._conn.close()
+
+
+class TieredCache:
+    """
+    Memory cache in front of an optional persistent store
+
+    Lookups hit memory first; persistent hits are promoted back into memory.
+    The persistent tier is pruned on the first write and then every
+    prune_every writes.
+    """
+
+    def __init__(self, memory: TTLCache, store: Optional[SQLiteCacheStore] = None, prune_every: int = 100):
+        self.memory = memory
+        self.store = store
+        self.prune_every = max(prune_every, 1)
+        self._persistent_hits = 0
+        self._persistent_expired = 0
+        self._persistent_evictions = 0
+        self._writes_since_prune = self.prune_every
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Return a fresh cached value from memory or the persistent tier"""
+        value, fresh = await self.get_entry(key)
+        return value if fresh else None
+
+    async def get_entry(self, key: str) -> Tuple[Optional[Any], bool]:
+        """
+        Return (value, is_fresh), including values inside the stale window
+
+        Persistent hits are promoted back into memory.
+        """
+        value, fresh = self.memory.get_entry(key)
+        if fresh or self.store is None:
+            return value, fresh
+        entry = await asyncio.to_thread(self.store.get, key, self.memory.stale_ttl)
+        if entry is None:
+            return value, False
+        stored_value, expires_at = entry
+        self.memory.set(key, stored_value, expires_at)
+        self._persistent_hits += 1
+        return stored_value, time.time() < expires_at
+
+    async def set(self, key: str, value: Any):
+        """Store a value in every tier"""
+        expires_at = time.time() + self.memory.ttl
+        self.memory.set(key, value, expires_at)
+        if self.store is None:
+            return
+        await asyncio.to_thread(self.store.set, key, value, expires_at)
+        self._writes_since_prune += 1
+        if self._writes_since_prune >= self.prune_every:
+            self._writes_since_prune = 0
+            expired, evicted = await asyncio.to_thread(self.store.prune, self.memory.stale_ttl)
+            self._persistent_expired += expired
+            self._persistent_evictions += evicted
+
+    def close(self):
+        """Release the persistent tier"""
+        if self.store is not None:
+            self.store.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return combined counters for all tiers"""
+        stats = self.memory.get_stats()
+        stats["persistent"] = self.store is not None
+        stats["persistent_hits"] = self._persistent_hits
+        stats["persistent_expired"] = self._persistent_expired
+        stats["persistent_evictions"] = self._persistent_evictions
+        if self.store is not None:
+            stats["persistent_max_entries"] = self.store.max_entries
+        return stats
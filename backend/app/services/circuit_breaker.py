@@ -0,0 +1,104 @@
+"""
+Circuit breaker for upstream APIs
+Fails fast while an upstream service is down instead of waiting on timeouts
+"""
+
+import time
+from typing import Any, Dict
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit is open"""
+    pass
+
+
+class CircuitBreaker:
+    """
+    Classic three-state circuit breaker
+
+    - closed: calls go through; consecutive failures are counted
+    - open: calls are rejected until recovery_timeout has elapsed
+    - half_open: a single trial call decides whether to close or reopen
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30):
+        """
+        Args:
+            name: Upstream name used in error messages
+            failure_threshold: Consecutive failures that open the circuit
+            recovery_timeout: Seconds to wait before allowing a trial call
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._stats: Dict[str, int] = {
+            "times_opened": 0,
+            "rejected": 0,
+            "failures": 0,
+            "successes": 0,
+        }
+
+    @property
+    def state(self) -> str:
+        """Current state, moving from open to half_open once the timeout expires"""
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def is_open(self) -> bool:
+        """True while calls are being rejected"""
+        return self.state == self.OPEN
+
+    def before_call(self):
+        """
+        Check whether a call may proceed
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or a half-open trial is already running
+        """
+        state = self.state
+        if state == self.CLOSED:
+            return
+        if state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return
+        self._stats["rejected"] += 1
+        raise CircuitOpenError(f"{self.name} no está disponible temporalmente (circuito abierto)")
+
+    def record_success(self):
+        """Register a successful call and close the circuit"""
+        self._stats["successes"] += 1
+        self._failures = 0
+        self._state = self.CLOSED
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        """Register a failed call, opening the circuit when the threshold is reached"""
+        self._stats["failures"] += 1
+        self._failures += 1
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                self._stats["times_opened"] += 1
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def record_abandoned(self):
+        """Register a call that was cancelled before it produced an outcome"""
+        self._trial_in_flight = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return the breaker state and counters"""
+        stats = dict(self._stats)
+        stats["state"] = self.state
+        stats["consecutive_failures"] = self._failures
+        return stats
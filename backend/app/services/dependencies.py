@@ -3,12 +3,32 @@ Service dependencies for dependency injection
 Provides singleton instances of services to be used across the application
 """
 
+from datetime import timedelta
 from typing import Optional
+from app.config import settings
 from app.services.openai_service import OpenAIService
+from app.services.fat_secret_service import FatSecretService
+from app.services.alimento_service import AlimentoService
+from app.services.autocomplete import PrefixIndex
+from app.services.generation_cache import GenerationCache
+from app.services.job_queue import JobQueue
+from app.services.dieta_service import DietaService
 
 # Singleton instance of OpenAI service
 _openai_service: Optional[OpenAIService] = None
 
+# Singleton instance of FatSecret service (owns the pooled HTTP client)
+_fatsecret_service: Optional[FatSecretService] = None
+
+# Singleton instance of the local food catalog service
+_alimento_service: Optional[AlimentoService] = None
+
+# Singleton instance of the asynchronous generation job queue
+_job_queue: Optional[JobQueue] = None
+
+# Singleton instance of the diet service (local plan optimizer)
+_dieta_service: Optional[DietaService] = None
+
 
 def get_openai_service() -> OpenAIService:
     """
@@ -17,5 +37,87 @@ def get_openai_service() -> OpenAIService:
     """
     global _openai_service
     if _openai_service is None:
-        _openai_service = OpenAIService()
+        cache = None
+        if settings.OPENAI_CACHE_MAX_ENTRIES > 0:
+            cache = GenerationCache(
+                ttl=timedelta(seconds=settings.OPENAI_CACHE_TTL),
+                max_entries=settings.OPENAI_CACHE_MAX_ENTRIES
+            )
+        _openai_service = OpenAIService(cache=cache)
     return _openai_service
+
+
+async def close_openai_service():
+    """Close the shared generation service's provider (called on application shutdown)"""
+    global _openai_service
+    if _openai_service is not None:
+        await _openai_service.close()
+        _openai_service = None
+
+
+def get_fatsecret_service() -> FatSecretService:
+    """
+    Dependency for getting FatSecret service instance
+    Returns a process-wide instance so the connection pool and OAuth token are reused
+    """
+    global _fatsecret_service
+    if _fatsecret_service is None:
+        _fatsecret_service = FatSecretService()
+    return _fatsecret_service
+
+
+async def close_fatsecret_service():
+    """Close the shared FatSecret service (called on application shutdown)"""
+    global _fatsecret_service
+    if _fatsecret_service is not None:
+        await _fatsecret_service.close()
+        _fatsecret_service = None
+
+
+def get_alimento_service() -> AlimentoService:
+    """
+    Dependency for getting the local food catalog service instance
+    """
+    global _alimento_service
+    if _alimento_service is None:
+        _alimento_service = AlimentoService(
+            min_results=settings.FATSECRET_CATALOG_MIN_RESULTS,
+            max_age=timedelta(days=settings.FATSECRET_CATALOG_MAX_AGE_DAYS),
+            prefix_index=PrefixIndex()
+        )
+    return _alimento_service
+
+
+def get_dieta_service() -> DietaService:
+    """
+    Dependency for getting the diet service instance
+    """
+    global _dieta_service
+    if _dieta_service is None:
+        _dieta_service = DietaService()
+    return _dieta_service
+
+
+def get_job_queue() -> JobQueue:
+    """
+    Dependency for getting the generation job queue
+    Workers are started and stopped by the application lifespan
+    """
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(
+            workers=settings.JOBS_WORKERS,
+            max_queue=settings.JOBS_MAX_QUEUE,
+            retention=timedelta(hours=settings.JOBS_RESULT_RETENTION_HOURS),
+            stale_after=timedelta(seconds=settings.JOBS_STALE_AFTER),
+            max_attempts=settings.JOBS_MAX_ATTEMPTS
+        )
+    return _job_queue
+
+
+async def close_job_queue():
+    """Stop the job queue workers (called on application shutdown)"""
+    global _job_queue
+    if _job_queue is not None:
+        await _job_queue.stop()
+        _job_queue = None
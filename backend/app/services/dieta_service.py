@@ -2,12 +2,38 @@
 Dieta service - Business logic for diet management
 """
 
-from typing import List, Optional
+import bisect
+import itertools
+import math
+import random
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 
 class DietaService:
     """Service for managing diets"""
     
+    # Meals of an optimized day and the share of the daily calories each one should carry
+    MEAL_SHARES = (("desayuno", 0.25), ("almuerzo", 0.40), ("cena", 0.35))
+    # Servings of a recipe a meal may use (the recipe's macros are per serving)
+    SERVING_FACTORS = (0.5, 0.75, 1.0, 1.25, 1.5, 1.75, 2.0)
+    # Default macro split (fraction of calories) when no gram targets are given
+    DEFAULT_MACRO_SPLIT = {"proteina": 0.25, "carbohidratos": 0.50, "grasas": 0.25}
+    KCAL_PER_GRAM = {"proteina": 4.0, "carbohidratos": 4.0, "grasas": 9.0}
+    
+    # Objective weights: squared relative error of the day's calories and of each
+    # macro, deviation of each meal from its calorie share, and variety penalties
+    CALORIES_WEIGHT = 4.0
+    MACRO_WEIGHT = 1.0
+    MEAL_BALANCE_WEIGHT = 0.5
+    REPEAT_PREVIOUS_DAY_PENALTY = 0.05
+    USAGE_PENALTY = 0.01
+    # Passes of slot-by-slot improvement after the greedy start
+    IMPROVEMENT_PASSES = 3
+    # Best-ranked available recipes considered for each meal of a day
+    POOL_SIZE = 32
+    # Nothing chosen yet: the whole (relative) target is missing
+    _MISSING_SHARE = (-1.0, -1.0, -1.0, -1.0)
+    
     def __init__(self):
         pass
     
@@ -30,3 +56,301 @@ class DietaService:
         """Generate diet using AI"""
         # TODO: Implement AI logic with OpenAI
         pass
+    
+    def optimizar_dieta(
+        self,
+        recetas: Sequence[Any],
+        objetivo_calorias: int,
+        dias: int = 7,
+        proteina: Optional[float] = None,
+        carbohidratos: Optional[float] = None,
+        grasas: Optional[float] = None,
+        max_repeticiones: Optional[int] = None,
+        semilla: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Build a diet plan from saved recipes without calling OpenAI
+    
+        Each day gets a desayuno, almuerzo and cena, each one a recipe in
+        0.5-2 servings. Days are filled greedily (each meal closest to its share
+        of the targets) and then improved meal by meal on the day's objective:
+        squared relative error of calories and macros plus meal balance. A
+        recipe is never repeated within a day, is penalized if it was eaten the
+        day before and is used at most max_repeticiones times in the plan.
+    
+        Args:
+            recetas: Recipes (Receta rows or objects with id, nombre, calorias,
+                proteina, carbohidratos, grasas and ingredientes)
+            objetivo_calorias: Daily calorie target
+            dias: Number of days of the plan
+            proteina: Daily protein target in grams (default 25% of calories)
+            carbohidratos: Daily carbohydrate target in grams (default 50%)
+            grasas: Daily fat target in grams (default 25%)
+            max_repeticiones: Times a recipe may appear in the plan (default: the
+                fewest that lets every meal be filled, plus one)
+            semilla: Random seed (the same seed and recipes give the same plan)
+    
+        Returns:
+            Plan in the same format as generated diets (dias with meals and
+            totales, plus daily averages)
+    
+        Raises:
+            ValueError: If there are not enough recipes with calories
+        """
+        candidatas = [
+            receta for receta in recetas
+            if self._number(getattr(receta, "calorias", None)) > 0
+        ]
+        comidas_dia = len(self.MEAL_SHARES)
+        if len(candidatas) < comidas_dia:
+            raise ValueError(
+                f"Se necesitan al menos {comidas_dia} recetas con calorías para optimizar una dieta "
+                f"(tienes {len(candidatas)})"
+            )
+        if objetivo_calorias <= 0:
+            raise ValueError("El objetivo de calorías debe ser mayor que 0")
+    
+        objetivos = self._targets(objetivo_calorias, proteina, carbohidratos, grasas)
+        minimo = math.ceil(dias * comidas_dia / len(candidatas))
+        limite = max(max_repeticiones or minimo + 1, minimo)
+    
+        rng = random.Random(semilla)
+        # Shuffled so ties (e.g. recipes with identical macros) vary between seeds
+        rng.shuffle(candidatas)
+        vectores = [self._macros(receta) for receta in candidatas]
+    
+        # Macros relative to the daily targets, so a day adds up to (1, 1, 1, 1);
+        # and relative to each meal's share, used to start every day greedily
+        relativos = [tuple(v / t for v, t in zip(vector, objetivos)) for vector in vectores]
+        por_comida = [
+            [tuple(x / cuota for x in rel) for rel in relativos] for _, cuota in self.MEAL_SHARES
+        ]
+        # Recipes ranked once per meal by how well they fit that meal's share on their own;
+        # each day only searches the best few still available
+        ranking = []
+        for escalados in por_comida:
+            costes = [self._fit(b, self._MISSING_SHARE, 1.0, 0.0)[0] for b in escalados]
+            ranking.append(sorted(range(len(escalados)), key=costes.__getitem__))
+    
+        usos = [0] * len(candidatas)
+        anterior: Tuple[int, ...] = ()
+        plan_dias = []
+        for numero in range(1, dias + 1):
+            dia = self._optimize_day(relativos, por_comida, ranking, usos, set(anterior), limite)
+            for indice, _ in dia:
+                usos[indice] += 1
+            anterior = tuple(indice for indice, _ in dia)
+            plan_dias.append(self._build_day(numero, dia, candidatas, vectores))
+    
+        plan = {
+            "nombre": f"Plan optimizado de {dias} días ({objetivo_calorias} kcal)",
+            "descripcion": f"Plan de {dias} días construido con tus recetas guardadas",
+            "dias": plan_dias,
+        }
+        return self._add_plan_totals(plan)
+    
+    def _targets(
+        self,
+        calorias: float,
+        proteina: Optional[float],
+        carbohidratos: Optional[float],
+        grasas: Optional[float]
+    ) -> Tuple[float, float, float, float]:
+        """Daily (calories, protein, carbs, fat) targets, filling in the default split"""
+        gramos = {"proteina": proteina, "carbohidratos": carbohidratos, "grasas": grasas}
+        for macro, valor in gramos.items():
+            if not valor or valor <= 0:
+                gramos[macro] = calorias * self.DEFAULT_MACRO_SPLIT[macro] / self.KCAL_PER_GRAM[macro]
+        return float(calorias), gramos["proteina"], gramos["carbohidratos"], gramos["grasas"]
+    
+    def _macros(self, receta: Any) -> Tuple[float, float, float, float]:
+        return (
+            self._number(getattr(receta, "calorias", None)),
+            self._number(getattr(receta, "proteina", None)),
+            self._number(getattr(receta, "carbohidratos", None)),
+            self._number(getattr(receta, "grasas", None)),
+        )
+    
+    def _fit(
+        self,
+        b: Tuple[float, float, float, float],
+        a: Sequence[float],
+        cuota: float,
+        balance: float
+    ) -> Tuple[float, float]:
+        """
+        Best servings f of a recipe and the resulting cost
+    
+        The cost, wc * (a_c + f * b_c)^2 + wm * sum((a_k + f * b_k)^2) for the
+        macros plus balance * (f * b_c / cuota - 1)^2, is quadratic in f: its
+        minimum is solved directly and only the two allowed factors around it
+        are evaluated. a is what is still missing (already chosen meals minus
+        the target) and b the recipe, both relative to the target.
+        """
+        wc, wm = self.CALORIES_WEIGHT, self.MACRO_WEIGHT
+        ac, ap, ach, ag = a
+        bc, bp, bch, bg = b
+        bs = bc / cuota
+    
+        numerador = wc * ac * bc + wm * (ap * bp + ach * bch + ag * bg) - balance * bs
+        denominador = wc * bc * bc + wm * (bp * bp + bch * bch + bg * bg) + balance * bs * bs
+        optimo = -numerador / denominador if denominador else 1.0
+        factores = self.SERVING_FACTORS
+        pos = bisect.bisect_left(factores, optimo)
+    
+        mejor_coste, mejor_factor = math.inf, 1.0
+        for f in factores[max(pos - 1, 0):pos + 1]:
+            coste = (
+                wc * (ac + f * bc) ** 2
+                + wm * ((ap + f * bp) ** 2 + (ach + f * bch) ** 2 + (ag + f * bg) ** 2)
+                + balance * (f * bs - 1.0) ** 2
+            )
+            if coste < mejor_coste:
+                mejor_coste, mejor_factor = coste, f
+        return mejor_coste, mejor_factor
+    
+    def _optimize_day(
+        self,
+        relativos: List[Tuple[float, float, float, float]],
+        por_comida: List[List[Tuple[float, float, float, float]]],
+        ranking: List[List[int]],
+        usos: List[int],
+        anterior: set,
+        limite: int
+    ) -> List[Tuple[int, float]]:
+        """Choose (recipe index, servings) for each meal of one day"""
+        cuotas = [cuota for _, cuota in self.MEAL_SHARES]
+        pools = []
+        for orden in ranking:
+            pool = list(itertools.islice((i for i in orden if usos[i] < limite), self.POOL_SIZE))
+            if len(pool) < len(cuotas):
+                # Repetition limit too tight for what is left: relax it rather than fail
+                pool = orden[:self.POOL_SIZE]
+            pools.append(pool)
+    
+        def penalizacion(i: int) -> float:
+            return (
+                (self.REPEAT_PREVIOUS_DAY_PENALTY if i in anterior else 0.0)
+                + self.USAGE_PENALTY * usos[i]
+            )
+    
+        def elegir(
+            slot: int,
+            vectores: List[Tuple[float, float, float, float]],
+            a: Sequence[float],
+            balance: float,
+            excluidas: set
+        ) -> Tuple[float, Optional[Tuple[int, float]]]:
+            mejor, mejor_coste = None, math.inf
+            for i in pools[slot]:
+                if i in excluidas:
+                    continue
+                coste, f = self._fit(vectores[i], a, cuotas[slot], balance)
+                coste += penalizacion(i)
+                if coste < mejor_coste:
+                    mejor, mejor_coste = (i, f), coste
+            return mejor_coste, mejor
+    
+        # Greedy start: each meal closest to its share of every target
+        dia: List[Tuple[int, float]] = []
+        for slot in range(len(cuotas)):
+            # Every pool has at least one recipe per meal, so one is always left
+            _, eleccion = elegir(slot, por_comida[slot], self._MISSING_SHARE, 0.0, {i for i, _ in dia})
+            dia.append(eleccion)
+    
+        # Improve one meal at a time against the whole day's totals
+        for _ in range(self.IMPROVEMENT_PASSES):
+            mejorado = False
+            for slot in range(len(cuotas)):
+                a = [-1.0, -1.0, -1.0, -1.0]
+                for otro, (i, f) in enumerate(dia):
+                    if otro != slot:
+                        for k in range(4):
+                            a[k] += f * relativos[i][k]
+                i, f = dia[slot]
+                actual = (
+                    self._fit_cost(relativos[i], a, cuotas[slot], f)
+                    + penalizacion(i)
+                )
+                otras = {j for otro, (j, _) in enumerate(dia) if otro != slot}
+                coste, eleccion = elegir(slot, relativos, a, self.MEAL_BALANCE_WEIGHT, otras)
+                if eleccion is not None and coste < actual - 1e-12:
+                    dia[slot] = eleccion
+                    mejorado = True
+            if not mejorado:
+                break
+        return dia
+    
+    def _fit_cost(self, b: Sequence[float], a: Sequence[float], cuota: float, f: float) -> float:
+        """Day cost of the meal already chosen for a slot (same terms as _fit)"""
+        return (
+            self.CALORIES_WEIGHT * (a[0] + f * b[0]) ** 2
+            + self.MACRO_WEIGHT * sum((a[k] + f * b[k]) ** 2 for k in range(1, 4))
+            + self.MEAL_BALANCE_WEIGHT * (f * b[0] / cuota - 1.0) ** 2
+        )
+    
+    def _build_day(
+        self,
+        numero: int,
+        dia: List[Tuple[int, float]],
+        recetas: List[Any],
+        vectores: List[Tuple[float, float, float, float]]
+    ) -> Dict[str, Any]:
+        plan_dia: Dict[str, Any] = {"dia": numero}
+        totales = [0.0, 0.0, 0.0, 0.0]
+        for (comida, _), (i, f) in zip(self.MEAL_SHARES, dia):
+            receta = recetas[i]
+            c, p, ch, g = (f * valor for valor in vectores[i])
+            for k, valor in enumerate((c, p, ch, g)):
+                totales[k] += valor
+            plan_dia[comida] = {
+                "nombre": receta.nombre,
+                "receta_id": receta.id,
+                "porciones": f,
+                "calorias": round(c),
+                "proteina": round(p, 1),
+                "carbohidratos": round(ch, 1),
+                "grasas": round(g, 1),
+                "ingredientes": self._ingredient_names(getattr(receta, "ingredientes", None)),
+            }
+        plan_dia["snacks"] = []
+        plan_dia["totales"] = {
+            "calorias": round(totales[0]),
+            "proteina": round(totales[1], 1),
+            "carbohidratos": round(totales[2], 1),
+            "grasas": round(totales[3], 1),
+        }
+        return plan_dia
+    
+    @staticmethod
+    def _add_plan_totals(plan: Dict[str, Any]) -> Dict[str, Any]:
+        """Daily averages, with the same keys as generated plans"""
+        plan_dias = plan["dias"]
+        n = len(plan_dias) or 1
+        plan["calorias_totales"] = round(sum(dia["totales"]["calorias"] for dia in plan_dias) / n)
+        plan["proteina_total"] = round(sum(dia["totales"]["proteina"] for dia in plan_dias) / n, 1)
+        plan["carbohidratos_total"] = round(sum(dia["totales"]["carbohidratos"] for dia in plan_dias) / n, 1)
+        plan["grasas_total"] = round(sum(dia["totales"]["grasas"] for dia in plan_dias) / n, 1)
+        return plan
+    
+    @staticmethod
+    def _ingredient_names(ingredientes: Any) -> List[str]:
+        """Flatten a recipe's ingredientes JSON ({"items": [...]} or a list) to names"""
+        if isinstance(ingredientes, dict):
+            ingredientes = ingredientes.get("items") or []
+        if not isinstance(ingredientes, list):
+            return []
+        nombres = []
+        for item in ingredientes:
+            if isinstance(item, dict):
+                item = item.get("nombre")
+            if item:
+                nombres.append(str(item))
+        return nombres
+    
+    @staticmethod
+    def _number(value: Any) -> float:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
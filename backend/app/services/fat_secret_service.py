@@ -7,9 +7,20 @@ import base64
 import httpx
 import logging
 import asyncio
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Any, Tuple
 from app.config import settings
+from app.services.fatsecret_token import FatSecretTokenManager, FileTokenStore
+from app.services.cache import TTLCache, SQLiteCacheStore, TieredCache
+from app.services.singleflight import SingleFlight, canonical_key
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.rate_limiter import (
+    RateLimiter,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_BACKGROUND
+)
+from app.utils.text import normalize_query
 
 logger = logging.getLogger(__name__)
 
@@ -17,33 +28,126 @@ logger = logging.getLogger(__name__)
 class FatSecretService:
     """Service for interacting with FatSecret Platform API"""
     
-    # FatSecret API endpoints
+    # Default FatSecret API endpoints (overridable via settings)
     TOKEN_URL = "https://oauth.fatsecret.com/connect/token"
     API_BASE_URL = "https://platform.fatsecret.com/rest/server.api"
     
     def __init__(self):
         self.client_id = settings.FATSECRET_CLIENT_ID
         self.client_secret = settings.FATSECRET_CLIENT_SECRET
-        self.access_token: Optional[str] = None
-        self.token_expiry: Optional[datetime] = None
+        self.token_url = settings.FATSECRET_TOKEN_URL or self.TOKEN_URL
+        self.api_url = settings.FATSECRET_API_URL or self.API_BASE_URL
         self._http_client: Optional[httpx.AsyncClient] = None
+        token_store = (
+            FileTokenStore(settings.FATSECRET_TOKEN_STORE)
+            if settings.FATSECRET_TOKEN_STORE else None
+        )
+        self.token_manager = FatSecretTokenManager(
+            self._get_access_token,
+            store=token_store,
+            refresh_margin=settings.FATSECRET_TOKEN_REFRESH_MARGIN
+        )
+        self.search_cache = TieredCache(
+            TTLCache(
+                max_size=settings.FATSECRET_CACHE_MAX_ENTRIES,
+                ttl=settings.FATSECRET_CACHE_TTL,
+                stale_ttl=settings.FATSECRET_CACHE_STALE_TTL
+            ),
+            SQLiteCacheStore(
+                settings.FATSECRET_CACHE_PATH,
+                max_entries=settings.FATSECRET_CACHE_PERSISTENT_MAX_ENTRIES
+            ) if settings.FATSECRET_CACHE_PATH else None
+        )
+        self._inflight = SingleFlight()
+        self.breaker = CircuitBreaker(
+            "FatSecret",
+            failure_threshold=settings.FATSECRET_BREAKER_FAILURE_THRESHOLD,
+            recovery_timeout=settings.FATSECRET_BREAKER_RECOVERY_TIMEOUT
+        )
+        self.rate_limiter = RateLimiter(
+            rate_per_second=settings.FATSECRET_RATE_LIMIT_PER_SECOND,
+            burst=settings.FATSECRET_RATE_LIMIT_BURST,
+            daily_limit=settings.FATSECRET_DAILY_QUOTA
+        )
+        # Background stale-while-revalidate refreshes, keyed by cache key
+        self._revalidations: Dict[str, asyncio.Task] = {}
+        self._stats: Dict[str, int] = {
+            "requests": 0,
+            "connections_opened": 0,
+            "stale_served": 0,
+            "revalidations": 0,
+        }
+    
+    def _build_http_client(self) -> httpx.AsyncClient:
+        """Create a pooled HTTP client configured from settings"""
+        limits = httpx.Limits(
+            max_connections=settings.FATSECRET_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.FATSECRET_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.FATSECRET_KEEPALIVE_EXPIRY,
+        )
+        http2 = settings.FATSECRET_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("FATSECRET_HTTP2 enabled but 'h2' is not installed; falling back to HTTP/1.1")
+                http2 = False
+        return httpx.AsyncClient(
+            timeout=settings.FATSECRET_TIMEOUT,
+            limits=limits,
+            http2=http2,
+        )
     
     async def _get_http_client(self) -> httpx.AsyncClient:
         """Get or create the HTTP client instance"""
         if self._http_client is None or self._http_client.is_closed:
-            self._http_client = httpx.AsyncClient(timeout=30.0)
+            self._http_client = self._build_http_client()
         return self._http_client
     
     async def close(self):
-        """Close the HTTP client connection"""
+        """Stop background tasks and close the HTTP client connection"""
+        await self.token_manager.close()
+        for task in list(self._revalidations.values()):
+            task.cancel()
+        self._revalidations.clear()
+        self.search_cache.close()
         if self._http_client is not None:
             await self._http_client.aclose()
             self._http_client = None
     
-    async def _get_access_token(self) -> str:
+    async def _trace(self, event_name: str, info: Dict[str, Any]):
+        """httpcore trace hook used to count newly opened connections"""
+        if event_name == "connection.connect_tcp.complete":
+            self._stats["connections_opened"] += 1
+    
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request through the pooled client, recording connection usage"""
+        client = await self._get_http_client()
+        self._stats["requests"] += 1
+        return await client.request(method, url, extensions={"trace": self._trace}, **kwargs)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Return usage counters for monitoring
+        
+        Returns:
+            Dictionary with request, connection and token reuse counters
+        """
+        stats = dict(self._stats)
+        stats["connections_reused"] = max(stats["requests"] - stats["connections_opened"], 0)
+        stats.update(self.token_manager.get_stats())
+        stats["cache"] = self.search_cache.get_stats()
+        stats["coalescing"] = self._inflight.get_stats()
+        stats["circuit_breaker"] = self.breaker.get_stats()
+        stats["rate_limiter"] = self.rate_limiter.get_stats()
+        return stats
+    
+    async def _get_access_token(self) -> Tuple[str, int]:
         """
         Authenticate with FatSecret API using OAuth2 client credentials flow
-        Returns an access token for API requests
+        Returns an access token for API requests and its lifetime in seconds
+        
+        Called only through the token manager, which makes refreshes single-flight
         """
         # Create Basic Authentication header
         credentials = f"{self.client_id}:{self.client_secret}"
@@ -59,45 +163,97 @@ class FatSecretService:
             "scope": "basic"
         }
         
-        client = await self._get_http_client()
-        response = await client.post(
-            self.TOKEN_URL,
+        response = await self._send(
+            "POST",
+            self.token_url,
             headers=headers,
             data=data
         )
         response.raise_for_status()
         token_data = response.json()
         
-        # Store token and expiry time (subtract 60 seconds for safety margin)
-        expires_in = token_data.get("expires_in", 3600)
-        self.token_expiry = datetime.now() + timedelta(seconds=expires_in - 60)
-        
-        return token_data["access_token"]
-    
-    def _is_token_expired(self) -> bool:
-        """Check if the current token is expired or about to expire"""
-        if not self.access_token or not self.token_expiry:
-            return True
-        return datetime.now() >= self.token_expiry
+        expires_in = int(token_data.get("expires_in", 3600))
+        return token_data["access_token"], expires_in
     
-    async def _ensure_authenticated(self):
-        """Ensure we have a valid access token"""
-        if self._is_token_expired():
-            self.access_token = await self._get_access_token()
+    async def _ensure_authenticated(self) -> str:
+        """Ensure we have a valid access token and return it"""
+        return await self.token_manager.get_token()
     
     async def _make_api_request(
+        self,
+        params: Dict[str, Any],
+        max_retries: int = 3,
+        retry_delay: float = 1.0,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> Dict:
+        """
+        Make an API request, sharing the upstream call with identical in-flight requests
+        
+        Concurrent calls with the same params (e.g. a popular foods.search) wait on a
+        single upstream request instead of each calling FatSecret.
+        
+        Args:
+            params: Query parameters for the API request
+            max_retries: Maximum number of retry attempts
+            retry_delay: Delay between retries in seconds
+            priority: Rate limiter priority (see app.services.rate_limiter)
+        
+        Returns:
+            Response data as dictionary (shared between callers; do not mutate)
+        
+        Raises:
+            CircuitOpenError: If FatSecret is failing and the circuit breaker is open
+        """
+        self.breaker.before_call()
+        return await self._inflight.do(
+            canonical_key(params),
+            lambda: self._guarded_request(params, max_retries, retry_delay, priority)
+        )
+    
+    async def _guarded_request(
+        self,
+        params: Dict[str, Any],
+        max_retries: int,
+        retry_delay: float,
+        priority: int
+    ) -> Dict:
+        """Run the upstream request and report its outcome to the circuit breaker"""
+        try:
+            data = await self._request_with_retries(params, max_retries, retry_delay, priority)
+        except httpx.HTTPStatusError as e:
+            if 400 <= e.response.status_code < 500:
+                # Client errors mean FatSecret is up and answering
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            raise
+        except asyncio.CancelledError:
+            self.breaker.record_abandoned()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return data
+    
+    async def _request_with_retries(
         self, 
         params: Dict[str, Any], 
         max_retries: int = 3,
-        retry_delay: float = 1.0
+        retry_delay: float = 1.0,
+        priority: int = PRIORITY_INTERACTIVE
     ) -> Dict:
         """
-        Make an API request with retry logic
+        Make a single upstream API request with retry logic
+        
+        Every attempt first waits for the client-side rate limiter. A 429 pauses
+        the limiter for the Retry-After delay and the request is retried.
         
         Args:
             params: Query parameters for the API request
             max_retries: Maximum number of retry attempts
             retry_delay: Delay between retries in seconds
+            priority: Rate limiter priority
         
         Returns:
             Response data as dictionary
@@ -105,20 +261,21 @@ class FatSecretService:
         Raises:
             httpx.HTTPError: If all retry attempts fail
         """
-        await self._ensure_authenticated()
+        access_token = await self._ensure_authenticated()
         
         headers = {
-            "Authorization": f"Bearer {self.access_token}",
+            "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json"
         }
         
-        client = await self._get_http_client()
         last_exception = None
         
         for attempt in range(max_retries):
+            await self.rate_limiter.acquire(priority)
             try:
-                response = await client.get(
-                    self.API_BASE_URL,
+                response = await self._send(
+                    "GET",
+                    self.api_url,
                     headers=headers,
                     params=params
                 )
@@ -127,7 +284,18 @@ class FatSecretService:
                 
             except httpx.HTTPStatusError as e:
                 last_exception = e
-                # Don't retry on 4xx errors (client errors)
+                # Rate limited: back off for as long as FatSecret asks, then retry
+                if e.response.status_code == 429:
+                    wait = self._retry_after_seconds(e.response, default=retry_delay * (attempt + 1))
+                    logger.warning(
+                        f"FatSecret rate limit hit (attempt {attempt + 1}/{max_retries}), retrying in {wait:.1f}s"
+                    )
+                    if wait > settings.FATSECRET_MAX_RETRY_AFTER or attempt == max_retries - 1:
+                        raise
+                    self.rate_limiter.pause_for(wait)
+                    continue
+                
+                # Don't retry on other 4xx errors (client errors)
                 if 400 <= e.response.status_code < 500:
                     logger.error(f"Client error in FatSecret API: {e}")
                     raise
@@ -136,6 +304,9 @@ class FatSecretService:
                 logger.warning(
                     f"Server error in FatSecret API (attempt {attempt + 1}/{max_retries}): {e}"
                 )
+                if self.breaker.is_open():
+                    # Other requests already tripped the breaker; stop waiting on FatSecret
+                    break
                 if attempt < max_retries - 1:
                     await asyncio.sleep(retry_delay * (attempt + 1))  # Exponential backoff
                     
@@ -144,6 +315,8 @@ class FatSecretService:
                 logger.warning(
                     f"Request error in FatSecret API (attempt {attempt + 1}/{max_retries}): {e}"
                 )
+                if self.breaker.is_open():
+                    break
                 if attempt < max_retries - 1:
                     await asyncio.sleep(retry_delay * (attempt + 1))
         
@@ -151,17 +324,66 @@ class FatSecretService:
         logger.error(f"All retry attempts failed: {last_exception}")
         raise last_exception
     
-    async def search_foods(self, search_query: str, max_results: int = 20) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _retry_after_seconds(response: httpx.Response, default: float) -> float:
+        """Parse a Retry-After header given in seconds or as an HTTP date"""
+        value = response.headers.get("Retry-After")
+        if not value:
+            return default
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+            return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+        except (TypeError, ValueError):
+            return default
+    
+    async def search_foods(
+        self,
+        search_query: str,
+        max_results: int = 20,
+        refresh: bool = False,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> List[Dict[str, Any]]:
         """
         Search for foods in the FatSecret database
         
         Args:
             search_query: The food name to search for (e.g., "pollo", "chicken")
             max_results: Maximum number of results to return (default: 20)
+            refresh: Skip the cache and always query FatSecret (used to revalidate stale data)
+            priority: Rate limiter priority (background refreshes yield to user searches)
         
         Returns:
             List of food items with basic information (name, ID, and main macros)
         """
+        cache_key = self._search_cache_key(search_query, max_results)
+        if refresh:
+            return await self._fetch_search(search_query, max_results, cache_key, priority)
+        
+        cached, fresh = await self.search_cache.get_entry(cache_key)
+        if cached is not None:
+            if not fresh:
+                # Stale-while-revalidate: answer now, refresh in the background
+                self._stats["stale_served"] += 1
+                self._revalidate(
+                    cache_key,
+                    self._fetch_search(search_query, max_results, cache_key, PRIORITY_BACKGROUND)
+                )
+            return cached
+        
+        return await self._fetch_search(search_query, max_results, cache_key, priority)
+    
+    async def _fetch_search(
+        self,
+        search_query: str,
+        max_results: int,
+        cache_key: str,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> List[Dict[str, Any]]:
+        """Run foods.search upstream and store the formatted results in the cache"""
         params = {
             "method": "foods.search",
             "search_expression": search_query,
@@ -169,17 +391,78 @@ class FatSecretService:
             "max_results": max_results
         }
         
-        data = await self._make_api_request(params)
+        data = await self._make_api_request(params, priority=priority)
         
         # Parse and format the response
-        return self._format_search_results(data)
+        results = self._format_search_results(data)
+        await self.search_cache.set(cache_key, results)
+        return results
     
-    async def get_food_details(self, food_id: str) -> Dict[str, Any]:
+    async def autocomplete(self, expression: str, max_results: int = 10) -> List[str]:
+        """
+        Get food name suggestions for a partial expression
+        
+        Args:
+            expression: Partial text typed by the user
+            max_results: Maximum number of suggestions (FatSecret allows up to 10)
+        
+        Returns:
+            List of suggested food names
+        """
+        max_results = min(max_results, 10)
+        cache_key = f"foods.autocomplete:{normalize_query(expression)}:{max_results}"
+        cached = await self.search_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        params = {
+            "method": "foods.autocomplete",
+            "expression": expression,
+            "format": "json",
+            "max_results": max_results
+        }
+        
+        data = await self._make_api_request(params)
+        
+        suggestions = (data.get("suggestions") or {}).get("suggestion", [])
+        if isinstance(suggestions, str):
+            suggestions = [suggestions]
+        await self.search_cache.set(cache_key, suggestions)
+        return suggestions
+    
+    def _revalidate(self, cache_key: str, coro):
+        """
+        Refresh a stale cache entry in the background (at most one refresh per key)
+        
+        Skipped while the circuit breaker is open; the stale value keeps being served.
+        """
+        if cache_key in self._revalidations or self.breaker.is_open():
+            coro.close()
+            return
+        
+        async def run():
+            try:
+                await coro
+                self._stats["revalidations"] += 1
+            except Exception as e:
+                logger.info(f"Background revalidation of {cache_key} failed: {e}")
+            finally:
+                self._revalidations.pop(cache_key, None)
+        
+        self._revalidations[cache_key] = asyncio.create_task(run())
+    
+    @staticmethod
+    def _search_cache_key(search_query: str, max_results: int) -> str:
+        """Build the cache key for a search (normalized query + result limit)"""
+        return f"foods.search:{normalize_query(search_query)}:{max_results}"
+    
+    async def get_food_details(self, food_id: str, priority: int = PRIORITY_INTERACTIVE) -> Dict[str, Any]:
         """
         Get detailed information about a specific food item
         
         Args:
             food_id: The FatSecret food ID (obtained from search_foods)
+            priority: Rate limiter priority (batch enrichment uses a lower one)
         
         Returns:
             Detailed food information including all available nutritional data
@@ -202,7 +485,7 @@ class FatSecretService:
             "format": "json"
         }
         
-        data = await self._make_api_request(params)
+        data = await self._make_api_request(params, priority=priority)
         
         # Parse and format the detailed response
         return self._format_food_details(data)
@@ -0,0 +1,209 @@
+"""
+FatSecret OAuth2 token management
+Single-flight token refresh, background renewal before expiry and an optional
+file store so several uvicorn workers share one token
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Callable that performs the OAuth request and returns (access_token, expires_in seconds)
+TokenFetcher = Callable[[], Awaitable[Tuple[str, int]]]
+
+
+class FileTokenStore:
+    """
+    Token store backed by a JSON file shared between processes
+
+    An advisory lock file (``<path>.lock``) serializes refreshes across workers,
+    so only one process talks to the OAuth endpoint when the token expires.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+
+    def load(self) -> Optional[Tuple[str, float]]:
+        """Read (access_token, expires_at) from disk, or None if unavailable"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data["access_token"], float(data["expires_at"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, access_token: str, expires_at: float):
+        """Atomically write the token to disk"""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"access_token": access_token, "expires_at": expires_at}, f)
+        os.replace(tmp_path, self.path)
+
+    def acquire_lock(self) -> Optional[int]:
+        """Block until the cross-process refresh lock is held (returns the fd)"""
+        if fcntl is None:
+            return None
+        fd = os.open(self.lock_path, os.O_CREAT | os.O_RDWR, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    def release_lock(self, fd: Optional[int]):
+        """Release a lock obtained with acquire_lock"""
+        if fd is None:
+            return
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+class FatSecretTokenManager:
+    """
+    Keeps a valid FatSecret access token available for API requests
+
+    - Only one refresh runs per process at a time (asyncio.Lock)
+    - Tokens are renewed in the background ``refresh_margin`` seconds before expiry
+    - With a FileTokenStore, workers reuse a token refreshed by any other worker
+    """
+
+    # Tokens are treated as expired this many seconds before the real expiry
+    EXPIRY_SAFETY_MARGIN = 60
+    # Delay before retrying a failed background refresh
+    REFRESH_RETRY_DELAY = 30
+
+    def __init__(
+        self,
+        fetch_token: TokenFetcher,
+        store: Optional[FileTokenStore] = None,
+        refresh_margin: float = 300,
+        background_refresh: bool = True
+    ):
+        self._fetch_token = fetch_token
+        self._store = store
+        self._refresh_margin = refresh_margin
+        self._background_refresh = background_refresh
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.access_token: Optional[str] = None
+        self.expires_at: float = 0.0
+        self._stats: Dict[str, int] = {
+            "token_requests": 0,
+            "token_reuses": 0,
+            "token_store_hits": 0,
+            "background_refreshes": 0,
+        }
+
+    def is_valid(self) -> bool:
+        """Check whether the in-memory token can still be used"""
+        return bool(self.access_token) and time.time() < self.expires_at - self.EXPIRY_SAFETY_MARGIN
+
+    async def get_token(self) -> str:
+        """
+        Return a valid access token, refreshing it if needed
+
+        Concurrent callers waiting on an expired token share a single refresh.
+        """
+        if self.is_valid():
+            self._stats["token_reuses"] += 1
+            return self.access_token
+
+        async with self._lock:
+            # Another coroutine may have refreshed while we waited for the lock
+            if self.is_valid():
+                self._stats["token_reuses"] += 1
+                return self.access_token
+            await self._refresh(force=False)
+
+        self._schedule_background_refresh()
+        return self.access_token
+
+    async def _refresh(self, force: bool):
+        """
+        Obtain a new token (caller must hold self._lock)
+
+        Args:
+            force: Skip tokens from the shared store even if still valid
+        """
+        if self._store is None:
+            await self._fetch_and_set()
+            return
+
+        fd = await asyncio.to_thread(self._store.acquire_lock)
+        try:
+            stored = await asyncio.to_thread(self._store.load)
+            if stored and self._accept_stored(stored, force):
+                self.access_token, self.expires_at = stored
+                self._stats["token_store_hits"] += 1
+                return
+            await self._fetch_and_set()
+            await asyncio.to_thread(self._store.save, self.access_token, self.expires_at)
+        finally:
+            await asyncio.to_thread(self._store.release_lock, fd)
+
+    def _accept_stored(self, stored: Tuple[str, float], force: bool) -> bool:
+        """Decide whether a token read from the store can replace ours"""
+        token, expires_at = stored
+        now = time.time()
+        if now >= expires_at - self.EXPIRY_SAFETY_MARGIN:
+            return False
+        if force:
+            # A background refresh only accepts tokens newer than the one it is replacing
+            return token != self.access_token and now < expires_at - self._refresh_margin
+        return True
+
+    async def _fetch_and_set(self):
+        """Call the OAuth endpoint and store the result in memory"""
+        self._stats["token_requests"] += 1
+        access_token, expires_in = await self._fetch_token()
+        self.access_token = access_token
+        self.expires_at = time.time() + expires_in
+
+    def _schedule_background_refresh(self):
+        """Start the background renewal loop if enabled and not already running"""
+        if not self._background_refresh:
+            return
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        """Renew the token shortly before it expires, off the request path"""
+        while True:
+            delay = self.expires_at - self._refresh_margin - time.time()
+            await asyncio.sleep(max(delay, self.REFRESH_RETRY_DELAY))
+            try:
+                async with self._lock:
+                    await self._refresh(force=True)
+                self._stats["background_refreshes"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Background FatSecret token refresh failed: {e}")
+                if not self.is_valid():
+                    # Let the next request refresh synchronously
+                    return
+
+    async def close(self):
+        """Stop the background refresh task"""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return token usage counters"""
+        stats = dict(self._stats)
+        stats["token_cached"] = self.is_valid()
+        stats["token_expires_in"] = max(int(self.expires_at - time.time()), 0) if self.access_token else 0
+        return stats
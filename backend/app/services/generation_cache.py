@@ -0,0 +1,201 @@
+"""
+Persistent cache of OpenAI generations
+Identical diet/recipe requests are answered from the database instead of a new completion
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models.dieta import GeneracionCache
+from app.services.singleflight import canonical_key
+from app.utils.text import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize_value(value: Any) -> Any:
+    """Normalize request values so equivalent requests share a key"""
+    if isinstance(value, str):
+        return normalize_query(value)
+    if isinstance(value, (list, tuple, set)):
+        # Order and duplicates of preferences/restrictions do not change the answer
+        return sorted({normalize_query(str(item)) for item in value if item})
+    return value
+
+
+class GenerationCache:
+    """
+    Content-addressed cache of generated diets and recipes stored in the database
+
+    Keys are a sha256 of the normalized request, the model and the prompt
+    version, so changing a prompt template invalidates old entries. Entries
+    expire after ttl and the least recently used ones are evicted beyond
+    max_entries. Database work runs in a thread with its own session.
+
+    Lookups only read: hit counts and access times are buffered in memory
+    and written in the same transaction as the next store, right before
+    eviction needs them, so cache hits never wait for the write lock.
+    """
+
+    def __init__(
+        self,
+        ttl: timedelta,
+        max_entries: int,
+        session_factory: Callable[[], Session] = SessionLocal
+    ):
+        """
+        Args:
+            ttl: Lifetime of a cached generation
+            max_entries: Maximum number of rows kept (least recently used are evicted)
+            session_factory: Session factory (defaults to the application's SessionLocal)
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.session_factory = session_factory
+        # clave -> (hits not yet written, last access)
+        self._accesos: Dict[str, Tuple[int, datetime]] = {}
+        self._accesos_lock = threading.Lock()
+        self._stats: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "errors": 0,
+        }
+
+    @staticmethod
+    def make_key(tipo: str, parametros: Dict[str, Any], modelo: str, version_prompt: str) -> str:
+        """
+        Build the cache key for a generation request
+
+        Args:
+            tipo: Kind of generation ("dieta", "receta")
+            parametros: Request parameters (empty values are ignored)
+            modelo: OpenAI model used
+            version_prompt: Version of the prompt template
+        """
+        normalizados = {
+            nombre: _normalize_value(valor)
+            for nombre, valor in parametros.items()
+            if valor not in (None, "", [])
+        }
+        payload = canonical_key({
+            "tipo": tipo,
+            "modelo": modelo,
+            "version_prompt": version_prompt,
+            "parametros": normalizados,
+        })
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, clave: str) -> Optional[Dict[str, Any]]:
+        """Return a cached generation, or None on a miss (errors count as misses)"""
+        try:
+            respuesta = await asyncio.to_thread(self._get, clave)
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.warning(f"Generation cache lookup failed: {e}")
+            return None
+        self._stats["hits" if respuesta is not None else "misses"] += 1
+        return respuesta
+
+    async def set(self, clave: str, tipo: str, modelo: str, version_prompt: str, respuesta: Dict[str, Any]):
+        """Store a generation and evict expired / least recently used entries"""
+        try:
+            evicted = await asyncio.to_thread(self._set, clave, tipo, modelo, version_prompt, respuesta)
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.warning(f"Generation cache store failed: {e}")
+            return
+        self._stats["stores"] += 1
+        self._stats["evictions"] += evicted
+
+    def _get(self, clave: str) -> Optional[Dict[str, Any]]:
+        ahora = datetime.now(timezone.utc)
+        db = self.session_factory()
+        try:
+            fila = db.query(GeneracionCache.respuesta).filter(
+                GeneracionCache.clave == clave,
+                GeneracionCache.expira_en > ahora
+            ).first()
+        finally:
+            db.close()
+        if fila is None:
+            return None
+        with self._accesos_lock:
+            hits, _ = self._accesos.get(clave, (0, ahora))
+            self._accesos[clave] = (hits + 1, ahora)
+        return fila.respuesta
+
+    def _set(self, clave: str, tipo: str, modelo: str, version_prompt: str, respuesta: Dict[str, Any]) -> int:
+        ahora = datetime.now(timezone.utc)
+        db = self.session_factory()
+        try:
+            db.merge(GeneracionCache(
+                clave=clave,
+                tipo=tipo,
+                modelo=modelo,
+                version_prompt=version_prompt,
+                respuesta=respuesta,
+                hits=0,
+                expira_en=ahora + self.ttl,
+                ultimo_acceso=ahora
+            ))
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another worker stored the same generation first
+                db.rollback()
+                return 0
+            return self._evict(db, ahora)
+        finally:
+            db.close()
+
+    def _flush_accesos(self, db: Session):
+        """Write the buffered hit counts and access times (without committing)"""
+        with self._accesos_lock:
+            accesos, self._accesos = self._accesos, {}
+        for clave, (hits, ultimo_acceso) in accesos.items():
+            db.query(GeneracionCache).filter(GeneracionCache.clave == clave).update(
+                {
+                    GeneracionCache.hits: GeneracionCache.hits + hits,
+                    GeneracionCache.ultimo_acceso: ultimo_acceso,
+                },
+                synchronize_session=False
+            )
+
+    def _evict(self, db: Session, ahora: datetime) -> int:
+        """Write buffered accesses, then delete expired rows and the least recently used ones above max_entries"""
+        self._flush_accesos(db)
+        evicted = db.query(GeneracionCache).filter(
+            GeneracionCache.expira_en <= ahora
+        ).delete(synchronize_session=False)
+
+        exceso = db.query(GeneracionCache).count() - self.max_entries
+        if exceso > 0:
+            claves = [
+                fila.clave for fila in db.query(GeneracionCache.clave)
+                .order_by(GeneracionCache.ultimo_acceso.asc())
+                .limit(exceso)
+            ]
+            evicted += db.query(GeneracionCache).filter(
+                GeneracionCache.clave.in_(claves)
+            ).delete(synchronize_session=False)
+        db.commit()
+        return evicted
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return cache counters"""
+        stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        stats["ttl_seconds"] = int(self.ttl.total_seconds())
+        return stats
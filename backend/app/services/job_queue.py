@@ -0,0 +1,411 @@
+"""
+Asynchronous job queue for slow generation work
+Jobs are persisted in the trabajos table and processed by a pool of asyncio workers
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models.dieta import Trabajo
+from app.services.openai_scheduler import SchedulerRejectedError
+
+logger = logging.getLogger(__name__)
+
+# Job states
+PENDIENTE = "pendiente"
+EN_PROCESO = "en_proceso"
+COMPLETADO = "completado"
+ERROR = "error"
+
+# handler(user_id, parametros) -> JSON-serializable result
+JobHandler = Callable[[int, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+    pass
+
+
+class JobQueue:
+    """
+    Persistent job queue with an in-process worker pool
+
+    Submitting a job inserts a row and returns immediately; workers claim rows
+    with a conditional UPDATE, so several API processes can share the table
+    without running a job twice. Running jobs refresh a heartbeat; pending
+    jobs, and jobs whose heartbeat stopped because their process died, are
+    picked up again on startup and by a periodic sweep. A job orphaned
+    `max_attempts` times is marked as failed instead. Finished jobs are kept
+    for `retention` so clients can poll the result.
+
+    Jobs refused by the OpenAI scheduler (per-user limit or queue timeout) are
+    not failed: they go back to pending and are queued again after the delay
+    the scheduler suggests.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        max_queue: int = 100,
+        retention: timedelta = timedelta(hours=24),
+        stale_after: timedelta = timedelta(minutes=10),
+        sweep_interval: float = 60,
+        max_attempts: int = 3,
+        session_factory: Callable[[], Session] = SessionLocal
+    ):
+        """
+        Args:
+            workers: Number of concurrent jobs in this process
+            max_queue: Pending jobs accepted before submit() raises QueueFullError
+            retention: How long finished jobs (and their results) are kept
+            stale_after: In-progress jobs without a heartbeat for this long are assumed orphaned and retried
+            sweep_interval: Seconds between maintenance sweeps
+            max_attempts: Runs of a job that may be orphaned before it is marked as failed
+            session_factory: Session factory (defaults to the application's SessionLocal)
+        """
+        self.workers = max(workers, 1)
+        self.max_queue = max_queue
+        self.retention = retention
+        self.stale_after = stale_after
+        self.sweep_interval = sweep_interval
+        self.max_attempts = max(max_attempts, 1)
+        self.session_factory = session_factory
+        self._handlers: Dict[str, JobHandler] = {}
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        # Queued job ids in FIFO order (mirrors _queue, for dedup and position())
+        self._queued: "OrderedDict[str, None]" = OrderedDict()
+        # Claim token of each job a worker of this process is running
+        self._claims: Dict[str, str] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._running = 0
+        self._wait_times: Deque[float] = deque(maxlen=200)
+        self._run_times: Deque[float] = deque(maxlen=200)
+        self._stats: Dict[str, int] = {
+            "submitted": 0,
+            "rejected": 0,
+            "completed": 0,
+            "failed": 0,
+            "recovered": 0,
+            "abandoned": 0,
+            "deferred": 0,
+            "purged": 0,
+        }
+
+    def register(self, tipo: str, handler: JobHandler):
+        """Register the coroutine that processes jobs of a given type"""
+        self._handlers[tipo] = handler
+
+    async def start(self):
+        """Recover pending jobs from the database and start the workers"""
+        if self._tasks:
+            return
+        await self._sweep()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._maintenance_loop()))
+        self._tasks.append(asyncio.create_task(self._heartbeat_loop()))
+        logger.info(f"Job queue started with {self.workers} workers")
+
+    async def stop(self):
+        """Stop the workers; jobs they were running go back to pending"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, user_id: int, tipo: str, parametros: Dict[str, Any]) -> Trabajo:
+        """
+        Persist a new job and queue it
+
+        Raises:
+            QueueFullError: If max_queue jobs are already waiting
+            ValueError: If no handler is registered for tipo
+        """
+        if tipo not in self._handlers:
+            raise ValueError(f"Tipo de trabajo desconocido: {tipo}")
+        if self._queue.qsize() >= self.max_queue:
+            self._stats["rejected"] += 1
+            raise QueueFullError("La cola de generación está llena, inténtalo de nuevo en unos segundos")
+
+        trabajo = await asyncio.to_thread(self._insert, user_id, tipo, parametros)
+        self._stats["submitted"] += 1
+        self._enqueue(trabajo.id)
+        return trabajo
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based position of a job in this process' queue (None if not waiting here)"""
+        if job_id not in self._queued:
+            return None
+        for i, queued_id in enumerate(self._queued):
+            if queued_id == job_id:
+                return i + 1
+        return None
+
+    def _enqueue(self, job_id: str):
+        if job_id not in self._queued:
+            self._queued[job_id] = None
+            self._queue.put_nowait(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued.pop(job_id, None)
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job {job_id} crashed the worker loop: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        claimed = await asyncio.to_thread(self._claim, job_id)
+        if claimed is None:
+            # Already taken by another worker/process, or no longer pending
+            return
+        tipo, user_id, parametros, waited, token = claimed
+        self._wait_times.append(waited)
+
+        self._claims[job_id] = token
+        self._running += 1
+        started = time.monotonic()
+        try:
+            resultado = await self._handlers[tipo](user_id, parametros)
+        except asyncio.CancelledError:
+            # Shutting down: let the next start (here or in another process) retry it
+            await asyncio.to_thread(self._release, job_id, token)
+            raise
+        except SchedulerRejectedError as e:
+            # OpenAI is saturated or the user is at their limit: wait, don't fail
+            self._stats["deferred"] += 1
+            logger.info(f"Job {job_id} ({tipo}) deferred for {e.retry_after:.0f}s: {e}")
+            await asyncio.to_thread(self._release, job_id, token)
+            asyncio.get_running_loop().call_later(e.retry_after, self._enqueue, job_id)
+        except Exception as e:
+            self._stats["failed"] += 1
+            mensaje = str(e) if isinstance(e, ValueError) else f"Error al procesar el trabajo: {e}"
+            logger.error(f"Job {job_id} ({tipo}) failed: {e}")
+            await asyncio.to_thread(self._finish, job_id, token, ERROR, None, mensaje)
+        else:
+            self._stats["completed"] += 1
+            await asyncio.to_thread(self._finish, job_id, token, COMPLETADO, resultado, None)
+        finally:
+            self._claims.pop(job_id, None)
+            self._running -= 1
+            self._run_times.append(time.monotonic() - started)
+
+    async def _maintenance_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self._sweep()
+            except Exception as e:
+                logger.warning(f"Job queue sweep failed: {e}")
+
+    async def _heartbeat_loop(self):
+        # Several beats per stale_after, so a slow beat never looks like a dead worker
+        interval = max(self.stale_after.total_seconds() / 4, 1.0)
+        while True:
+            await asyncio.sleep(interval)
+            if not self._claims:
+                continue
+            try:
+                await asyncio.to_thread(self._heartbeat, dict(self._claims))
+            except Exception as e:
+                logger.warning(f"Job queue heartbeat failed: {e}")
+
+    async def _sweep(self):
+        """Purge expired jobs, reset orphaned ones and queue pending jobs not queued here"""
+        purged, recovered, abandoned, pending = await asyncio.to_thread(self._sweep_db, set(self._claims))
+        self._stats["purged"] += purged
+        self._stats["recovered"] += recovered
+        self._stats["abandoned"] += abandoned
+        for job_id in pending:
+            if self._queue.qsize() >= self.max_queue:
+                break
+            self._enqueue(job_id)
+
+    # Database operations (run in a worker thread, each with its own session)
+
+    def _insert(self, user_id: int, tipo: str, parametros: Dict[str, Any]) -> Trabajo:
+        db = self.session_factory()
+        try:
+            trabajo = Trabajo(
+                id=uuid.uuid4().hex,
+                user_id=user_id,
+                tipo=tipo,
+                estado=PENDIENTE,
+                parametros=parametros,
+                intentos=0,
+                creado_en=datetime.now(timezone.utc)
+            )
+            db.add(trabajo)
+            db.commit()
+            db.refresh(trabajo)
+            db.expunge(trabajo)
+            return trabajo
+        finally:
+            db.close()
+
+    def _claim(self, job_id: str) -> Optional[Tuple[str, int, Dict[str, Any], float, str]]:
+        """Atomically move a pending job to in-progress; returns None if someone else got it"""
+        ahora = datetime.now(timezone.utc)
+        token = uuid.uuid4().hex
+        db = self.session_factory()
+        try:
+            claimed = db.query(Trabajo).filter(
+                Trabajo.id == job_id,
+                Trabajo.estado == PENDIENTE
+            ).update(
+                {
+                    Trabajo.estado: EN_PROCESO,
+                    Trabajo.iniciado_en: ahora,
+                    Trabajo.latido_en: ahora,
+                    Trabajo.reclamado_por: token,
+                    Trabajo.intentos: Trabajo.intentos + 1,
+                },
+                synchronize_session=False
+            )
+            db.commit()
+            if not claimed:
+                return None
+            trabajo = db.query(Trabajo).filter(Trabajo.id == job_id).first()
+            creado_en = trabajo.creado_en
+            if creado_en.tzinfo is None:
+                creado_en = creado_en.replace(tzinfo=timezone.utc)
+            return (
+                trabajo.tipo, trabajo.user_id, trabajo.parametros, (ahora - creado_en).total_seconds(), token
+            )
+        finally:
+            db.close()
+
+    def _finish(
+        self,
+        job_id: str,
+        token: str,
+        estado: str,
+        resultado: Optional[Dict[str, Any]],
+        error: Optional[str]
+    ):
+        ahora = datetime.now(timezone.utc)
+        db = self.session_factory()
+        try:
+            updated = db.query(Trabajo).filter(
+                Trabajo.id == job_id,
+                Trabajo.estado == EN_PROCESO,
+                Trabajo.reclamado_por == token
+            ).update(
+                {
+                    Trabajo.estado: estado,
+                    Trabajo.resultado: resultado,
+                    Trabajo.error: error,
+                    Trabajo.terminado_en: ahora,
+                    Trabajo.expira_en: ahora + self.retention,
+                },
+                synchronize_session=False
+            )
+            db.commit()
+            if not updated:
+                logger.warning(f"Job {job_id} was reclaimed while running; its {estado} outcome was discarded")
+        finally:
+            db.close()
+
+    def _release(self, job_id: str, token: str):
+        """Put a claimed job back to pending without counting the run as an attempt"""
+        db = self.session_factory()
+        try:
+            db.query(Trabajo).filter(
+                Trabajo.id == job_id,
+                Trabajo.estado == EN_PROCESO,
+                Trabajo.reclamado_por == token
+            ).update(
+                {
+                    Trabajo.estado: PENDIENTE,
+                    Trabajo.reclamado_por: None,
+                    Trabajo.intentos: Trabajo.intentos - 1,
+                },
+                synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _heartbeat(self, claims: Dict[str, str]):
+        ahora = datetime.now(timezone.utc)
+        db = self.session_factory()
+        try:
+            for job_id, token in claims.items():
+                db.query(Trabajo).filter(
+                    Trabajo.id == job_id,
+                    Trabajo.reclamado_por == token
+                ).update({Trabajo.latido_en: ahora}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _sweep_db(self, running: set) -> Tuple[int, int, int, List[str]]:
+        ahora = datetime.now(timezone.utc)
+        db = self.session_factory()
+        try:
+            purged = db.query(Trabajo).filter(
+                Trabajo.expira_en.isnot(None),
+                Trabajo.expira_en <= ahora
+            ).delete(synchronize_session=False)
+            # Rows claimed before heartbeats existed have no latido_en
+            orphaned = [
+                Trabajo.estado == EN_PROCESO,
+                func.coalesce(Trabajo.latido_en, Trabajo.iniciado_en) <= ahora - self.stale_after,
+                Trabajo.id.notin_(list(running)),
+            ]
+            abandoned = db.query(Trabajo).filter(
+                *orphaned,
+                Trabajo.intentos >= self.max_attempts
+            ).update(
+                {
+                    Trabajo.estado: ERROR,
+                    Trabajo.error: f"El trabajo se interrumpió {self.max_attempts} veces sin terminar",
+                    Trabajo.terminado_en: ahora,
+                    Trabajo.expira_en: ahora + self.retention,
+                },
+                synchronize_session=False
+            )
+            recovered = db.query(Trabajo).filter(*orphaned).update(
+                {Trabajo.estado: PENDIENTE, Trabajo.reclamado_por: None},
+                synchronize_session=False
+            )
+            db.commit()
+            pending = [
+                fila.id for fila in db.query(Trabajo.id)
+                .filter(Trabajo.estado == PENDIENTE)
+                .order_by(Trabajo.creado_en.asc())
+                .limit(self.max_queue)
+            ]
+            return purged, recovered, abandoned, pending
+        finally:
+            db.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return queue depth, pool usage and latency counters"""
+        def avg(values: Deque[float]) -> float:
+            return round(sum(values) / len(values), 3) if values else 0.0
+
+        stats = dict(self._stats)
+        stats.update({
+            "workers": self.workers,
+            "running": self._running,
+            "queue_depth": self._queue.qsize(),
+            "max_queue": self.max_queue,
+            "avg_wait_seconds": avg(self._wait_times),
+            "max_wait_seconds": round(max(self._wait_times), 3) if self._wait_times else 0.0,
+            "avg_run_seconds": avg(self._run_times),
+        })
+        return stats
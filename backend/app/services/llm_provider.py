@@ -0,0 +1,480 @@
+"""
+Language model providers used by OpenAIService
+OpenAI, any OpenAI-compatible endpoint, and a deterministic local generator
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, AsyncGenerator, Deque, Dict, List, NamedTuple, Optional
+
+from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+
+class Completion(NamedTuple):
+    """Text of a finished chat completion and its token usage"""
+    content: str
+    finish_reason: Optional[str]
+    prompt_tokens: int
+    completion_tokens: int
+
+
+class StreamDelta(NamedTuple):
+    """One piece of a streamed chat completion"""
+    content: str
+    finish_reason: Optional[str]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token) where no usage is reported"""
+    return max(1, len(text) // 4)
+
+
+class LLMProvider(ABC):
+    """
+    Chat completion backend
+
+    Subclasses implement _complete and _open_stream; this class measures every
+    call the same way (latency, time to first token for streams, prompt and
+    completion tokens, errors) so providers can be compared side by side.
+    """
+
+    name = "base"
+
+    def __init__(self, model: str):
+        self.model = model
+        self._latencies: Deque[float] = deque(maxlen=500)
+        self._first_token: Deque[float] = deque(maxlen=500)
+        self._stats: Dict[str, int] = {
+            "requests": 0,
+            "streams": 0,
+            "errors": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+        }
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        json_mode: bool = False
+    ) -> Completion:
+        """Run a chat completion and return its full text"""
+        started = time.monotonic()
+        try:
+            completion = await self._complete(messages, max_tokens, temperature, json_mode)
+        except Exception:
+            self._stats["errors"] += 1
+            raise
+        self._stats["requests"] += 1
+        self._stats["prompt_tokens"] += completion.prompt_tokens
+        self._stats["completion_tokens"] += completion.completion_tokens
+        self._latencies.append(time.monotonic() - started)
+        return completion
+
+    async def open_stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        json_mode: bool = False
+    ) -> AsyncGenerator[StreamDelta, None]:
+        """
+        Start a streamed chat completion
+
+        Awaiting this sends the request (so the caller can retry failures to
+        connect); iterating the returned generator yields the deltas. Closing
+        the generator early releases the underlying connection.
+        """
+        started = time.monotonic()
+        try:
+            deltas = await self._open_stream(messages, max_tokens, temperature, json_mode)
+        except Exception:
+            self._stats["errors"] += 1
+            raise
+        return self._measure_stream(deltas, messages, started)
+
+    async def _measure_stream(
+        self,
+        deltas: AsyncGenerator[StreamDelta, None],
+        messages: List[Dict[str, str]],
+        started: float
+    ) -> AsyncGenerator[StreamDelta, None]:
+        # Streams do not report usage: tokens are estimated for every provider alike
+        text_length = 0
+        first = True
+        try:
+            async for delta in deltas:
+                if first and delta.content:
+                    self._first_token.append(time.monotonic() - started)
+                    first = False
+                text_length += len(delta.content)
+                yield delta
+        except Exception:
+            self._stats["errors"] += 1
+            raise
+        finally:
+            await deltas.aclose()
+        self._stats["streams"] += 1
+        self._stats["prompt_tokens"] += sum(estimate_tokens(m["content"]) for m in messages)
+        self._stats["completion_tokens"] += max(1, text_length // 4)
+        self._latencies.append(time.monotonic() - started)
+
+    @abstractmethod
+    async def _complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        json_mode: bool
+    ) -> Completion:
+        """Run one chat completion"""
+
+    @abstractmethod
+    async def _open_stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        json_mode: bool
+    ) -> AsyncGenerator[StreamDelta, None]:
+        """Start a streamed chat completion and return its deltas"""
+
+    async def close(self):
+        """Release the provider's connections (called on application shutdown)"""
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return call, token and latency counters"""
+        def ms(values: List[float]) -> float:
+            return round(sum(values) / len(values) * 1000, 1) if values else 0.0
+
+        latencies = sorted(self._latencies)
+        stats: Dict[str, Any] = {"provider": self.name, "model": self.model}
+        stats.update(self._stats)
+        stats.update({
+            "avg_latency_ms": ms(latencies),
+            "p95_latency_ms": round(latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000, 1) if latencies else 0.0,
+            "avg_first_token_ms": ms(list(self._first_token)),
+        })
+        return stats
+
+
+class OpenAIProvider(LLMProvider):
+    """Official OpenAI API (retries are left to the caller's scheduler)"""
+
+    name = "openai"
+
+    def __init__(self, api_key: str, model: str, base_url: Optional[str] = None):
+        """
+        Args:
+            api_key: OpenAI API key
+            model: Chat model name
+            base_url: Alternative endpoint (e.g. tools/upstream_stub.py); None uses the official API
+
+        Raises:
+            ValueError: If api_key is empty
+        """
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY no está configurado en las variables de entorno")
+        super().__init__(model)
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url or None,
+            # Retries (including 429 backoff) are handled by the scheduler
+            max_retries=0
+        )
+
+    def _request(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        json_mode: bool,
+        stream: bool
+    ):
+        extra: Dict[str, Any] = {}
+        if json_mode:
+            extra["response_format"] = {"type": "json_object"}
+        return self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=stream,
+            **extra
+        )
+
+    async def _complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        json_mode: bool
+    ) -> Completion:
+        response = await self._request(messages, max_tokens, temperature, json_mode, stream=False)
+        choice = response.choices[0]
+        content = choice.message.content or ""
+        usage = response.usage
+        return Completion(
+            content=content,
+            finish_reason=choice.finish_reason,
+            prompt_tokens=usage.prompt_tokens if usage else sum(estimate_tokens(m["content"]) for m in messages),
+            completion_tokens=usage.completion_tokens if usage else estimate_tokens(content)
+        )
+
+    async def _open_stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        json_mode: bool
+    ) -> AsyncGenerator[StreamDelta, None]:
+        stream = await self._request(messages, max_tokens, temperature, json_mode, stream=True)
+
+        async def deltas() -> AsyncGenerator[StreamDelta, None]:
+            try:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    choice = chunk.choices[0]
+                    yield StreamDelta(choice.delta.content or "", choice.finish_reason)
+            finally:
+                # Release the HTTP connection if the client went away mid-stream
+                await stream.response.aclose()
+
+        return deltas()
+
+    async def close(self):
+        await self.client.close()
+
+
+class OpenAICompatibleProvider(OpenAIProvider):
+    """
+    Any server speaking the OpenAI chat completions API (vLLM, Ollama, LM Studio...)
+
+    The API key is optional, since most self-hosted servers ignore it.
+    """
+
+    name = "openai_compatible"
+
+    def __init__(self, base_url: str, model: str, api_key: str = ""):
+        """
+        Raises:
+            ValueError: If base_url is empty
+        """
+        if not base_url:
+            raise ValueError("OPENAI_BASE_URL es obligatorio con LLM_PROVIDER=openai_compatible")
+        super().__init__(api_key or "sin-clave", model, base_url)
+
+
+# ---------------------------------------------------------------------------
+# Deterministic local generation
+# ---------------------------------------------------------------------------
+
+DISHES = {
+    "desayuno": ["Avena con frutas", "Tostadas integrales con aguacate", "Yogur con granola", "Tortilla de claras"],
+    "almuerzo": ["Pollo a la plancha con arroz", "Lentejas estofadas", "Salmón con quinoa", "Ensalada de garbanzos"],
+    "cena": ["Merluza al horno con verduras", "Crema de calabaza", "Pavo salteado", "Tortilla de espinacas"],
+    "snacks": ["Fruta fresca", "Puñado de nueces", "Yogur natural", "Hummus con zanahoria"],
+}
+MEAL_SPLIT = (("desayuno", 0.25), ("almuerzo", 0.35), ("cena", 0.30))
+LOCAL_DESCRIPTION = "Plan generado localmente, sin modelo de lenguaje"
+
+
+def stable_int(*parts: Any) -> int:
+    """Deterministic integer derived from the request (same input, same synthetic data)"""
+    digest = hashlib.md5("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return int(digest[:12], 16)
+
+
+def _synthetic_meal(nombre: str, calorias: float) -> Dict[str, Any]:
+    return {
+        "nombre": nombre,
+        "calorias": round(calorias),
+        "proteina": round(calorias * 0.25 / 4, 1),
+        "carbohidratos": round(calorias * 0.50 / 4, 1),
+        "grasas": round(calorias * 0.25 / 9, 1),
+    }
+
+
+def synthetic_diet(prompt: str) -> Dict[str, Any]:
+    """Answer the single-call, skeleton ("esquema") and chunk ("Crea los días X a Y") diet prompts"""
+    kcal_match = re.search(r"objetivo de (\d+) calorías", prompt)
+    objetivo = int(kcal_match.group(1)) if kcal_match else 2000
+    seed = stable_int(prompt)
+
+    skeleton_match = re.search(r"esquema de un plan de dieta de (\d+) días", prompt)
+    if skeleton_match:
+        dias = int(skeleton_match.group(1))
+        return {
+            "nombre": f"Plan de {dias} días ({objetivo} kcal)",
+            "descripcion": LOCAL_DESCRIPTION,
+            "temas": [DISHES["almuerzo"][(seed + d) % len(DISHES["almuerzo"])] for d in range(dias)],
+        }
+
+    chunk_match = re.search(r"Crea los días (\d+) a (\d+)", prompt)
+    if chunk_match:
+        primero, ultimo = int(chunk_match.group(1)), int(chunk_match.group(2))
+    else:
+        dias_match = re.search(r"para (\d+) días", prompt)
+        primero, ultimo = 1, int(dias_match.group(1)) if dias_match else 7
+
+    plan_dias = []
+    for dia in range(primero, ultimo + 1):
+        entry: Dict[str, Any] = {"dia": dia}
+        for i, (comida, share) in enumerate(MEAL_SPLIT):
+            options = DISHES[comida]
+            entry[comida] = _synthetic_meal(options[(seed + dia + i) % len(options)], objetivo * share)
+            entry[comida]["ingredientes"] = ["ingrediente 1", "ingrediente 2", "ingrediente 3"]
+        snack = DISHES["snacks"][(seed + dia) % len(DISHES["snacks"])]
+        entry["snacks"] = [_synthetic_meal(snack, objetivo * 0.10)]
+        plan_dias.append(entry)
+
+    if chunk_match:
+        return {"dias": plan_dias}
+    return {
+        "nombre": f"Plan de {ultimo} días ({objetivo} kcal)",
+        "descripcion": LOCAL_DESCRIPTION,
+        "dias": plan_dias,
+    }
+
+
+def synthetic_recipe(prompt: str) -> Dict[str, Any]:
+    """Answer the recipe prompt with the requested meal type, calories and ingredients"""
+    kcal_match = re.search(r"calorías: (\d+)", prompt)
+    tipo_match = re.search(r"receta saludable para ([^.\n]+)", prompt)
+    ingredientes_match = re.search(r"Ingredientes que deben incluirse: ([^\n]+)", prompt)
+    calorias = int(kcal_match.group(1)) if kcal_match else 450
+    tipo = tipo_match.group(1).strip() if tipo_match else "almuerzo"
+    ingredientes = (
+        [i.strip() for i in ingredientes_match.group(1).split(",")]
+        if ingredientes_match else ["pollo", "arroz", "verduras"]
+    )
+    return {
+        "nombre": f"Receta de {tipo} con {ingredientes[0]}",
+        "descripcion": "Receta generada localmente, sin modelo de lenguaje",
+        "ingredientes": [{"nombre": nombre, "cantidad": "100g"} for nombre in ingredientes],
+        "instrucciones": "1. Preparar los ingredientes. 2. Cocinar. 3. Servir.",
+        "tiempo_preparacion": "30 minutos",
+        "porciones": 2,
+        "calorias": calorias,
+        "proteina": round(calorias * 0.25 / 4, 1),
+        "carbohidratos": round(calorias * 0.50 / 4, 1),
+        "grasas": round(calorias * 0.25 / 9, 1),
+    }
+
+
+def synthetic_answer(messages: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> Completion:
+    """
+    Build the JSON answer the diet/recipe prompts of OpenAIService ask for
+
+    A conversation that carries a partial assistant answer (a continuation
+    request) gets only the missing remainder. Output longer than max_tokens is
+    cut off with finish_reason "length", as the real API does.
+    """
+    user_messages = [str(m.get("content", "")) for m in messages if m.get("role") == "user"]
+    # Continuation requests repeat the original prompt first; later user turns only ask to go on
+    prompt = user_messages[0] if user_messages else ""
+
+    if "plan de dieta" in prompt:
+        payload = synthetic_diet(prompt)
+    elif "receta" in prompt.lower():
+        payload = synthetic_recipe(prompt)
+    else:
+        payload = {"respuesta": "Respuesta generada localmente"}
+    content = json.dumps(payload, ensure_ascii=False)
+
+    partial = "".join(str(m.get("content", "")) for m in messages if m.get("role") == "assistant")
+    if partial and content.startswith(partial):
+        content = content[len(partial):]
+
+    finish_reason = "stop"
+    if max_tokens and estimate_tokens(content) > max_tokens:
+        content = content[:max_tokens * 4]
+        finish_reason = "length"
+
+    return Completion(
+        content=content,
+        finish_reason=finish_reason,
+        prompt_tokens=sum(estimate_tokens(str(m.get("content", ""))) for m in messages),
+        completion_tokens=estimate_tokens(content)
+    )
+
+
+class LocalProvider(LLMProvider):
+    """
+    Deterministic generator of schema-valid diets and recipes
+
+    Needs no API key or network, so the generation endpoints can run offline,
+    in staging and in load tests. The same prompt always gives the same answer.
+    """
+
+    name = "local"
+
+    # Characters per streamed delta
+    STREAM_CHUNK_CHARS = 16
+
+    def __init__(self, latency_ms: float = 0.0, model: str = "local"):
+        """
+        Args:
+            latency_ms: Simulated delay before each answer (0 = answer immediately)
+            model: Model name reported in stats and used in cache keys
+        """
+        super().__init__(model)
+        self.latency = max(latency_ms, 0.0) / 1000
+
+    async def _complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        json_mode: bool
+    ) -> Completion:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return synthetic_answer(messages, max_tokens)
+
+    async def _open_stream(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        json_mode: bool
+    ) -> AsyncGenerator[StreamDelta, None]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        completion = synthetic_answer(messages, max_tokens)
+
+        async def deltas() -> AsyncGenerator[StreamDelta, None]:
+            content = completion.content
+            for i in range(0, len(content), self.STREAM_CHUNK_CHARS):
+                yield StreamDelta(content[i:i + self.STREAM_CHUNK_CHARS], None)
+            yield StreamDelta("", completion.finish_reason)
+
+        return deltas()
+
+
+def create_provider(settings: Any) -> LLMProvider:
+    """
+    Build the provider selected by LLM_PROVIDER
+
+    Raises:
+        ValueError: If the provider name is unknown or its settings are incomplete
+    """
+    provider = (settings.LLM_PROVIDER or "openai").lower()
+    if provider == "openai":
+        return OpenAIProvider(settings.OPENAI_API_KEY, settings.OPENAI_MODEL, settings.OPENAI_BASE_URL)
+    if provider == "openai_compatible":
+        return OpenAICompatibleProvider(settings.OPENAI_BASE_URL, settings.OPENAI_MODEL, settings.OPENAI_API_KEY)
+    if provider == "local":
+        return LocalProvider(latency_ms=settings.LLM_LOCAL_LATENCY_MS)
+    raise ValueError(f"LLM_PROVIDER desconocido: {settings.LLM_PROVIDER} (usa openai, openai_compatible o local)")
@@ -0,0 +1,343 @@
+"""
+Concurrency governor for OpenAI calls
+Global in-flight cap with per-user weighted fair queueing and adaptive 429 backoff
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from openai import APIConnectionError, InternalServerError, RateLimitError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# User the current generation is scheduled for (set by FairScheduler.admit)
+current_user: ContextVar[str] = ContextVar("openai_current_user", default="anonimo")
+
+# "6m0s", "1.5s", "20ms" as used by the x-ratelimit-reset-* headers
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+class SchedulerRejectedError(Exception):
+    """Raised when a generation is refused (too many per user, or it waited too long for a slot)"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class FairScheduler:
+    """
+    Limit concurrent OpenAI calls and share them fairly between users
+
+    At most `limit` calls are in flight. Callers that cannot start immediately
+    wait in a heap ordered by start-time fair queueing tags: each call is
+    tagged max(virtual time, user's last finish tag) and advances the user's
+    tag by cost / weight, so a user firing many requests only gets their
+    share while others are waiting. Costs are the requested max_tokens.
+
+    A 429 halves the limit and pauses dispatching for as long as OpenAI asks
+    (Retry-After / x-ratelimit-reset-* headers); the limit then grows back by
+    one after every `limit` successful calls.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_requests_per_user: int = 4,
+        max_wait: float = 60.0,
+        weights: Optional[Dict[str, float]] = None,
+        max_retries: int = 3,
+        max_retry_after: float = 30.0
+    ):
+        """
+        Args:
+            max_concurrency: Maximum OpenAI calls in flight in this process
+            max_requests_per_user: Generations a single user may have running or queued (0 = unlimited)
+            max_wait: Seconds a call may wait for a slot before it is rejected (0 = no limit)
+            weights: Relative share per user key (default 1.0)
+            max_retries: Retries of a call answered with 429 / 5xx or a connection error
+            max_retry_after: Longest backoff (seconds) honored before giving up on a 429
+        """
+        self.max_concurrency = max(max_concurrency, 1)
+        self.limit = self.max_concurrency
+        self.max_requests_per_user = max_requests_per_user
+        self.max_wait = max_wait
+        self.weights = weights or {}
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self._active = 0
+        self._virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._requests: Dict[str, int] = {}
+        self._waiters: List[Tuple[float, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._resume_handle: Optional[asyncio.TimerHandle] = None
+        self._success_streak = 0
+        self._wait_times: Deque[float] = deque(maxlen=500)
+        self._stats: Dict[str, Any] = {
+            "calls": 0,
+            "queued": 0,
+            "rejected_user_limit": 0,
+            "rejected_timeout": 0,
+            "throttles": 0,
+            "retries": 0,
+            "max_wait_ms": 0.0,
+        }
+
+    @contextmanager
+    def admit(self, user_id: Optional[Any] = None) -> Iterator[str]:
+        """
+        Count a generation request against its user's limit
+
+        Also makes user_id the owner of every call made in the current context
+        (including tasks created from it, such as diet chunks).
+
+        Raises:
+            SchedulerRejectedError: If the user already has max_requests_per_user generations
+        """
+        user_key = str(user_id) if user_id is not None else current_user.get()
+        count = self._requests.get(user_key, 0)
+        if self.max_requests_per_user and count >= self.max_requests_per_user:
+            self._stats["rejected_user_limit"] += 1
+            raise SchedulerRejectedError(
+                "Tienes demasiadas generaciones en curso; espera a que terminen",
+                retry_after=5.0
+            )
+        token = current_user.set(user_key)
+        self._requests[user_key] = count + 1
+        try:
+            yield user_key
+        finally:
+            try:
+                current_user.reset(token)
+            except ValueError:
+                # Closed from another context (an abandoned streaming generator): nothing to restore
+                pass
+            remaining = self._requests.get(user_key, 1) - 1
+            if remaining > 0:
+                self._requests[user_key] = remaining
+            else:
+                self._requests.pop(user_key, None)
+
+    @asynccontextmanager
+    async def slot(self, cost: float, user_key: Optional[str] = None) -> AsyncIterator[None]:
+        """
+        Hold one of the concurrent call slots
+
+        Args:
+            cost: Expected size of the call (max_tokens)
+            user_key: Owner of the call (defaults to the user set by admit)
+
+        Raises:
+            SchedulerRejectedError: If no slot is free within max_wait
+        """
+        await self._acquire(user_key or current_user.get(), cost)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run fn (inside a slot), retrying when OpenAI answers 429
+
+        Connection errors and 5xx answers are retried with exponential backoff
+        too, since the OpenAI client's own retries are disabled.
+
+        Raises:
+            RateLimitError: If the retries are used up, the requested backoff is
+                too long, or the account has no quota left
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = await fn()
+            except RateLimitError as e:
+                wait = self.retry_after_seconds(e.response.headers, default=2.0 ** attempt)
+                self.throttle(wait)
+                if getattr(e, "code", None) == "insufficient_quota":
+                    # Billing problem, not a rate limit: retrying will not help
+                    raise
+                if attempt == self.max_retries or wait > self.max_retry_after:
+                    raise
+                logger.warning(
+                    f"OpenAI rate limit hit (attempt {attempt + 1}/{self.max_retries + 1}), retrying in {wait:.1f}s"
+                )
+                self._stats["retries"] += 1
+                await asyncio.sleep(wait)
+                continue
+            except (APIConnectionError, InternalServerError) as e:
+                if attempt == self.max_retries:
+                    raise
+                wait = min(0.5 * 2 ** attempt, self.max_retry_after)
+                logger.warning(
+                    f"OpenAI request failed (attempt {attempt + 1}/{self.max_retries + 1}), retrying in {wait:.1f}s: {e}"
+                )
+                self._stats["retries"] += 1
+                await asyncio.sleep(wait)
+                continue
+            self._record_success()
+            return result
+
+    async def _acquire(self, user_key: str, cost: float):
+        weight = self.weights.get(user_key, 1.0) or 1.0
+        start = max(self._virtual_time, self._last_finish.get(user_key, 0.0))
+        self._last_finish[user_key] = start + max(cost, 1.0) / weight
+        self._stats["calls"] += 1
+
+        if not self._waiters and self._can_dispatch():
+            self._virtual_time = start
+            self._active += 1
+            self._wait_times.append(0.0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (start, next(self._seq), future))
+        self._stats["queued"] += 1
+        self._schedule_resume()
+
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(future, timeout=self.max_wait or None)
+        except asyncio.TimeoutError:
+            self._stats["rejected_timeout"] += 1
+            raise SchedulerRejectedError(
+                "El servicio de generación está saturado, inténtalo de nuevo en unos segundos",
+                retry_after=max(self._paused_until - time.monotonic(), 5.0)
+            )
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted just as the caller went away
+                self._release()
+            raise
+        waited = time.monotonic() - started
+        self._wait_times.append(waited)
+        self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], round(waited * 1000, 1))
+
+    def _release(self):
+        self._active -= 1
+        self._dispatch()
+        if len(self._last_finish) > 1000 and not self._waiters:
+            # Users whose tag is behind the virtual time no longer affect ordering
+            self._last_finish = {
+                user: tag for user, tag in self._last_finish.items() if tag > self._virtual_time
+            }
+
+    def _can_dispatch(self) -> bool:
+        return self._active < self.limit and time.monotonic() >= self._paused_until
+
+    def _dispatch(self):
+        """Grant free slots to the waiters with the smallest start tags"""
+        while self._waiters and self._can_dispatch():
+            start, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                # Caller timed out or was cancelled while waiting
+                continue
+            self._virtual_time = start
+            self._active += 1
+            future.set_result(None)
+        self._schedule_resume()
+
+    def _schedule_resume(self):
+        """Dispatch again when a 429 pause ends"""
+        delay = self._paused_until - time.monotonic()
+        if delay <= 0 or not self._waiters or self._resume_handle is not None:
+            return
+
+        def resume():
+            self._resume_handle = None
+            self._dispatch()
+
+        self._resume_handle = asyncio.get_running_loop().call_later(delay, resume)
+
+    def throttle(self, seconds: float):
+        """Halve the concurrency limit and stop dispatching for a while (after a 429)"""
+        self._stats["throttles"] += 1
+        if time.monotonic() >= self._paused_until:
+            # Calls already in flight during a pause hit the same limit: halve only once
+            self.limit = max(1, self.limit // 2)
+        self._success_streak = 0
+        self._paused_until = max(self._paused_until, time.monotonic() + max(seconds, 0.0))
+        if self._resume_handle is not None:
+            self._resume_handle.cancel()
+            self._resume_handle = None
+        self._schedule_resume()
+
+    def _record_success(self):
+        """Grow the limit back by one after `limit` consecutive successful calls"""
+        if self.limit >= self.max_concurrency:
+            return
+        self._success_streak += 1
+        if self._success_streak >= self.limit:
+            self.limit += 1
+            self._success_streak = 0
+            self._dispatch()
+
+    @staticmethod
+    def _parse_duration(value: str) -> Optional[float]:
+        parts = _DURATION_PART.findall(value or "")
+        if not parts:
+            return None
+        return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+    @classmethod
+    def retry_after_seconds(cls, headers: Any, default: float) -> float:
+        """
+        Seconds to wait according to a 429 response's headers
+
+        Uses retry-after-ms / Retry-After when present, otherwise the reset time
+        of whichever x-ratelimit budget (requests or tokens) is exhausted.
+        """
+        value = headers.get("retry-after-ms")
+        if value:
+            try:
+                return max(float(value) / 1000, 0.0)
+            except ValueError:
+                pass
+
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return max(float(value), 0.0)
+            except ValueError:
+                pass
+            try:
+                retry_at = parsedate_to_datetime(value)
+                return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+            except (TypeError, ValueError):
+                pass
+
+        resets = []
+        for budget in ("requests", "tokens"):
+            if headers.get(f"x-ratelimit-remaining-{budget}") == "0":
+                reset = cls._parse_duration(headers.get(f"x-ratelimit-reset-{budget}", ""))
+                if reset is not None:
+                    resets.append(reset)
+        return max(resets) if resets else default
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return queue, wait time and throttling counters"""
+        stats = dict(self._stats)
+        stats.update({
+            "max_concurrency": self.max_concurrency,
+            "limit": self.limit,
+            "active": self._active,
+            "queue_depth": sum(1 for _, _, future in self._waiters if not future.done()),
+            "users_in_flight": len(self._requests),
+            "paused_seconds": round(max(self._paused_until - time.monotonic(), 0.0), 1),
+            "avg_wait_ms": round(sum(self._wait_times) / len(self._wait_times) * 1000, 1) if self._wait_times else 0.0,
+        })
+        return stats
@@ -2,36 +2,122 @@
 OpenAI Service - Integration with OpenAI API for generating diets and recipes
 """
 
+import asyncio
 import json
 import logging
-from typing import Dict, List, Optional, Any
-from openai import AsyncOpenAI
+from typing import Dict, List, Optional, Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Tuple
 from app.config import settings
+from app.services.generation_cache import GenerationCache
+from app.services.llm_provider import LLMProvider, StreamDelta, create_provider
+from app.services.openai_scheduler import FairScheduler
+from app.services.singleflight import SingleFlight
+from app.utils.json_stream import IncrementalJSONParser, ParseEvent
 
 logger = logging.getLogger(__name__)
 
 
 class OpenAIService:
-    """Service for interacting with OpenAI API"""
+    """Service for generating diets and recipes with a language model (OpenAI by default)"""
     
     # Configuration constants
-    DEFAULT_MODEL = "gpt-3.5-turbo"
     DEFAULT_TEMPERATURE = 0.7
+    # Output budgets (tokens) are sized from the expected answer and capped by the model
+    MODEL_MAX_OUTPUT_TOKENS = 4096
     DIET_MAX_TOKENS = 2000
-    RECIPE_MAX_TOKENS = 1500
+    # Name, description and totals of a plan, plus each day (meals with macros)
+    DIET_BASE_TOKENS = 250
+    DIET_TOKENS_PER_DAY = 350
+    # Skeleton: name, description and one short theme per day
+    DIET_SKELETON_BASE_TOKENS = 150
+    DIET_SKELETON_TOKENS_PER_DAY = 25
+    # Recipe: fixed fields plus one entry per requested ingredient
+    RECIPE_BASE_TOKENS = 700
+    RECIPE_TOKENS_PER_INGREDIENT = 40
+    RECIPE_CONTINUATION_TOKENS = 500
     
-    def __init__(self):
-        # Validate API key is configured
-        if not settings.OPENAI_API_KEY or settings.OPENAI_API_KEY == "":
-            raise ValueError("OPENAI_API_KEY no está configurado en las variables de entorno")
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+    # Times an answer cut off at max_tokens (finish_reason "length") is continued
+    # from where it stopped before giving up
+    MAX_CONTINUATIONS = 2
+    CONTINUATION_PROMPT = (
+        "Tu respuesta anterior se cortó por límite de longitud. Continúa el JSON exactamente "
+        "desde el último carácter escrito, sin repetir nada y sin añadir texto ni markdown."
+    )
+    # Characters of a continuation inspected for text the model repeated from the partial answer
+    CONTINUATION_OVERLAP_PROBE = 200
+    
+    # Meals of a plan day whose macros are added up into the server-computed totals
+    DIET_MEALS = ("desayuno", "almuerzo", "cena")
+    DIET_TOTAL_FIELDS = ("calorias", "proteina", "carbohidratos", "grasas")
+    
+    # Themes used when the skeleton call fails, so chunks still get distinct days
+    DEFAULT_DAY_THEMES = [
+        "pollo y verduras de temporada", "pescado blanco y cereales integrales",
+        "legumbres y hortalizas", "huevos y verduras", "pescado azul y ensaladas",
+        "pavo y tubérculos", "cocina mediterránea vegetal",
+    ]
+    
+    DIET_SYSTEM_PROMPT = "Eres un nutricionista experto que crea planes de dieta personalizados. Responde siempre en formato JSON válido."
+    RECIPE_SYSTEM_PROMPT = "Eres un chef experto que crea recetas saludables y deliciosas. Responde siempre en formato JSON válido."
+    
+    # JSON shape of one plan day, shared by the single-call and chunked prompts
+    DIET_DAY_SCHEMA = """    {
+      "dia": 1,
+      "desayuno": {"nombre": "...", "calorias": 0, "proteina": 0.0, "carbohidratos": 0.0, "grasas": 0.0, "ingredientes": ["..."]},
+      "almuerzo": {"nombre": "...", "calorias": 0, "proteina": 0.0, "carbohidratos": 0.0, "grasas": 0.0, "ingredientes": ["..."]},
+      "cena": {"nombre": "...", "calorias": 0, "proteina": 0.0, "carbohidratos": 0.0, "grasas": 0.0, "ingredientes": ["..."]},
+      "snacks": [{"nombre": "...", "calorias": 0, "proteina": 0.0, "carbohidratos": 0.0, "grasas": 0.0}]
+    }"""
+    
+    # Prompt template versions; bump them when a prompt changes so cached output is not reused
+    DIET_PROMPT_VERSION = "2"
+    RECIPE_PROMPT_VERSION = "1"
+    
+    def __init__(
+        self,
+        cache: Optional[GenerationCache] = None,
+        scheduler: Optional[FairScheduler] = None,
+        provider: Optional[LLMProvider] = None
+    ):
+        """
+        Args:
+            cache: Optional persistent cache of generations (identical requests skip OpenAI)
+            scheduler: Concurrency governor for OpenAI calls (built from settings if omitted)
+            provider: Chat completion backend (LLM_PROVIDER from settings if omitted)
+        
+        Raises:
+            ValueError: If the configured provider is missing settings (e.g. OPENAI_API_KEY)
+        """
+        self.provider = provider or create_provider(settings)
+        self.model = self.provider.model
+        self.cache = cache
+        # Ask for response_format json_object (disable for endpoints without JSON mode)
+        self.json_mode = settings.OPENAI_JSON_MODE
+        self.scheduler = scheduler or FairScheduler(
+            max_concurrency=settings.OPENAI_MAX_CONCURRENCY,
+            max_requests_per_user=settings.OPENAI_MAX_REQUESTS_PER_USER,
+            max_wait=settings.OPENAI_QUEUE_TIMEOUT,
+            weights=settings.OPENAI_USER_WEIGHTS,
+            max_retries=settings.OPENAI_MAX_RETRIES,
+            max_retry_after=settings.OPENAI_MAX_RETRY_AFTER
+        )
+        # Plans longer than this are generated as concurrent day-range chunks
+        self.diet_chunk_days = max(settings.OPENAI_DIET_CHUNK_DAYS, 1)
+        self.diet_max_parallel_chunks = max(settings.OPENAI_DIET_MAX_PARALLEL_CHUNKS, 1)
+        # Identical requests arriving while the first one is still generating share its result
+        self._inflight = SingleFlight()
+        self._stats: Dict[str, int] = {
+            "truncated": 0,
+            "continuations": 0,
+            "recovered": 0,
+        }
     
     async def generar_dieta(
         self,
         objetivo_calorias: int,
         preferencias: Optional[List[str]] = None,
         restricciones: Optional[List[str]] = None,
-        dias: int = 7
+        dias: int = 7,
+        user_id: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         Generate a personalized diet plan using OpenAI
@@ -41,33 +127,76 @@ class OpenAIService:
             preferencias: List of food preferences (e.g., ["vegetales", "pescado"])
             restricciones: List of dietary restrictions (e.g., ["sin gluten", "sin lactosa"])
             dias: Number of days for the diet plan (default: 7)
+            user_id: User the OpenAI calls are scheduled for (fair queueing)
         
         Returns:
-            Dictionary with diet plan including meals, ingredients, and nutritional info
+            Dictionary with diet plan including meals, ingredients, and nutritional info.
+            Totals (per day and the plan's daily averages) are computed from the meals.
+        
+        Raises:
+            SchedulerRejectedError: If the user has too many generations in flight
+                or no OpenAI slot frees up in time
         """
-        # Build the prompt
-        prompt = self._build_diet_prompt(objetivo_calorias, preferencias, restricciones, dias)
+        with self.scheduler.admit(user_id):
+            return await self._generate_cached(
+                "dieta",
+                self.DIET_PROMPT_VERSION,
+                {
+                    "objetivo_calorias": objetivo_calorias,
+                    "preferencias": preferencias,
+                    "restricciones": restricciones,
+                    "dias": dias
+                },
+                lambda: self._generate_diet(objetivo_calorias, preferencias, restricciones, dias)
+            )
+    
+    async def _generate_diet(
+        self,
+        objetivo_calorias: int,
+        preferencias: Optional[List[str]],
+        restricciones: Optional[List[str]],
+        dias: int
+    ) -> Dict[str, Any]:
+        """Generate a plan in one completion, or in parallel chunks when it is long"""
+        if dias <= self.diet_chunk_days:
+            prompt = self._build_diet_prompt(objetivo_calorias, preferencias, restricciones, dias)
+            plan = await self._request_diet(prompt, self._diet_max_tokens(dias), dias)
+        else:
+            skeleton, chunks = await self._start_diet_chunks(objetivo_calorias, preferencias, restricciones, dias)
+            try:
+                results = await asyncio.gather(*(task for _, task in chunks))
+            finally:
+                self._cancel_pending(chunks)
+            plan = {
+                "nombre": skeleton["nombre"],
+                "descripcion": skeleton["descripcion"],
+                "dias": [dia for chunk in results for dia in chunk],
+            }
+        return self._add_diet_totals(plan)
+    
+    async def _request_diet(
+        self,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        dias: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Call OpenAI for a diet plan (or part of one) and parse the JSON answer
         
+        Args:
+            prompt: Diet, skeleton or chunk prompt
+            max_tokens: Output budget (DIET_MAX_TOKENS if omitted)
+            dias: Days the answer should contain; sizes the continuation of a truncated answer
+        """
+        max_tokens = max_tokens or self.DIET_MAX_TOKENS
         try:
             # Call OpenAI API
-            response = await self.client.chat.completions.create(
-                model=self.DEFAULT_MODEL,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Eres un nutricionista experto que crea planes de dieta personalizados. Responde siempre en formato JSON válido."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=self.DEFAULT_TEMPERATURE,
-                max_tokens=self.DIET_MAX_TOKENS
+            content = await self._complete_json(
+                self.DIET_SYSTEM_PROMPT,
+                prompt,
+                max_tokens,
+                lambda partial: self._diet_remaining_tokens(partial, dias) if dias else max_tokens
             )
-            
-            # Parse the response
-            content = response.choices[0].message.content
             logger.info(f"OpenAI response received for diet generation")
             
             # Parse JSON from response
@@ -81,12 +210,292 @@ class OpenAIService:
             logger.error(f"Error generating diet with OpenAI: {e}")
             raise
     
+    def _create_completion(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        stream: bool = False
+    ) -> Awaitable[Any]:
+        """
+        Start a chat completion request (retried by the scheduler on 429 / 5xx)
+        
+        Resolves to a Completion, or with stream=True to an async iterator of
+        StreamDelta. JSON mode is only requested for a fresh answer: a
+        continuation is a fragment of a JSON document, not a complete object.
+        """
+        json_mode = self.json_mode and messages[-1]["role"] == "user" and len(messages) == 2
+        call = self.provider.open_stream if stream else self.provider.complete
+        return self.scheduler.call(
+            lambda: call(messages, max_tokens, self.DEFAULT_TEMPERATURE, json_mode)
+        )
+    
+    async def _complete_json(
+        self,
+        system_prompt: str,
+        prompt: str,
+        max_tokens: int,
+        remaining_tokens: Callable[[str], int]
+    ) -> str:
+        """
+        Get the full text of a JSON answer, continuing it if it is cut off
+        
+        When finish_reason is "length" the partial answer is sent back as an
+        assistant turn and the model is asked for the rest only, with a budget
+        from remaining_tokens(partial), instead of regenerating everything.
+        
+        Raises:
+            ValueError: If the answer is still truncated after MAX_CONTINUATIONS
+        """
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+        async with self.scheduler.slot(max_tokens):
+            response = await self._create_completion(messages, max_tokens)
+            content = response.content
+            if response.finish_reason == "length":
+                self._stats["truncated"] += 1
+            
+            for continuation in range(1, self.MAX_CONTINUATIONS + 1):
+                if response.finish_reason != "length":
+                    break
+                budget = remaining_tokens(content)
+                self._note_continuation(continuation, len(content), budget)
+                response = await self._create_completion(self._continuation_messages(messages, content), budget)
+                content += self._strip_overlap(content, response.content)
+                if response.finish_reason != "length":
+                    self._stats["recovered"] += 1
+        
+        if response.finish_reason == "length":
+            logger.error(f"OpenAI answer still truncated after {self.MAX_CONTINUATIONS} continuations")
+            raise ValueError("La respuesta de OpenAI quedó incompleta por su longitud")
+        return content
+    
+    def _note_continuation(self, continuation: int, partial_length: int, budget: int):
+        self._stats["continuations"] += 1
+        logger.warning(
+            f"OpenAI answer cut off at max_tokens after {partial_length} chars, "
+            f"requesting the remainder ({continuation}/{self.MAX_CONTINUATIONS}, {budget} tokens)"
+        )
+    
+    def _continuation_messages(self, messages: List[Dict[str, str]], partial: str) -> List[Dict[str, str]]:
+        """Conversation asking the model to go on from a truncated answer"""
+        return messages[:2] + [
+            {"role": "assistant", "content": partial},
+            {"role": "user", "content": self.CONTINUATION_PROMPT}
+        ]
+    
+    @classmethod
+    def _strip_overlap(cls, previous: str, continuation: str) -> str:
+        """
+        Return the part of a continuation to append to the truncated text
+        
+        Drops a leading markdown fence. If the model repeated the end of the
+        partial answer (10+ characters), the repetition is dropped too, but only
+        when that is what makes the joined text parse: plan JSON is repetitive
+        enough that a suffix/prefix match alone is not proof of a repeat.
+        """
+        stripped = continuation.lstrip()
+        if stripped.startswith("```"):
+            continuation = stripped.split("\n", 1)[1] if "\n" in stripped else ""
+        
+        longest = min(len(previous), len(continuation), cls.CONTINUATION_OVERLAP_PROBE)
+        candidates = [continuation] + [
+            continuation[size:] for size in range(longest, 9, -1)
+            if previous.endswith(continuation[:size])
+        ]
+        for candidate in candidates:
+            try:
+                # Plan days and recipe ingredients are checked element by element
+                IncrementalJSONParser(stream_arrays=("dias", "ingredientes")).feed(previous + candidate)
+            except json.JSONDecodeError:
+                continue
+            return candidate
+        return continuation
+    
+    def _diet_max_tokens(self, dias: int) -> int:
+        """Output budget for a completion that writes this many plan days"""
+        return min(self.DIET_BASE_TOKENS + self.DIET_TOKENS_PER_DAY * dias, self.MODEL_MAX_OUTPUT_TOKENS)
+    
+    def _diet_remaining_tokens(self, partial: str, dias: int) -> int:
+        """Budget for the rest of a truncated answer that should contain dias days"""
+        parser = IncrementalJSONParser(stream_arrays=("dias",))
+        try:
+            terminados = sum(1 for event in parser.feed(partial) if event.kind == "item")
+        except json.JSONDecodeError:
+            terminados = 0
+        return self._diet_max_tokens(max(dias - terminados, 1))
+    
+    def _diet_skeleton_max_tokens(self, dias: int) -> int:
+        """Output budget for the plan skeleton"""
+        return min(
+            self.DIET_SKELETON_BASE_TOKENS + self.DIET_SKELETON_TOKENS_PER_DAY * dias,
+            self.MODEL_MAX_OUTPUT_TOKENS
+        )
+    
+    def _recipe_max_tokens(self, ingredientes_deseados: Optional[List[str]]) -> int:
+        """Output budget for a recipe"""
+        n = len(ingredientes_deseados or [])
+        return min(self.RECIPE_BASE_TOKENS + self.RECIPE_TOKENS_PER_INGREDIENT * n, self.MODEL_MAX_OUTPUT_TOKENS)
+    
+    @staticmethod
+    def _split_days(dias: int, chunk_days: int) -> List[Tuple[int, int]]:
+        """Split 1..dias into balanced inclusive ranges of at most chunk_days"""
+        n_chunks = -(-dias // chunk_days)
+        base, extra = divmod(dias, n_chunks)
+        ranges = []
+        inicio = 1
+        for i in range(n_chunks):
+            fin = inicio + base + (1 if i < extra else 0) - 1
+            ranges.append((inicio, fin))
+            inicio = fin + 1
+        return ranges
+    
+    async def _start_diet_chunks(
+        self,
+        objetivo_calorias: int,
+        preferencias: Optional[List[str]],
+        restricciones: Optional[List[str]],
+        dias: int
+    ) -> Tuple[Dict[str, Any], List[Tuple[int, "asyncio.Task[List[Dict[str, Any]]]"]]]:
+        """
+        Build the plan skeleton and launch one task per day range
+        
+        Returns:
+            (skeleton, [(first_day, task), ...]) with tasks in day order; at most
+            diet_max_parallel_chunks of them call OpenAI at the same time
+        """
+        skeleton = await self._request_diet_skeleton(objetivo_calorias, preferencias, restricciones, dias)
+        semaphore = asyncio.Semaphore(self.diet_max_parallel_chunks)
+        
+        async def run(inicio: int, fin: int) -> List[Dict[str, Any]]:
+            async with semaphore:
+                return await self._request_diet_chunk(
+                    objetivo_calorias, preferencias, restricciones, dias, skeleton, inicio, fin
+                )
+        
+        ranges = self._split_days(dias, self.diet_chunk_days)
+        logger.info(f"Generating {dias}-day diet in {len(ranges)} chunks")
+        return skeleton, [(inicio, asyncio.create_task(run(inicio, fin))) for inicio, fin in ranges]
+    
+    @staticmethod
+    def _cancel_pending(chunks: List[Tuple[int, asyncio.Task]]):
+        """Cancel chunk tasks that are still running (e.g. after another chunk failed)"""
+        for _, task in chunks:
+            if not task.done():
+                task.cancel()
+    
+    async def _request_diet_skeleton(
+        self,
+        objetivo_calorias: int,
+        preferencias: Optional[List[str]],
+        restricciones: Optional[List[str]],
+        dias: int
+    ) -> Dict[str, Any]:
+        """
+        Ask for the plan name, description and one theme per day
+        
+        Falls back to a default skeleton if the call fails, since the chunks can
+        still be generated without it.
+        """
+        prompt = self._build_diet_skeleton_prompt(objetivo_calorias, preferencias, restricciones, dias)
+        try:
+            skeleton = await self._request_diet(prompt, self._diet_skeleton_max_tokens(dias))
+        except Exception as e:
+            logger.warning(f"Diet skeleton generation failed, using default themes: {e}")
+            skeleton = {}
+        
+        temas = [str(tema) for tema in skeleton.get("temas") or [] if tema]
+        for i in range(len(temas), dias):
+            temas.append(self.DEFAULT_DAY_THEMES[i % len(self.DEFAULT_DAY_THEMES)])
+        return {
+            "nombre": skeleton.get("nombre") or f"Plan de {dias} días",
+            "descripcion": skeleton.get("descripcion") or f"Plan personalizado de {objetivo_calorias} kcal/día",
+            "temas": temas[:dias],
+        }
+    
+    async def _request_diet_chunk(
+        self,
+        objetivo_calorias: int,
+        preferencias: Optional[List[str]],
+        restricciones: Optional[List[str]],
+        dias: int,
+        skeleton: Dict[str, Any],
+        inicio: int,
+        fin: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Generate days inicio..fin of a plan
+        
+        Raises:
+            ValueError: If the answer does not contain exactly the requested days
+        """
+        prompt = self._build_diet_chunk_prompt(
+            objetivo_calorias, preferencias, restricciones, dias, skeleton, inicio, fin
+        )
+        data = await self._request_diet(prompt, self._diet_max_tokens(fin - inicio + 1), fin - inicio + 1)
+        
+        plan_dias = data.get("dias")
+        if not isinstance(plan_dias, list) or len(plan_dias) != fin - inicio + 1:
+            logger.error(f"Diet chunk {inicio}-{fin} returned {len(plan_dias or [])} days")
+            raise ValueError(f"La respuesta de OpenAI para los días {inicio}-{fin} está incompleta")
+        for offset, dia in enumerate(plan_dias):
+            dia["dia"] = inicio + offset
+        return plan_dias
+    
+    @staticmethod
+    def _number(value: Any) -> float:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
+    
+    @classmethod
+    def _add_day_totals(cls, dia: Dict[str, Any]) -> Dict[str, Any]:
+        """Add up the macros of a day's meals into dia["totales"]"""
+        comidas = [dia.get(comida) for comida in cls.DIET_MEALS]
+        snacks = dia.get("snacks") or []
+        comidas.extend(snacks if isinstance(snacks, list) else [snacks])
+        totales = dict.fromkeys(cls.DIET_TOTAL_FIELDS, 0.0)
+        for comida in comidas:
+            if isinstance(comida, dict):
+                for campo in cls.DIET_TOTAL_FIELDS:
+                    totales[campo] += cls._number(comida.get(campo))
+        dia["totales"] = {
+            "calorias": round(totales["calorias"]),
+            "proteina": round(totales["proteina"], 1),
+            "carbohidratos": round(totales["carbohidratos"], 1),
+            "grasas": round(totales["grasas"], 1),
+        }
+        return dia
+    
+    @classmethod
+    def _add_diet_totals(cls, plan: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Compute totals from the meals instead of trusting the model's arithmetic
+        
+        Each day gets a "totales" dict; the plan-level calorias_totales,
+        proteina_total, carbohidratos_total and grasas_total are daily averages.
+        """
+        plan_dias = [cls._add_day_totals(dia) for dia in plan.get("dias") or [] if isinstance(dia, dict)]
+        n = len(plan_dias) or 1
+        sumas = {
+            campo: sum(cls._number(dia["totales"][campo]) for dia in plan_dias)
+            for campo in cls.DIET_TOTAL_FIELDS
+        }
+        plan["calorias_totales"] = round(sumas["calorias"] / n)
+        plan["proteina_total"] = round(sumas["proteina"] / n, 1)
+        plan["carbohidratos_total"] = round(sumas["carbohidratos"] / n, 1)
+        plan["grasas_total"] = round(sumas["grasas"] / n, 1)
+        return plan
+    
     async def generar_receta(
         self,
         objetivo_calorias: Optional[int] = None,
         ingredientes_deseados: Optional[List[str]] = None,
         tipo_comida: Optional[str] = None,
-        restricciones: Optional[List[str]] = None
+        restricciones: Optional[List[str]] = None,
+        user_id: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         Generate a recipe using OpenAI
@@ -96,9 +505,14 @@ class OpenAIService:
             ingredientes_deseados: List of desired ingredients
             tipo_comida: Type of meal (e.g., "desayuno", "almuerzo", "cena", "snack")
             restricciones: List of dietary restrictions
+            user_id: User the OpenAI call is scheduled for (fair queueing)
         
         Returns:
             Dictionary with recipe including name, ingredients, instructions, and nutritional info
+        
+        Raises:
+            SchedulerRejectedError: If the user has too many generations in flight
+                or no OpenAI slot frees up in time
         """
         # Build the prompt
         prompt = self._build_recipe_prompt(
@@ -108,26 +522,29 @@ class OpenAIService:
             restricciones
         )
         
+        with self.scheduler.admit(user_id):
+            return await self._generate_cached(
+                "receta",
+                self.RECIPE_PROMPT_VERSION,
+                {
+                    "objetivo_calorias": objetivo_calorias,
+                    "ingredientes_deseados": ingredientes_deseados,
+                    "tipo_comida": tipo_comida,
+                    "restricciones": restricciones
+                },
+                lambda: self._request_recipe(prompt, self._recipe_max_tokens(ingredientes_deseados))
+            )
+    
+    async def _request_recipe(self, prompt: str, max_tokens: int) -> Dict[str, Any]:
+        """Call OpenAI for a recipe and parse the JSON answer"""
         try:
             # Call OpenAI API
-            response = await self.client.chat.completions.create(
-                model=self.DEFAULT_MODEL,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Eres un chef experto que crea recetas saludables y deliciosas. Responde siempre en formato JSON válido."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=self.DEFAULT_TEMPERATURE,
-                max_tokens=self.RECIPE_MAX_TOKENS
+            content = await self._complete_json(
+                self.RECIPE_SYSTEM_PROMPT,
+                prompt,
+                max_tokens,
+                lambda partial: self.RECIPE_CONTINUATION_TOKENS
             )
-            
-            # Parse the response
-            content = response.choices[0].message.content
             logger.info(f"OpenAI response received for recipe generation")
             
             # Parse JSON from response
@@ -141,6 +558,290 @@ class OpenAIService:
             logger.error(f"Error generating recipe with OpenAI: {e}")
             raise
     
+    async def _generate_cached(
+        self,
+        tipo: str,
+        version_prompt: str,
+        parametros: Dict[str, Any],
+        generate: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        Return a cached generation for these parameters or produce (and store) a new one
+        
+        Args:
+            tipo: Kind of generation ("dieta", "receta")
+            version_prompt: Version of the prompt template used by generate
+            parametros: Request parameters that determine the output
+            generate: Coroutine factory that calls OpenAI
+        """
+        if self.cache is None:
+            return await generate()
+        
+        clave = self.cache.make_key(tipo, parametros, self.model, version_prompt)
+        cached = await self.cache.get(clave)
+        if cached is not None:
+            logger.info(f"Serving cached {tipo} generation")
+            return cached
+        
+        async def generate_and_store() -> Dict[str, Any]:
+            result = await generate()
+            await self.cache.set(clave, tipo, self.model, version_prompt, result)
+            return result
+        
+        return await self._inflight.do(clave, generate_and_store)
+    
+    async def generar_dieta_stream(
+        self,
+        objetivo_calorias: int,
+        preferencias: Optional[List[str]] = None,
+        restricciones: Optional[List[str]] = None,
+        dias: int = 7,
+        user_id: Optional[int] = None
+    ) -> AsyncIterator[ParseEvent]:
+        """
+        Generate a diet plan with a streamed completion
+        
+        Same arguments as generar_dieta. Yields an "item" event for each day in
+        "dias" as soon as it is finished, a "field" event for every other
+        top-level member (totals come last), and finally a "done" event with the
+        full plan. Long plans stream each chunk's days once the chunk completes.
+        """
+        parametros = {
+            "objetivo_calorias": objetivo_calorias,
+            "preferencias": preferencias,
+            "restricciones": restricciones,
+            "dias": dias
+        }
+        if dias <= self.diet_chunk_days:
+            prompt = self._build_diet_prompt(objetivo_calorias, preferencias, restricciones, dias)
+            events = self._stream_cached(
+                "dieta",
+                self.DIET_PROMPT_VERSION,
+                parametros,
+                self.DIET_SYSTEM_PROMPT,
+                prompt,
+                self._diet_max_tokens(dias),
+                lambda partial: self._diet_remaining_tokens(partial, dias),
+                stream_arrays=("dias",),
+                finalize=self._add_diet_totals
+            )
+        else:
+            events = self._stream_chunked_diet(parametros)
+        with self.scheduler.admit(user_id):
+            async for event in events:
+                if event.kind == "item" and isinstance(event.value, dict):
+                    self._add_day_totals(event.value)
+                yield event
+    
+    async def _stream_chunked_diet(self, parametros: Dict[str, Any]) -> AsyncIterator[ParseEvent]:
+        """Stream a long plan: skeleton fields first, then each chunk's days in order"""
+        clave = None
+        if self.cache is not None:
+            clave = self.cache.make_key("dieta", parametros, self.model, self.DIET_PROMPT_VERSION)
+            cached = await self.cache.get(clave)
+            if cached is not None:
+                async for event in self._replay_cached("dieta", cached, ("dias",)):
+                    yield event
+                return
+        
+        skeleton, chunks = await self._start_diet_chunks(
+            parametros["objetivo_calorias"],
+            parametros["preferencias"],
+            parametros["restricciones"],
+            parametros["dias"]
+        )
+        plan: Dict[str, Any] = {"nombre": skeleton["nombre"], "descripcion": skeleton["descripcion"], "dias": []}
+        try:
+            yield ParseEvent("field", "nombre", None, plan["nombre"])
+            yield ParseEvent("field", "descripcion", None, plan["descripcion"])
+            for _, task in chunks:
+                for dia in await task:
+                    yield ParseEvent("item", "dias", len(plan["dias"]), dia)
+                    plan["dias"].append(dia)
+        finally:
+            self._cancel_pending(chunks)
+        
+        plan = self._add_diet_totals(plan)
+        for campo in ("calorias_totales", "proteina_total", "carbohidratos_total", "grasas_total"):
+            yield ParseEvent("field", campo, None, plan[campo])
+        if clave is not None:
+            await self.cache.set(clave, "dieta", self.model, self.DIET_PROMPT_VERSION, plan)
+        yield ParseEvent("done", "dieta", None, plan)
+    
+    async def generar_receta_stream(
+        self,
+        objetivo_calorias: Optional[int] = None,
+        ingredientes_deseados: Optional[List[str]] = None,
+        tipo_comida: Optional[str] = None,
+        restricciones: Optional[List[str]] = None,
+        user_id: Optional[int] = None
+    ) -> AsyncIterator[ParseEvent]:
+        """
+        Generate a recipe with a streamed completion
+        
+        Same arguments as generar_receta. Yields an "item" event for each
+        ingredient, a "field" event for every other top-level member, and
+        finally a "done" event with the full recipe.
+        """
+        prompt = self._build_recipe_prompt(
+            objetivo_calorias,
+            ingredientes_deseados,
+            tipo_comida,
+            restricciones
+        )
+        events = self._stream_cached(
+            "receta",
+            self.RECIPE_PROMPT_VERSION,
+            {
+                "objetivo_calorias": objetivo_calorias,
+                "ingredientes_deseados": ingredientes_deseados,
+                "tipo_comida": tipo_comida,
+                "restricciones": restricciones
+            },
+            self.RECIPE_SYSTEM_PROMPT,
+            prompt,
+            self._recipe_max_tokens(ingredientes_deseados),
+            lambda partial: self.RECIPE_CONTINUATION_TOKENS,
+            stream_arrays=("ingredientes",)
+        )
+        with self.scheduler.admit(user_id):
+            async for event in events:
+                yield event
+    
+    async def _stream_cached(
+        self,
+        tipo: str,
+        version_prompt: str,
+        parametros: Dict[str, Any],
+        system_prompt: str,
+        prompt: str,
+        max_tokens: int,
+        remaining_tokens: Callable[[str], int],
+        stream_arrays: Tuple[str, ...],
+        finalize: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+    ) -> AsyncIterator[ParseEvent]:
+        """
+        Stream a JSON completion as parse events, replaying cached output when available
+        
+        A stream that ends with finish_reason "length" is followed by a
+        continuation stream fed into the same parser, as in _complete_json.
+        
+        Args:
+            remaining_tokens: Budget for the rest of a truncated answer, given the text so far
+            finalize: Optional post-processing of the parsed result; members it adds
+                are emitted as "field" events before "done"
+        
+        Raises:
+            ValueError: If the streamed answer is not valid JSON or stays truncated
+        """
+        clave = None
+        if self.cache is not None:
+            clave = self.cache.make_key(tipo, parametros, self.model, version_prompt)
+            cached = await self.cache.get(clave)
+            if cached is not None:
+                async for event in self._replay_cached(tipo, cached, stream_arrays):
+                    yield event
+                return
+        
+        emitted = set()
+        parser = IncrementalJSONParser(stream_arrays=stream_arrays)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+        budget = max_tokens
+        # The slot is held until the whole answer (and any continuation) has been streamed
+        async with self.scheduler.slot(max_tokens):
+            try:
+                for continuation in range(self.MAX_CONTINUATIONS + 1):
+                    finish_reason = None
+                    # The start of a continuation is held back until repeated text can be dropped
+                    head = "" if continuation else None
+                    stream: AsyncGenerator[StreamDelta, None] = await self._create_completion(messages, budget, stream=True)
+                    try:
+                        async for piece in stream:
+                            finish_reason = piece.finish_reason or finish_reason
+                            delta = piece.content
+                            if not delta:
+                                continue
+                            if head is not None:
+                                head += delta
+                                if len(head) < self.CONTINUATION_OVERLAP_PROBE:
+                                    continue
+                                delta, head = self._strip_overlap(parser.text, head), None
+                            for event in parser.feed(delta):
+                                emitted.add(event.key)
+                                yield event
+                        if head:
+                            for event in parser.feed(self._strip_overlap(parser.text, head)):
+                                emitted.add(event.key)
+                                yield event
+                    finally:
+                        # Release the connection if the client went away mid-stream
+                        await stream.aclose()
+                    
+                    if finish_reason != "length" or parser.complete:
+                        if continuation:
+                            self._stats["recovered"] += 1
+                        break
+                    if not continuation:
+                        self._stats["truncated"] += 1
+                    if continuation == self.MAX_CONTINUATIONS:
+                        logger.error(f"OpenAI answer still truncated after {self.MAX_CONTINUATIONS} continuations")
+                        raise ValueError("La respuesta de OpenAI quedó incompleta por su longitud")
+                    budget = remaining_tokens(parser.text)
+                    self._note_continuation(continuation + 1, len(parser.text), budget)
+                    messages = self._continuation_messages(messages, parser.text)
+                
+                logger.info(f"OpenAI stream finished for {tipo} generation")
+                result = parser.document()
+                
+            except json.JSONDecodeError as e:
+                logger.error(f"Failed to parse streamed OpenAI response as JSON: {e}")
+                raise ValueError("La respuesta de OpenAI no es un JSON válido")
+            except Exception as e:
+                logger.error(f"Error streaming {tipo} from OpenAI: {e}")
+                raise
+        
+        if finalize is not None:
+            result = finalize(result)
+            for key, value in result.items():
+                if key not in emitted:
+                    yield ParseEvent("field", key, None, value)
+        if clave is not None:
+            await self.cache.set(clave, tipo, self.model, version_prompt, result)
+        yield ParseEvent("done", tipo, None, result)
+    
+    async def _replay_cached(
+        self,
+        tipo: str,
+        cached: Dict[str, Any],
+        stream_arrays: Tuple[str, ...]
+    ) -> AsyncIterator[ParseEvent]:
+        """Emit a cached generation as the same events a live stream would produce"""
+        logger.info(f"Serving cached {tipo} generation (stream)")
+        for key, value in cached.items():
+            if key in stream_arrays and isinstance(value, list):
+                for index, item in enumerate(value):
+                    yield ParseEvent("item", key, index, item)
+            else:
+                yield ParseEvent("field", key, None, value)
+        yield ParseEvent("done", tipo, None, cached)
+    
+    async def close(self):
+        """Close the provider's connections (called on application shutdown)"""
+        await self.provider.close()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Return provider, generation cache, coalescing, scheduler and truncation counters"""
+        return {
+            "provider": self.provider.get_stats(),
+            "truncation": dict(self._stats),
+            "cache": self.cache.get_stats() if self.cache is not None else None,
+            "coalescing": self._inflight.get_stats(),
+            "scheduler": self.scheduler.get_stats(),
+        }
+    
     def _build_diet_prompt(
         self,
         objetivo_calorias: int,
@@ -153,11 +854,7 @@ class OpenAIService:
 
 """
         
-        if preferencias:
-            prompt += f"Preferencias alimenticias: {', '.join(preferencias)}\n"
-        
-        if restricciones:
-            prompt += f"Restricciones dietéticas: {', '.join(restricciones)}\n"
+        prompt += self._build_diet_constraints(preferencias, restricciones)
         
         prompt += """
 Responde ÚNICAMENTE con un JSON válido (sin markdown ni texto adicional) con la siguiente estructura:
@@ -165,24 +862,85 @@ Responde ÚNICAMENTE con un JSON válido (sin markdown ni texto adicional) con l
   "nombre": "Nombre descriptivo del plan",
   "descripcion": "Breve descripción del plan de dieta",
   "dias": [
-    {
-      "dia": 1,
-      "desayuno": {"nombre": "...", "calorias": 0, "ingredientes": ["..."]},
-      "almuerzo": {"nombre": "...", "calorias": 0, "ingredientes": ["..."]},
-      "cena": {"nombre": "...", "calorias": 0, "ingredientes": ["..."]},
-      "snacks": [{"nombre": "...", "calorias": 0}]
-    }
-  ],
-  "calorias_totales": 0,
-  "proteina_total": 0.0,
-  "carbohidratos_total": 0.0,
-  "grasas_total": 0.0
+""" + self.DIET_DAY_SCHEMA + """
+  ]
 }
 
 Asegúrate de que las calorías diarias sumen aproximadamente el objetivo. Incluye valores nutricionales realistas."""
         
         return prompt
     
+    def _build_diet_skeleton_prompt(
+        self,
+        objetivo_calorias: int,
+        preferencias: Optional[List[str]],
+        restricciones: Optional[List[str]],
+        dias: int
+    ) -> str:
+        """Build a prompt for the outline shared by all chunks of a long plan"""
+        prompt = f"""Diseña el esquema de un plan de dieta de {dias} días con un objetivo de {objetivo_calorias} calorías por día.
+
+"""
+        
+        prompt += self._build_diet_constraints(preferencias, restricciones)
+        
+        prompt += f"""
+Responde ÚNICAMENTE con un JSON válido (sin markdown ni texto adicional) con la siguiente estructura:
+{{
+  "nombre": "Nombre descriptivo del plan",
+  "descripcion": "Breve descripción del plan de dieta",
+  "temas": ["Tema del día 1 (proteína principal y estilo de cocina)", "..."]
+}}
+
+La lista "temas" debe tener exactamente {dias} elementos, variados y sin repetir el mismo tema en días consecutivos."""
+        
+        return prompt
+    
+    def _build_diet_chunk_prompt(
+        self,
+        objetivo_calorias: int,
+        preferencias: Optional[List[str]],
+        restricciones: Optional[List[str]],
+        dias: int,
+        skeleton: Dict[str, Any],
+        inicio: int,
+        fin: int
+    ) -> str:
+        """Build a prompt for days inicio..fin of a long plan, following the shared skeleton"""
+        prompt = f"""Crea los días {inicio} a {fin} de un plan de dieta de {dias} días con un objetivo de {objetivo_calorias} calorías por día.
+
+Plan: {skeleton["nombre"]} - {skeleton["descripcion"]}
+Tema asignado a cada día (síguelo para que el plan completo sea variado):
+"""
+        for dia in range(inicio, fin + 1):
+            prompt += f"- Día {dia}: {skeleton['temas'][dia - 1]}\n"
+        prompt += "\n"
+        
+        prompt += self._build_diet_constraints(preferencias, restricciones)
+        
+        prompt += """
+Responde ÚNICAMENTE con un JSON válido (sin markdown ni texto adicional) con la siguiente estructura:
+{
+  "dias": [
+""" + self.DIET_DAY_SCHEMA + """
+  ]
+}
+
+"""
+        prompt += f"""Incluye exactamente {fin - inicio + 1} días, numerados del {inicio} al {fin}. Asegúrate de que las calorías diarias sumen aproximadamente el objetivo. Incluye valores nutricionales realistas."""
+        
+        return prompt
+    
+    @staticmethod
+    def _build_diet_constraints(preferencias: Optional[List[str]], restricciones: Optional[List[str]]) -> str:
+        """Preference and restriction lines shared by the diet prompts"""
+        lines = ""
+        if preferencias:
+            lines += f"Preferencias alimenticias: {', '.join(preferencias)}\n"
+        if restricciones:
+            lines += f"Restricciones dietéticas: {', '.join(restricciones)}\n"
+        return lines
+    
     def _build_recipe_prompt(
         self,
         objetivo_calorias: Optional[int],
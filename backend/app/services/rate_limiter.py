@@ -0,0 +1,154 @@
+"""
+Client-side rate limiting for upstream API quotas
+Token bucket with a priority wait queue and an optional daily call quota
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+# Lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_ENRICHMENT = 5
+PRIORITY_BACKGROUND = 10
+
+
+class QuotaExceededError(Exception):
+    """Raised when the daily upstream call quota has been used up"""
+    pass
+
+
+class RateLimiter:
+    """
+    Token bucket limiter whose waiters are released in priority order
+
+    Callers that find a free token and an empty queue proceed immediately;
+    everyone else waits in a heap ordered by (priority, arrival). Limits apply
+    per process, so divide the plan's quota by the number of workers.
+    """
+
+    def __init__(self, rate_per_second: float, burst: int = 1, daily_limit: int = 0):
+        """
+        Args:
+            rate_per_second: Sustained calls per second (0 disables the bucket)
+            burst: Bucket capacity (calls allowed back to back)
+            daily_limit: Calls allowed per UTC day (0 means unlimited)
+        """
+        self.rate = rate_per_second
+        self.capacity = max(burst, 1)
+        self.daily_limit = daily_limit
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._day = self._today()
+        self._day_count = 0
+        self._stats: Dict[str, Any] = {
+            "acquired": 0,
+            "queued": 0,
+            "quota_rejections": 0,
+            "upstream_throttles": 0,
+            "max_wait_ms": 0.0,
+        }
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+    def _check_daily_quota(self):
+        """Reset the counter at UTC midnight and reject once the quota is used"""
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            self._day_count = 0
+        if self.daily_limit and self._day_count >= self.daily_limit:
+            self._stats["quota_rejections"] += 1
+            raise QuotaExceededError("Se alcanzó la cuota diaria de llamadas a la API externa")
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def _try_take(self) -> bool:
+        """Consume a token if one is available and upstream is not asking us to back off"""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return False
+        if self.rate > 0:
+            self._refill(now)
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+        self._day_count += 1
+        self._stats["acquired"] += 1
+        return True
+
+    def _delay_until_token(self) -> float:
+        now = time.monotonic()
+        pause = self._paused_until - now
+        refill = (1 - self._tokens) / self.rate if self.rate > 0 and self._tokens < 1 else 0
+        return max(pause, refill, 0.001)
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        """
+        Wait for permission to make one upstream call
+
+        Args:
+            priority: Lower values go first (see PRIORITY_* constants)
+
+        Raises:
+            QuotaExceededError: If the daily quota is exhausted
+        """
+        self._check_daily_quota()
+        if not self._waiters and self._try_take():
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._stats["queued"] += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        started = time.monotonic()
+        await future
+        waited_ms = (time.monotonic() - started) * 1000
+        self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], round(waited_ms, 1))
+
+    async def _dispatch(self):
+        """Release queued waiters one token at a time, highest priority first"""
+        while self._waiters:
+            _, _, future = self._waiters[0]
+            if future.done():
+                # Caller was cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+            try:
+                self._check_daily_quota()
+            except QuotaExceededError as e:
+                heapq.heappop(self._waiters)
+                future.set_exception(e)
+                continue
+            if self._try_take():
+                heapq.heappop(self._waiters)
+                future.set_result(None)
+                continue
+            await asyncio.sleep(self._delay_until_token())
+
+    def pause_for(self, seconds: float):
+        """Stop releasing calls for a while (e.g. after a 429 with Retry-After)"""
+        self._stats["upstream_throttles"] += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + max(seconds, 0))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return limiter counters"""
+        stats = dict(self._stats)
+        stats["queue_depth"] = sum(1 for _, _, future in self._waiters if not future.done())
+        stats["daily_used"] = self._day_count
+        stats["daily_limit"] = self.daily_limit
+        return stats
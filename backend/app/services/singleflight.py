@@ -0,0 +1,80 @@
+"""
+Request coalescing ("singleflight") for identical concurrent async calls
+"""
+
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict
+
+
+def canonical_key(params: Dict[str, Any]) -> str:
+    """Build a stable key for a params dict (order-independent)"""
+    return json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class _Call:
+    """An in-flight call shared by one or more waiters"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one execution
+
+    The shared work runs in its own task, so cancelling one waiter does not
+    affect the others. The task is only cancelled when every waiter has gone.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._stats: Dict[str, int] = {
+            "executions": 0,
+            "collapsed": 0,
+            "cancelled": 0,
+        }
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run fn() unless an identical call is already in flight, then share its result
+
+        Args:
+            key: Identity of the call (see canonical_key)
+            fn: Coroutine factory that performs the work
+
+        Returns:
+            The result of the shared call (exceptions are propagated to every waiter)
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self._stats["executions"] += 1
+        else:
+            self._stats["collapsed"] += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if not call.task.done() and call.waiters == 1:
+                # Last interested caller went away: stop the upstream work too
+                call.task.cancel()
+                self._stats["cancelled"] += 1
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: str, call: _Call):
+        """Remove a finished call so later requests start a fresh one"""
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return coalescing counters"""
+        stats = dict(self._stats)
+        stats["in_flight"] = len(self._calls)
+        return stats
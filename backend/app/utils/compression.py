@@ -0,0 +1,53 @@
+"""
+Compressed JSON storage helpers
+"""
+
+import gzip
+import json
+import zlib
+from typing import Any, Iterator
+
+# zlib window bits for the gzip container (header + CRC), so stored blobs can be
+# sent as-is with Content-Encoding: gzip
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def compress_json(data: Any, level: int = 6) -> bytes:
+    """
+    Serialize a JSON value and gzip it
+
+    Args:
+        data: JSON-serializable value
+        level: gzip compression level (1-9)
+
+    Returns:
+        gzip-compressed UTF-8 JSON
+    """
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return gzip.compress(payload.encode("utf-8"), compresslevel=level, mtime=0)
+
+
+def decompress_json(blob: bytes) -> Any:
+    """Decode a value stored with compress_json"""
+    return json.loads(gzip.decompress(blob))
+
+
+def iter_decompressed(blob: bytes, chunk_size: int = 16384) -> Iterator[bytes]:
+    """
+    Decompress a compress_json blob piece by piece
+
+    Yields the JSON text as bytes without holding the whole decompressed
+    document in memory (e.g. for a StreamingResponse).
+
+    Args:
+        blob: gzip-compressed data
+        chunk_size: Compressed bytes fed to the decompressor per step
+    """
+    decompressor = zlib.decompressobj(_GZIP_WBITS)
+    for inicio in range(0, len(blob), chunk_size):
+        data = decompressor.decompress(blob[inicio:inicio + chunk_size])
+        if data:
+            yield data
+    tail = decompressor.flush()
+    if tail:
+        yield tail
@@ -0,0 +1,185 @@
+"""
+Incremental JSON parsing for streamed model output
+"""
+
+import json
+from typing import Any, Iterable, List, NamedTuple, Optional
+
+
+class ParseEvent(NamedTuple):
+    """
+    Something that became complete while feeding text
+
+    kind is "field" for a finished top-level member (key, value) or "item" for a
+    finished element of one of the streamed arrays (key, index, value).
+    """
+    kind: str
+    key: str
+    index: Optional[int]
+    value: Any
+
+
+class IncrementalJSONParser:
+    """
+    Emit pieces of a top-level JSON object as soon as they are complete
+
+    Text can be fed in arbitrary chunks (e.g. streamed completion deltas). Each
+    top-level member is reported once its value is closed; members listed in
+    stream_arrays are instead reported element by element, so dias[0] is
+    available long before the model has written dias[29]. Anything before the
+    first "{" (such as a markdown fence) is ignored.
+    """
+
+    def __init__(self, stream_arrays: Iterable[str] = ()):
+        """
+        Args:
+            stream_arrays: Top-level keys whose array elements are emitted one by one
+        """
+        self.stream_arrays = set(stream_arrays)
+        self._buf = ""
+        self._pos = 0
+        self._stack: List[str] = []
+        self._root_start: Optional[int] = None
+        self._root_end: Optional[int] = None
+        self._in_string = False
+        self._escape = False
+        self._expecting_key = False
+        self._reading_key = False
+        self._key_start = 0
+        self._key: Optional[str] = None
+        self._awaiting_value = False
+        self._value_start: Optional[int] = None
+        self._in_stream_array = False
+        self._awaiting_item = False
+        self._item_start: Optional[int] = None
+        self._item_index = 0
+
+    @property
+    def text(self) -> str:
+        """All text fed so far"""
+        return self._buf
+
+    @property
+    def complete(self) -> bool:
+        """True once the top-level object has been closed"""
+        return self._root_end is not None
+
+    def feed(self, chunk: str) -> List[ParseEvent]:
+        """
+        Add text and return the events completed by it
+
+        Raises:
+            json.JSONDecodeError: If a completed value is not valid JSON
+        """
+        self._buf += chunk
+        events: List[ParseEvent] = []
+        buf = self._buf
+
+        for i in range(self._pos, len(buf)):
+            if self._root_end is not None:
+                break
+            c = buf[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._reading_key:
+                        self._reading_key = False
+                        self._key = json.loads(buf[self._key_start:i + 1])
+                    elif len(self._stack) == 1 and self._value_start is not None:
+                        events.append(self._finish_field(i + 1))
+                    elif len(self._stack) == 2 and self._item_start is not None:
+                        # String element of a streamed array
+                        events.append(self._finish_item(i + 1))
+                continue
+
+            depth = len(self._stack)
+            if depth == 0:
+                if c == "{":
+                    self._root_start = i
+                    self._stack.append(c)
+                    self._expecting_key = True
+                continue
+
+            if depth == 1 and self._awaiting_value and not c.isspace():
+                self._awaiting_value = False
+                self._value_start = i
+            if depth == 2 and self._awaiting_item and not c.isspace():
+                self._awaiting_item = False
+                if c != "]":
+                    self._item_start = i
+
+            if c == '"':
+                self._in_string = True
+                if depth == 1 and self._expecting_key:
+                    self._expecting_key = False
+                    self._reading_key = True
+                    self._key_start = i
+            elif c in "{[":
+                if depth == 1 and c == "[" and self._key in self.stream_arrays:
+                    self._in_stream_array = True
+                    self._awaiting_item = True
+                    self._item_index = 0
+                self._stack.append(c)
+            elif c in "}]":
+                if depth == 1 and self._value_start is not None:
+                    # Last member was a number / true / false / null
+                    events.append(self._finish_field(i))
+                elif depth == 2 and self._item_start is not None:
+                    # Last element of a streamed array was a number / true / false / null
+                    events.append(self._finish_item(i))
+                self._stack.pop()
+                depth = len(self._stack)
+                if depth == 2 and self._item_start is not None:
+                    events.append(self._finish_item(i + 1))
+                elif depth == 1 and self._value_start is not None:
+                    if self._in_stream_array:
+                        self._in_stream_array = False
+                        self._value_start = None
+                    else:
+                        events.append(self._finish_field(i + 1))
+                elif depth == 0:
+                    self._root_end = i
+            elif c == "," and depth == 1:
+                if self._value_start is not None:
+                    events.append(self._finish_field(i))
+                self._expecting_key = True
+            elif c == "," and depth == 2 and self._in_stream_array:
+                if self._item_start is not None:
+                    events.append(self._finish_item(i))
+                self._awaiting_item = True
+            elif c == ":" and depth == 1:
+                self._awaiting_value = True
+
+        self._pos = len(buf)
+        return events
+
+    def _finish_field(self, end: int) -> ParseEvent:
+        """Decode the top-level value that ends at end (exclusive)"""
+        value = json.loads(self._buf[self._value_start:end])
+        self._value_start = None
+        return ParseEvent("field", self._key, None, value)
+
+    def _finish_item(self, end: int) -> ParseEvent:
+        """Decode the streamed array element that ends at end (exclusive)"""
+        value = json.loads(self._buf[self._item_start:end])
+        self._item_start = None
+        event = ParseEvent("item", self._key, self._item_index, value)
+        self._item_index += 1
+        return event
+
+    def document(self) -> Any:
+        """
+        Decode the whole top-level object
+
+        Raises:
+            json.JSONDecodeError: If the object is incomplete or invalid
+        """
+        if self._root_start is None or self._root_end is None:
+            # Let json report where the text is truncated or malformed
+            return json.loads(self._buf)
+        return json.loads(self._buf[self._root_start:self._root_end + 1])
@@ -0,0 +1,131 @@
+"""
+Keyset (cursor) pagination helpers
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import String, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+from app.db.session import is_sqlite
+
+# Response header with the cursor of the next page (list bodies stay plain JSON arrays)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a cursor was not produced by encode_cursor"""
+    pass
+
+
+def encode_cursor(creado_en: datetime, row_id: int) -> str:
+    """
+    Build the opaque cursor that points just past a row
+
+    Args:
+        creado_en: Creation time of the last row of the page
+        row_id: Primary key of that row (tie-breaker for equal timestamps)
+
+    Returns:
+        URL-safe base64 string
+    """
+    payload = json.dumps([creado_en.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decode a cursor built by encode_cursor
+
+    Raises:
+        InvalidCursorError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        creado_en, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(creado_en), int(row_id)
+    except (ValueError, TypeError, UnicodeError):
+        raise InvalidCursorError("Cursor inválido")
+
+
+async def fetch_page(
+    db: AsyncSession,
+    query: Select,
+    model: Any,
+    cursor: Optional[str],
+    limit: int,
+    skip: int = 0
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Load one page of a query ordered newest first, by (creado_en, id) descending
+
+    With a cursor, the page is read with index range scans on a
+    (user_id, creado_en, id) index whatever its depth: first the rows sharing
+    the cursor's timestamp, then older ones. A single row-value comparison
+    would be simpler, but SQLite only bounds it by its first column and scans
+    every row with that timestamp (bulk inserts share one). Without a cursor,
+    skip is applied as a plain offset.
+
+    Args:
+        db: Database session
+        query: select() of model, or of some of its columns (including creado_en
+            and id), with the caller's filters
+        model: Mapped class with creado_en and id columns
+        cursor: Cursor from a previous page (None for the first page)
+        limit: Page size
+        skip: Offset for the first page (ignored with a cursor)
+
+    Returns:
+        Tuple of (model instances or column rows, cursor of the next page or None)
+
+    Raises:
+        InvalidCursorError: If the cursor is malformed
+    """
+    order = (model.creado_en.desc(), model.id.desc())
+    if not cursor:
+        rows = await _fetch(db, query.order_by(*order).offset(skip).limit(limit + 1))
+        return split_page(rows, limit)
+
+    creado_en, row_id = decode_cursor(cursor)
+    timestamp = _timestamp_param(creado_en)
+    rows = await _fetch(
+        db, query.where(model.creado_en == timestamp, model.id < row_id).order_by(*order).limit(limit + 1)
+    )
+    if len(rows) <= limit:
+        rows += await _fetch(
+            db, query.where(model.creado_en < timestamp).order_by(*order).limit(limit + 1 - len(rows))
+        )
+    return split_page(rows, limit)
+
+
+def split_page(rows: Sequence[Any], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """Drop the extra row fetched by fetch_page and return (rows, next cursor or None)"""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].creado_en, rows[-1].id)
+
+
+async def _fetch(db: AsyncSession, query: Select) -> List[Any]:
+    """Run a page query: instances for an entity select(), Row tuples for column selects"""
+    result = await db.execute(query)
+    if len(query.column_descriptions) == 1:
+        return list(result.scalars())
+    return list(result)
+
+
+def _timestamp_param(value: datetime) -> Any:
+    """Bind a cursor timestamp so it compares equal to the stored value"""
+    if not is_sqlite:
+        return value
+    # SQLite keeps timestamps as text: server_default CURRENT_TIMESTAMP has no
+    # fraction, while SQLAlchemy's own format always has six digits
+    text = value.strftime("%Y-%m-%d %H:%M:%S")
+    if value.microsecond:
+        text += f".{value.microsecond:06d}"
+    return literal(text, String)
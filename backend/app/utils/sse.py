@@ -0,0 +1,27 @@
+"""
+Server-sent events helpers
+"""
+
+import json
+from typing import Any
+
+# Headers that keep proxies (e.g. nginx) from buffering the event stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_sse(event: str, data: Any) -> str:
+    """
+    Serialize one server-sent event
+
+    Args:
+        event: Event name (the client listens for it with addEventListener)
+        data: JSON-serializable payload
+
+    Returns:
+        The event in text/event-stream format
+    """
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
@@ -0,0 +1,26 @@
+"""
+Text helpers shared by search features
+"""
+
+import re
+import unicodedata
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalize a search string for cache keys and index lookups
+
+    Case-folds, strips accents and collapses whitespace, so "Plátano  Maduro"
+    and "platano maduro" produce the same key.
+
+    Args:
+        text: Raw user input
+
+    Returns:
+        Normalized string
+    """
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    without_accents = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _WHITESPACE_RE.sub(" ", without_accents).strip()
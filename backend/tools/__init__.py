@@ -0,0 +1,3 @@
+"""
+Development tools (offline upstream stand-ins and benchmarks)
+"""
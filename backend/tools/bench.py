@@ -0,0 +1,197 @@
+"""
+Load generator for the backend endpoints that depend on upstream APIs
+
+Measures throughput and latency percentiles of /alimentos/buscar,
+/alimentos/autocompletar, /dieta/generar and /recetas/generar. Combine it with
+tools/upstream_stub.py to get reproducible numbers without network access.
+The database-bound scenarios (listar: GET /recetas/, crear: POST /recetas/)
+show how throughput scales with concurrency when --sweep is given.
+
+Usage:
+
+    python -m tools.bench buscar --requests 2000 --concurrency 50
+    python -m tools.bench dieta --requests 100 --concurrency 10 --dias 3
+    python -m tools.bench receta --requests 200 --concurrency 20 --unique --json
+    python -m tools.bench listar --requests 2000 --sweep 1,10,50
+
+Endpoints that require authentication use --token when given, otherwise they
+log in (registering on first use) a benchmark user with --email / --password.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+SCENARIOS = ("buscar", "autocompletar", "dieta", "receta", "listar", "crear")
+
+# Scenarios whose endpoints require a logged-in user
+AUTH_SCENARIOS = ("dieta", "receta", "listar", "crear")
+
+QUERIES = [
+    "pollo", "arroz", "manzana", "salmón", "huevo", "avena", "lentejas", "yogur",
+    "pan integral", "aguacate", "atún", "brócoli", "queso fresco", "plátano",
+    "pavo", "garbanzos", "espinacas", "nueces", "leche", "tomate",
+]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def build_request(scenario: str, i: int, args: argparse.Namespace) -> Tuple[str, str, Dict[str, Any]]:
+    """Return (method, path, httpx kwargs) for the i-th request of a scenario"""
+    query = QUERIES[i % len(QUERIES)]
+    if args.unique:
+        query = f"{query} {i}"
+
+    if scenario == "buscar":
+        return "GET", "/alimentos/buscar", {"params": {"nombre": query}}
+    if scenario == "autocompletar":
+        return "GET", "/alimentos/autocompletar", {"params": {"q": query[:1 + i % 4]}}
+    if scenario == "dieta":
+        calorias = 1800 + (i % 8) * 50 if args.unique else 2000
+        return "POST", "/dieta/generar", {"json": {"objetivo_calorias": calorias, "dias": args.dias}}
+    if scenario == "listar":
+        return "GET", "/recetas/", {"params": {"skip": i % 5 * 10, "limit": 20}}
+    if scenario == "crear":
+        return "POST", "/recetas/", {"json": {
+            "nombre": f"{query} (bench {i})",
+            "ingredientes": {"items": [query]},
+            "calorias": 300 + i % 400,
+            "proteina": 20.0,
+            "carbohidratos": 30.0,
+            "grasas": 10.0,
+        }}
+    return "POST", "/recetas/generar", {
+        "json": {"ingredientes_deseados": [query], "tipo_comida": "almuerzo", "objetivo_calorias": 500}
+    }
+
+
+async def authenticate(client: httpx.AsyncClient, email: str, password: str) -> str:
+    """Log in the benchmark user, registering it on first use"""
+    response = await client.post("/auth/login", json={"email": email, "password": password})
+    if response.status_code == 401:
+        response = await client.post("/auth/register", json={
+            "nombre": "Benchmark",
+            "email": email,
+            "password": password,
+            "password_confirm": password,
+        })
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        if args.scenario in AUTH_SCENARIOS:
+            token = args.token or await authenticate(client, args.email, args.password)
+            client.headers["Authorization"] = f"Bearer {token}"
+
+        latencies: List[float] = []
+        statuses: Counter = Counter()
+        counter = iter(range(args.requests))
+
+        async def worker():
+            for i in counter:
+                method, path, kwargs = build_request(args.scenario, i, args)
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, path, **kwargs)
+                    statuses[str(response.status_code)] += 1
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ok = sum(count for status, count in statuses.items() if status.startswith("2"))
+    return {
+        "scenario": args.scenario,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(args.requests / elapsed, 1) if elapsed else 0.0,
+        "success_rate": round(ok / args.requests, 4) if args.requests else 0.0,
+        "statuses": dict(statuses),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 1),
+            "p90": round(percentile(latencies, 90), 1),
+            "p95": round(percentile(latencies, 95), 1),
+            "p99": round(percentile(latencies, 99), 1),
+            "max": round(latencies[-1], 1) if latencies else 0.0,
+        },
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark backend endpoints backed by upstream APIs")
+    parser.add_argument("scenario", choices=SCENARIOS)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000/api/v1")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--sweep", default="",
+        help="Comma-separated concurrency levels to run one after another (e.g. 1,10,50)"
+    )
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--unique", action="store_true", help="Vary every request so caches and coalescing do not help")
+    parser.add_argument("--dias", type=int, default=7, help="Days per generated diet")
+    parser.add_argument("--token", default="", help="Existing access token (skips login)")
+    parser.add_argument("--email", default="bench@example.com")
+    parser.add_argument("--password", default="benchmark-password")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    if args.sweep:
+        levels = [int(level) for level in args.sweep.split(",") if level.strip()]
+        results = []
+        for level in levels:
+            args.concurrency = level
+            results.append(asyncio.run(run(args)))
+        if args.json:
+            print(json.dumps(results, indent=2))
+            return
+        for result in results:
+            print_result(result)
+        base = results[0]["throughput_rps"] or 1.0
+        print("  scaling     " + "  ".join(
+            f"c={result['concurrency']}: {result['throughput_rps'] / base:.2f}x" for result in results
+        ))
+        return
+
+    result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print_result(result)
+
+
+def print_result(result: Dict[str, Any]):
+    latency = result["latency_ms"]
+    print(f"{result['scenario']}: {result['requests']} requests, concurrency {result['concurrency']}")
+    print(f"  elapsed     {result['elapsed_s']} s ({result['throughput_rps']} req/s)")
+    print(f"  success     {result['success_rate'] * 100:.2f}%  {result['statuses']}")
+    print(
+        f"  latency ms  p50 {latency['p50']}  p90 {latency['p90']}  "
+        f"p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,528 @@
+"""
+Local stand-in for the FatSecret and OpenAI APIs
+
+Lets /alimentos/buscar, /dieta/generar and /recetas/generar be benchmarked on a
+machine with no network and without paying for upstream calls. Responses are
+either synthesized (deterministic for a given request) or replayed from a
+cassette previously recorded against the real services.
+
+Point the backend at it through .env:
+
+    FATSECRET_TOKEN_URL=http://127.0.0.1:9100/fatsecret/connect/token
+    FATSECRET_API_URL=http://127.0.0.1:9100/fatsecret/rest/server.api
+    OPENAI_BASE_URL=http://127.0.0.1:9100/openai/v1
+
+Usage:
+
+    python -m tools.upstream_stub --port 9100 --latency-ms 120 --jitter-ms 40
+    python -m tools.upstream_stub --error-rate 0.02 --throttle-rate 0.01 --seed 7
+    python -m tools.upstream_stub --mode record --cassette tools/cassettes/upstream.jsonl
+    python -m tools.upstream_stub --mode replay --cassette tools/cassettes/upstream.jsonl
+
+Latency and error injection can also be changed at runtime with
+POST /__stub/config, and counters are available at GET /__stub/stats.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.services.llm_provider import synthetic_answer
+from app.services.singleflight import canonical_key
+
+FATSECRET_TOKEN_URL = "https://oauth.fatsecret.com/connect/token"
+FATSECRET_API_URL = "https://platform.fatsecret.com/rest/server.api"
+OPENAI_API_URL = "https://api.openai.com/v1"
+
+MODES = ("synthetic", "record", "replay")
+
+# Request fields that identify an OpenAI completion (stream only changes the framing)
+OPENAI_KEY_FIELDS = ("model", "messages", "temperature", "max_tokens", "response_format")
+
+FOOD_VARIANTS = [
+    "", "a la plancha", "cocido", "al horno", "crudo", "light", "integral",
+    "con sal", "sin piel", "en conserva", "frito", "al vapor",
+]
+
+
+class StubConfig:
+    """Runtime behaviour of the stand-in (mutable through POST /__stub/config)"""
+
+    FIELDS = {
+        "latency_ms": float,
+        "jitter_ms": float,
+        "tail_rate": float,
+        "tail_ms": float,
+        "openai_latency_ms": float,
+        "openai_tokens_per_second": float,
+        "error_rate": float,
+        "throttle_rate": float,
+        "retry_after": int,
+    }
+
+    def __init__(self, **values):
+        self.mode = "synthetic"
+        self.cassette = ""
+        self.strict = False
+        self.seed: Optional[int] = None
+        # FatSecret-like calls: base latency +/- jitter, plus an occasional slow tail
+        self.latency_ms = 80.0
+        self.jitter_ms = 20.0
+        self.tail_rate = 0.0
+        self.tail_ms = 1000.0
+        # OpenAI-like calls: time to first token, then generation speed (0 = instant)
+        self.openai_latency_ms = 600.0
+        self.openai_tokens_per_second = 0.0
+        # Fraction of API calls answered with 500 / 429
+        self.error_rate = 0.0
+        self.throttle_rate = 0.0
+        self.retry_after = 1
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    def update(self, values: Dict[str, Any]):
+        """Apply a partial update, ignoring unknown fields"""
+        for name, cast in self.FIELDS.items():
+            if name in values and values[name] is not None:
+                setattr(self, name, cast(values[name]))
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = {name: getattr(self, name) for name in self.FIELDS}
+        data.update(mode=self.mode, cassette=self.cassette, strict=self.strict, seed=self.seed)
+        return data
+
+
+class Cassette:
+    """Recorded upstream responses stored as JSON lines, one per request key"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry
+
+    @staticmethod
+    def key_for(service: str, request: Dict[str, Any]) -> str:
+        digest = hashlib.sha256(canonical_key(request).encode("utf-8")).hexdigest()
+        return f"{service}:{digest}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get(key)
+
+    def record(self, key: str, service: str, request: Dict[str, Any], status: int, body: Any, elapsed_ms: float):
+        entry = {
+            "key": key,
+            "service": service,
+            "request": request,
+            "status": status,
+            "body": body,
+            "elapsed_ms": round(elapsed_ms, 1),
+        }
+        self._entries[key] = entry
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _stable_int(*parts: Any) -> int:
+    """Deterministic integer derived from the request (same input, same synthetic data)"""
+    digest = hashlib.md5("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return int(digest[:12], 16)
+
+
+# ---------------------------------------------------------------------------
+# Synthetic FatSecret responses
+# ---------------------------------------------------------------------------
+
+def _synthetic_food(food_id: str, name: str) -> Dict[str, Any]:
+    seed = _stable_int(food_id)
+    calories = 40 + seed % 400
+    protein = round((seed >> 4) % 300 / 10, 2)
+    carbs = round((seed >> 8) % 600 / 10, 2)
+    fat = round((seed >> 12) % 250 / 10, 2)
+    return {
+        "food_id": food_id,
+        "food_name": name,
+        "food_type": "Generic",
+        "food_url": f"https://www.fatsecret.com/calories-nutrition/generic/{food_id}",
+        "food_description": (
+            f"Per 100g - Calories: {calories}kcal | Fat: {fat:.2f}g | "
+            f"Carbs: {carbs:.2f}g | Protein: {protein:.2f}g"
+        ),
+        "_macros": (calories, protein, carbs, fat),
+    }
+
+
+def _synthetic_name(food_id: str) -> str:
+    return f"Alimento {food_id}"
+
+
+def synthetic_fatsecret(params: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+    """Build a FatSecret-shaped response for foods.search, food.get and foods.autocomplete"""
+    method = params.get("method")
+
+    if method == "foods.search":
+        expression = (params.get("search_expression") or "").strip()
+        max_results = int(params.get("max_results") or 20)
+        total = 5 + _stable_int(expression) % 40
+        foods = []
+        for i in range(min(max_results, total)):
+            variant = FOOD_VARIANTS[i % len(FOOD_VARIANTS)]
+            name = f"{expression.capitalize()} {variant}".strip() if expression else _synthetic_name(str(i))
+            food_id = str(100000 + _stable_int(expression, i) % 900000)
+            food = _synthetic_food(food_id, name)
+            food.pop("_macros")
+            foods.append(food)
+        return 200, {
+            "foods": {
+                "food": foods,
+                "max_results": str(max_results),
+                "page_number": "0",
+                "total_results": str(total),
+            }
+        }
+
+    if method == "food.get":
+        food_id = str(params.get("food_id") or "")
+        if not food_id.isdigit():
+            return 200, {"error": {"code": 106, "message": f"Invalid ID: food_id '{food_id}'"}}
+        food = _synthetic_food(food_id, _synthetic_name(food_id))
+        calories, protein, carbs, fat = food.pop("_macros")
+        food["servings"] = {
+            "serving": [
+                {
+                    "serving_id": f"{food_id}1",
+                    "serving_description": "100 g",
+                    "metric_serving_amount": "100.000",
+                    "metric_serving_unit": "g",
+                    "calories": str(calories),
+                    "protein": f"{protein:.2f}",
+                    "carbohydrate": f"{carbs:.2f}",
+                    "fat": f"{fat:.2f}",
+                },
+                {
+                    "serving_id": f"{food_id}2",
+                    "serving_description": "1 porción",
+                    "metric_serving_amount": "150.000",
+                    "metric_serving_unit": "g",
+                    "calories": str(round(calories * 1.5)),
+                    "protein": f"{protein * 1.5:.2f}",
+                    "carbohydrate": f"{carbs * 1.5:.2f}",
+                    "fat": f"{fat * 1.5:.2f}",
+                },
+            ]
+        }
+        return 200, {"food": food}
+
+    if method == "foods.autocomplete":
+        expression = (params.get("expression") or "").strip().lower()
+        max_results = min(int(params.get("max_results") or 4), 10)
+        suggestions = [f"{expression} {variant}".strip() for variant in FOOD_VARIANTS[:max_results]]
+        return 200, {"suggestions": {"suggestion": suggestions}}
+
+    return 200, {"error": {"code": 3, "message": f"Unknown method: {method}"}}
+
+
+# ---------------------------------------------------------------------------
+# Synthetic OpenAI responses
+# ---------------------------------------------------------------------------
+
+def synthetic_completion(body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build a chat.completion whose content follows the prompts in OpenAIService
+
+    The content comes from the same deterministic generator as LLM_PROVIDER=local,
+    including continuation of truncated answers and the max_tokens cut-off.
+    """
+    messages = body.get("messages") or []
+    answer = synthetic_answer(messages, body.get("max_tokens"))
+    return {
+        "id": f"chatcmpl-stub-{_stable_int(canonical_key(body)):x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-3.5-turbo"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": answer.content},
+                "finish_reason": answer.finish_reason,
+            }
+        ],
+        "usage": {
+            "prompt_tokens": answer.prompt_tokens,
+            "completion_tokens": answer.completion_tokens,
+            "total_tokens": answer.prompt_tokens + answer.completion_tokens,
+        },
+    }
+
+
+# ---------------------------------------------------------------------------
+# Application
+# ---------------------------------------------------------------------------
+
+def create_app(config: StubConfig) -> FastAPI:
+    """Build the stand-in application for the given configuration"""
+    rng = random.Random(config.seed)
+    cassette = Cassette(config.cassette)
+    stats: Dict[str, int] = {
+        "token_requests": 0,
+        "fatsecret_requests": 0,
+        "openai_requests": 0,
+        "injected_errors": 0,
+        "injected_throttles": 0,
+        "replay_hits": 0,
+        "replay_misses": 0,
+        "recorded": 0,
+    }
+    state: Dict[str, Any] = {}
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if config.mode == "record":
+            state["client"] = httpx.AsyncClient(timeout=120.0)
+        yield
+        if "client" in state:
+            await state["client"].aclose()
+
+    app = FastAPI(title="Upstream stand-in (FatSecret / OpenAI)", lifespan=lifespan)
+
+    async def simulate_latency(base_ms: float):
+        delay = max(base_ms + rng.uniform(-config.jitter_ms, config.jitter_ms), 0.0)
+        if config.tail_rate and rng.random() < config.tail_rate:
+            delay += config.tail_ms
+        if delay:
+            await asyncio.sleep(delay / 1000)
+
+    def injected_failure() -> Optional[JSONResponse]:
+        roll = rng.random()
+        if roll < config.error_rate:
+            stats["injected_errors"] += 1
+            return JSONResponse({"error": {"message": "Injected upstream error"}}, status_code=500)
+        if roll < config.error_rate + config.throttle_rate:
+            stats["injected_throttles"] += 1
+            return JSONResponse(
+                {"error": {"message": "Injected rate limit"}},
+                status_code=429,
+                headers={"Retry-After": str(config.retry_after)}
+            )
+        return None
+
+    def replay_or_synthesize(service: str, request: Dict[str, Any], synthesize) -> Tuple[int, Any]:
+        """Return (status, body) from the cassette, falling back to the synthetic generator"""
+        if config.mode == "replay":
+            entry = cassette.get(Cassette.key_for(service, request))
+            if entry is not None:
+                stats["replay_hits"] += 1
+                return entry["status"], entry["body"]
+            stats["replay_misses"] += 1
+            if config.strict:
+                return 404, {"error": {"message": "No recorded response for this request"}}
+        return synthesize()
+
+    async def forward(
+        service: str,
+        key_request: Dict[str, Any],
+        method: str,
+        url: str,
+        headers: Dict[str, str],
+        **kwargs
+    ) -> Tuple[int, Any]:
+        """Send the request to the real upstream and store the response in the cassette"""
+        started = time.perf_counter()
+        response = await state["client"].request(method, url, headers=headers, **kwargs)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        try:
+            body = response.json()
+        except ValueError:
+            body = {"error": {"message": response.text}}
+        if response.status_code < 500 and response.status_code != 429:
+            cassette.record(
+                Cassette.key_for(service, key_request), service, key_request,
+                response.status_code, body, elapsed_ms
+            )
+            stats["recorded"] += 1
+        return response.status_code, body
+
+    @app.post("/fatsecret/connect/token")
+    async def fatsecret_token(request: Request):
+        stats["token_requests"] += 1
+        if config.mode == "record":
+            # Real tokens are passed through but never written to the cassette
+            response = await state["client"].post(
+                FATSECRET_TOKEN_URL,
+                headers={
+                    "Authorization": request.headers.get("authorization", ""),
+                    "Content-Type": "application/x-www-form-urlencoded",
+                },
+                content=await request.body()
+            )
+            return JSONResponse(response.json(), status_code=response.status_code)
+        return {"access_token": "stub-token", "token_type": "Bearer", "expires_in": 86400, "scope": "basic"}
+
+    @app.api_route("/fatsecret/rest/server.api", methods=["GET", "POST"])
+    async def fatsecret_api(request: Request):
+        stats["fatsecret_requests"] += 1
+        params = dict(request.query_params)
+        if request.method == "POST":
+            params.update(dict(await request.form()))
+        key_request = {k: v for k, v in params.items() if k != "format"}
+
+        if config.mode == "record":
+            status, body = await forward(
+                "fatsecret", key_request, "GET", FATSECRET_API_URL,
+                {"Authorization": request.headers.get("authorization", "")},
+                params=params
+            )
+            return JSONResponse(body, status_code=status)
+
+        await simulate_latency(config.latency_ms)
+        failure = injected_failure()
+        if failure is not None:
+            return failure
+        status, body = replay_or_synthesize(
+            "fatsecret", key_request, lambda: synthetic_fatsecret(params)
+        )
+        return JSONResponse(body, status_code=status)
+
+    @app.post("/openai/v1/chat/completions")
+    async def openai_chat_completions(request: Request):
+        stats["openai_requests"] += 1
+        body = await request.json()
+        stream = bool(body.get("stream"))
+        key_request = {field: body.get(field) for field in OPENAI_KEY_FIELDS}
+
+        if config.mode == "record":
+            upstream_body = {k: v for k, v in body.items() if k not in ("stream", "stream_options")}
+            status, completion = await forward(
+                "openai", key_request, "POST", f"{OPENAI_API_URL}/chat/completions",
+                {"Authorization": request.headers.get("authorization", "")},
+                json=upstream_body
+            )
+            if status != 200 or not stream:
+                return JSONResponse(completion, status_code=status)
+        else:
+            await simulate_latency(config.openai_latency_ms)
+            failure = injected_failure()
+            if failure is not None:
+                return failure
+            status, completion = replay_or_synthesize(
+                "openai", key_request, lambda: (200, synthetic_completion(body))
+            )
+            if status != 200:
+                return JSONResponse(completion, status_code=status)
+
+            if not stream and config.openai_tokens_per_second > 0:
+                tokens = completion.get("usage", {}).get("completion_tokens", 0)
+                await asyncio.sleep(tokens / config.openai_tokens_per_second)
+
+        if not stream:
+            return JSONResponse(completion)
+        return StreamingResponse(_stream_chunks(completion, config), media_type="text/event-stream")
+
+    @app.get("/__stub/stats")
+    async def stub_stats():
+        return {**stats, "cassette_entries": len(cassette), "config": config.as_dict()}
+
+    @app.post("/__stub/config")
+    async def stub_config(request: Request):
+        config.update(await request.json())
+        return config.as_dict()
+
+    @app.post("/__stub/reset")
+    async def stub_reset():
+        for name in stats:
+            stats[name] = 0
+        return stats
+
+    return app
+
+
+async def _stream_chunks(completion: Dict[str, Any], config: StubConfig):
+    """Re-emit a completion as chat.completion.chunk server-sent events"""
+    choice = completion["choices"][0]
+    content = choice["message"]["content"] or ""
+    base = {
+        "id": completion["id"],
+        "object": "chat.completion.chunk",
+        "created": completion["created"],
+        "model": completion["model"],
+    }
+    pieces: List[str] = [content[i:i + 16] for i in range(0, len(content), 16)]
+    delay = 4 / config.openai_tokens_per_second if config.openai_tokens_per_second > 0 else 0
+
+    first = {**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]}
+    yield f"data: {json.dumps(first, ensure_ascii=False)}\n\n"
+    for piece in pieces:
+        if delay:
+            await asyncio.sleep(delay)
+        chunk = {**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+        yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+    last = {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": choice.get("finish_reason", "stop")}]}
+    yield f"data: {json.dumps(last, ensure_ascii=False)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Local stand-in for the FatSecret and OpenAI APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--mode", choices=MODES, default="synthetic")
+    parser.add_argument("--cassette", default="", help="JSON lines file used by record/replay")
+    parser.add_argument("--strict", action="store_true", help="In replay mode, answer 404 on cassette misses")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for latency and error injection")
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="Fraction of calls that get --tail-ms extra")
+    parser.add_argument("--tail-ms", type=float, default=1000.0)
+    parser.add_argument("--openai-latency-ms", type=float, default=600.0)
+    parser.add_argument("--openai-tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    import uvicorn
+
+    args = parse_args(argv)
+    if args.mode != "synthetic" and not args.cassette:
+        raise SystemExit("--cassette is required for record/replay")
+    config = StubConfig(
+        mode=args.mode,
+        cassette=args.cassette,
+        strict=args.strict,
+        seed=args.seed,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        tail_rate=args.tail_rate,
+        tail_ms=args.tail_ms,
+        openai_latency_ms=args.openai_latency_ms,
+        openai_tokens_per_second=args.openai_tokens_per_second,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()